@@ -1,10 +1,20 @@
 import redis
 import aristotle.settings as settings
+from aristotle.lib.datastores import get_datastore,get_read_datastore
 
 APP = {'current_view': {'title':'RDA Core'},
        'description': 'The RDA Core App a Discovery and Access App for searching and browsing bibliographic records.',
        'icon_url':'rdaCore.png',
        'url':'RDAcore/'}
+
+# Seconds a replica may lag before the entity counts are read from the
+# master
+MAX_REPLICA_LAG = 600
+READ_REDIS_SERVER = get_read_datastore('master',MAX_REPLICA_LAG)
+# Facet filters write short-lived result keys so they use the master
+REDIS_SERVER = get_datastore('master')
+# Number of entities in a page of facet filter results
+FILTER_PAGE_SIZE = 20
        
 
 FACETS = [{'body_id':'access-facet',
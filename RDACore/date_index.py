@@ -0,0 +1,159 @@
+"""
+ :mod:`date_index` RDA Core Manifestation date index
+
+ The MARC Batch app adds each Manifestation to a sorted set scored by the
+ Manifestation's normalized publication date, so the Manifestations
+ published in a range of years are a ZRANGEBYSCORE::
+
+   date-index:rdaCore:Manifestation   zset  rdaCore:Manifestation:1 1995.0315
+
+ The score is the year, a detailed date from the 008 adds the month and
+ day as a fraction, i.e. 1995.0315 for March 15, 1995.
+"""
+__author__ = "Jeremy Nelson"
+
+import re
+
+DATE_INDEX_KEY = "date-index:rdaCore:Manifestation"
+
+year_re = re.compile(r"(\d{4})")
+# Unknown digits are replaced with 0, i.e. 199u is 1990
+partial_year_re = re.compile(r"^\d{2}[\du]{2}$")
+month_day_re = re.compile(r"^(0[1-9]|1[0-2])(0[1-9]|[12]\d|3[01])$")
+# 008/06 types without a usable Date1, B.C. and unknown dates
+NO_DATE1_TYPES = ['b','n','|']
+# 008/06 types with a copyright date in Date2, other types have an end
+# date, month and day, original date, or production date in Date2
+COPYRIGHT_DATE2_TYPES = ['t']
+
+
+def normalize_year(raw_date):
+    """
+    Function returns the year of a 008 date as an int, or None for a
+    blank, unknown, or open date
+
+    :param raw_date: Date1 or Date2 from the 008
+    """
+    if partial_year_re.search(raw_date) is None:
+        return None
+    year = int(raw_date.replace('u','0'))
+    if year < 1 or year == 9999:
+        return None
+    return year
+
+def get_facet_years(marc_record):
+    """
+    Function returns the 008 years of a MARC record for the copyright
+    date facet as strings, Date1 unless the date type has no Date1 and
+    Date2 only when it is a copyright date
+
+    :param marc_record: MARC record
+    """
+    field008 = marc_record['008']
+    if field008 is None or len(field008.value()) < 15:
+        return []
+    date_type = field008.value()[6]
+    years = []
+    if not date_type in NO_DATE1_TYPES:
+        years.append(normalize_year(field008.value()[7:11]))
+    if date_type in COPYRIGHT_DATE2_TYPES:
+        years.append(normalize_year(field008.value()[11:15]))
+    return [str(year) for year in years if year is not None]
+
+def get_field_year(marc_record,tag,indicator2=None):
+    """
+    Function returns the first four digit year in the subfield c of a
+    MARC field, or None
+
+    :param marc_record: MARC record
+    :param tag: 260 or 264
+    :param indicator2: Optional second indicator the field must have
+    """
+    for field in marc_record.get_fields(tag):
+        if indicator2 is not None and field.indicators[1] != indicator2:
+            continue
+        year_search = year_re.search(''.join(field.get_subfields('c')))
+        if year_search is not None:
+            return int(year_search.groups()[0])
+    return None
+
+def get_record_date(marc_record):
+    """
+    Function returns the normalized date of a MARC record for the date
+    index. The 008 Date1 is used first, then the publication date from the
+    264 or 260, and last the 008 Date2.
+
+    :param marc_record: MARC record
+    :rtype float: Normalized date or None
+    """
+    date_type,date1,date2 = None,'',''
+    field008 = marc_record['008']
+    if field008 is not None and len(field008.value()) > 14:
+        date_type = field008.value()[6]
+        date1 = field008.value()[7:11]
+        date2 = field008.value()[11:15]
+    year = normalize_year(date1)
+    if year is not None:
+        # Date2 of a detailed date is the month and day
+        month_day = month_day_re.search(date2)
+        if date_type == 'e' and month_day is not None:
+            month,day = month_day.groups()
+            return year+int(month)/100.0+int(day)/10000.0
+        return float(year)
+    for tag,indicator2 in [('264','1'),('260',None),('264','4')]:
+        year = get_field_year(marc_record,tag,indicator2)
+        if year is not None:
+            return float(year)
+    year = normalize_year(date2)
+    if year is not None:
+        return float(year)
+    return None
+
+def add_date(redis_server,entity_key,record_date):
+    """
+    Function adds or moves a Manifestation in the date index
+
+    :param redis_server: Redis datastore
+    :param entity_key: Manifestation key
+    :param record_date: Normalized date
+    """
+    redis_server.zadd(DATE_INDEX_KEY,record_date,entity_key)
+
+def remove_date(redis_server,entity_key):
+    """
+    Function removes a Manifestation from the date index
+
+    :param redis_server: Redis datastore
+    :param entity_key: Manifestation key
+    """
+    redis_server.zrem(DATE_INDEX_KEY,entity_key)
+
+def get_date_range(redis_server,start,end,offset=0,limit=20):
+    """
+    Function returns a page of the Manifestation keys dated from the start
+    year through the end year, in date order
+
+    :param redis_server: Redis datastore
+    :param start: First year
+    :param end: Last year
+    :param offset: Offset of the page, default is 0
+    :param limit: Page size, default is 20
+    """
+    return redis_server.zrangebyscore(DATE_INDEX_KEY,
+                                      start,
+                                      "({0}".format(end+1),
+                                      start=offset,
+                                      num=limit)
+
+def count_date_range(redis_server,start,end):
+    """
+    Function returns the number of Manifestations dated from the start
+    year through the end year
+
+    :param redis_server: Redis datastore
+    :param start: First year
+    :param end: Last year
+    """
+    return redis_server.zcount(DATE_INDEX_KEY,
+                               start,
+                               "({0}".format(end+1))
@@ -0,0 +1,346 @@
+"""
+ :mod:`entity_storage` RDA Core entity storage layouts
+
+ RDA Core entities are created by the MARC Batch app in an exploded layout,
+ a Redis hash for the entity with separate Redis sets and hashes for each
+ multi-valued element, the entity's identifiers, and the entity's title::
+
+   rdaCore:Manifestation:1             hash
+   rdaCore:Manifestation:1:identifiers hash
+   rdaCore:Manifestation:1:rdaTitle    hash
+   rdaCore:Manifestation:1:rdaExtent   set
+
+ The compact layout packs the entity into the single entity hash, with
+ multi-valued elements saved as a JSON list and the fields of a nested
+ hash saved as `{element}.{field}`. Because the hash has a small number
+ of short fields, Redis keeps it in its memory efficient small hash
+ encoding as long as the hash-max-ziplist-entries and
+ hash-max-ziplist-value thresholds are not exceeded. Titles and notes
+ are often longer than the default 64 bytes, setting
+ `hash-max-ziplist-value 256` in redis.conf keeps most entities small.
+
+ The read helpers in this module return the same Python representation
+ of an entity for either layout, strings for single values, lists for
+ multi-valued elements, and dicts for nested hashes.
+"""
+__author__ = "Jeremy Nelson"
+
+import json
+
+LAYOUT_FIELD = '@layout'
+SETS_FIELD = '@sets'
+COMPACT = 'compact'
+EXPLODED = 'exploded'
+SMALL_HASH_ENCODINGS = ['ziplist','listpack','zipmap']
+
+
+def __is_subkey__(entity_key,value):
+    """
+    Helper function returns True if the hash value is the Redis key of
+    one of the entity's element sets or hashes
+
+    :param entity_key: Redis key of the entity
+    :param value: Value from the entity's hash
+    """
+    return value.startswith("{0}:".format(entity_key))
+
+def __read_subkeys__(redis_server,subkeys):
+    """
+    Helper function reads the values of a list of Redis set or hash keys,
+    using one pipeline for the key types and one for the values.
+
+    :param redis_server: Redis datastore
+    :param subkeys: List of Redis keys
+    :rtype dict: Python list or dict for each key
+    """
+    if len(subkeys) < 1:
+        return {}
+    type_pipeline = redis_server.pipeline(transaction=False)
+    for key in subkeys:
+        type_pipeline.type(key)
+    key_types = type_pipeline.execute()
+    value_pipeline = redis_server.pipeline(transaction=False)
+    read_keys = []
+    for key,key_type in zip(subkeys,key_types):
+        if key_type == 'set':
+            value_pipeline.smembers(key)
+        elif key_type == 'hash':
+            value_pipeline.hgetall(key)
+        else:
+            continue
+        read_keys.append(key)
+    output = {}
+    for key,value in zip(read_keys,value_pipeline.execute()):
+        if type(value) == set:
+            value = sorted(value)
+        output[key] = value
+    return output
+
+def __read_exploded__(redis_server,entity_key,entity_hash):
+    """
+    Helper function reads an entity stored in the exploded layout
+
+    :param redis_server: Redis datastore
+    :param entity_key: Redis key of the entity
+    :param entity_hash: Entity's hash from the datastore
+    :rtype tuple: Entity dict and list of the entity's subkeys
+    """
+    subkeys = [value for value in entity_hash.values()
+               if __is_subkey__(entity_key,value)]
+    subkey_values = __read_subkeys__(redis_server,subkeys)
+    # Nested hashes, like the identifiers hash, can also have sets
+    # for identifiers with more than one value
+    nested_subkeys = []
+    for value in subkey_values.values():
+        if type(value) == dict:
+            nested_subkeys.extend([row for row in value.values()
+                                   if __is_subkey__(entity_key,row)])
+    subkey_values.update(__read_subkeys__(redis_server,nested_subkeys))
+    entity = {}
+    for element,value in entity_hash.iteritems():
+        if subkey_values.has_key(value):
+            value = subkey_values[value]
+            if type(value) == dict:
+                value = dict([(k,subkey_values.get(v,v)) for k,v in value.iteritems()])
+        entity[element] = value
+    return entity,subkeys+nested_subkeys
+
+def decode_compact(compact_hash):
+    """
+    Function decodes an entity's compact hash into an entity dict
+
+    :param compact_hash: Entity hash in the compact layout
+    :rtype dict: Entity dict
+    """
+    multi_valued = compact_hash.get(SETS_FIELD,'').split(',')
+    entity = {}
+    for field,value in compact_hash.iteritems():
+        if field in [LAYOUT_FIELD,SETS_FIELD]:
+            continue
+        if field in multi_valued:
+            value = json.loads(value)
+        if field.find(".") > -1:
+            element,name = field.split(".",1)
+            if not entity.has_key(element):
+                entity[element] = {}
+            entity[element][name] = value
+        else:
+            entity[field] = value
+    return entity
+
+def encode_compact(entity):
+    """
+    Function encodes an entity dict into the fields of a compact hash
+
+    :param entity: Entity dict
+    :rtype dict: Compact hash fields
+    """
+    compact_hash = {LAYOUT_FIELD:COMPACT}
+    multi_valued = []
+    for element,value in entity.iteritems():
+        if type(value) == dict:
+            fields = [("{0}.{1}".format(element,k),v) for k,v in value.iteritems()]
+        else:
+            fields = [(element,value)]
+        for field,field_value in fields:
+            if type(field_value) in [list,set,tuple]:
+                field_value = json.dumps(sorted(field_value))
+                multi_valued.append(field)
+            compact_hash[field] = field_value
+    if len(multi_valued) > 0:
+        compact_hash[SETS_FIELD] = ','.join(multi_valued)
+    return compact_hash
+
+def get_entity(redis_server,entity_key):
+    """
+    Function returns an entity dict for the entity key in either
+    layout
+
+    :param redis_server: Redis datastore
+    :param entity_key: Redis key of the entity
+    :rtype dict: Entity dict, empty if the entity doesn't exist
+    """
+    entity_hash = redis_server.hgetall(entity_key)
+    if entity_hash.get(LAYOUT_FIELD) == COMPACT:
+        return decode_compact(entity_hash)
+    entity,subkeys = __read_exploded__(redis_server,entity_key,entity_hash)
+    return entity
+
+def get_element(redis_server,entity_key,element):
+    """
+    Function returns the value of an entity's element in either layout,
+    a string, a list for multi-valued elements, a dict for nested hashes
+    like identifiers or rdaTitle, or None.
+
+    :param redis_server: Redis datastore
+    :param entity_key: Redis key of the entity
+    :param element: Element name
+    """
+    value,layout,multi_valued = redis_server.hmget(entity_key,
+                                                   [element,
+                                                    LAYOUT_FIELD,
+                                                    SETS_FIELD])
+    if layout == COMPACT:
+        if value is not None:
+            if element in (multi_valued or '').split(','):
+                return json.loads(value)
+            if __is_subkey__(entity_key,value):
+                # Element's set or hash was empty when it was packed
+                return None
+            return value
+        # Element may be a nested hash
+        nested = decode_compact(redis_server.hgetall(entity_key)).get(element)
+        if type(nested) == dict:
+            return nested
+        return None
+    subkey = "{0}:{1}".format(entity_key,element)
+    if value is None:
+        # The identifiers hash is created by the call number app without
+        # always being set in the entity's hash
+        if redis_server.type(subkey) != 'hash':
+            return None
+        value = subkey
+    if not __is_subkey__(entity_key,value):
+        return value
+    entity,subkeys = __read_exploded__(redis_server,
+                                       entity_key,
+                                       {element:value})
+    if entity.get(element) == value:
+        # Element's set or hash is empty or missing
+        return None
+    return entity.get(element)
+
+def get_title_labels(redis_server,entity_keys):
+    """
+    Function returns the title label for a list of Manifestations with one
+    pipeline for entities in either layout
+
+    :param redis_server: Redis datastore
+    :param entity_keys: List of Manifestation keys
+    :rtype list: Title labels, None for missing titles
+    """
+    title_pipeline = redis_server.pipeline(transaction=False)
+    for entity_key in entity_keys:
+        title_pipeline.hget(entity_key,'rdaTitle.label')
+        title_pipeline.hget("{0}:rdaTitle".format(entity_key),'label')
+    results = title_pipeline.execute()
+    labels = []
+    for i in range(0,len(results),2):
+        labels.append(results[i] or results[i+1])
+    return labels
+
+def save_entity(redis_server,entity_key,entity,layout=COMPACT):
+    """
+    Function saves an entity dict in either layout, replacing any
+    existing entity with one atomic pipeline.
+
+    :param redis_server: Redis datastore
+    :param entity_key: Redis key of the entity
+    :param entity: Entity dict
+    :param layout: compact or exploded, defaults to compact
+    """
+    entity_pipeline = redis_server.pipeline()
+    entity_pipeline.delete(entity_key)
+    if layout == COMPACT:
+        entity_pipeline.hmset(entity_key,encode_compact(entity))
+        return entity_pipeline.execute()
+    entity_hash = {}
+    for element,value in entity.iteritems():
+        if type(value) not in [dict,list,set,tuple]:
+            entity_hash[element] = value
+            continue
+        subkey = "{0}:{1}".format(entity_key,element)
+        entity_pipeline.delete(subkey)
+        if type(value) == dict:
+            nested_hash = {}
+            for name,nested_value in value.iteritems():
+                if type(nested_value) in [list,set,tuple]:
+                    nested_key = "{0}:{1}s".format(entity_key,
+                                                   name.replace(" ",""))
+                    entity_pipeline.sadd(nested_key,*nested_value)
+                    nested_value = nested_key
+                nested_hash[name] = nested_value
+            entity_pipeline.hmset(subkey,nested_hash)
+        else:
+            entity_pipeline.sadd(subkey,*value)
+        entity_hash[element] = subkey
+    entity_pipeline.hmset(entity_key,entity_hash)
+    return entity_pipeline.execute()
+
+def pack_entity(redis_server,entity_key):
+    """
+    Function repacks an entity in the exploded layout into the compact
+    layout, deleting the entity's element sets and hashes.
+
+    :param redis_server: Redis datastore
+    :param entity_key: Redis key of the entity
+    """
+    entity_hash = redis_server.hgetall(entity_key)
+    if len(entity_hash) < 1 or entity_hash.get(LAYOUT_FIELD) == COMPACT:
+        return
+    entity,subkeys = __read_exploded__(redis_server,entity_key,entity_hash)
+    # The identifiers hash isn't always referenced from the entity's hash
+    identifiers_key = "{0}:identifiers".format(entity_key)
+    if not entity.has_key('identifiers') and redis_server.type(identifiers_key) == 'hash':
+        entity['identifiers'] = get_element(redis_server,entity_key,'identifiers')
+        subkeys.append(identifiers_key)
+    entity_pipeline = redis_server.pipeline()
+    if len(subkeys) > 0:
+        entity_pipeline.delete(*subkeys)
+    entity_pipeline.delete(entity_key)
+    entity_pipeline.hmset(entity_key,encode_compact(entity))
+    entity_pipeline.execute()
+
+def pack_all(redis_server,entity_name):
+    """
+    Function repacks all of the entities for a rdaCore entity name
+    into the compact layout, for migrating an existing datastore.
+
+    :param redis_server: Redis datastore
+    :param entity_name: Work, Expression, Manifestation, or Item
+    :rtype int: Number of entities checked
+    """
+    last_id = int(redis_server.get("global:rdaCore:{0}".format(entity_name)) or 0)
+    for counter in range(1,last_id+1):
+        pack_entity(redis_server,
+                    "rdaCore:{0}:{1}".format(entity_name,counter))
+    return last_id
+
+def measure_layouts(redis_server,
+                    entities,
+                    key_prefix='rdaCore:LayoutTest'):
+    """
+    Function measures the Redis memory used by a sample of entity dicts
+    in both layouts, extrapolated to a million entities. The sample
+    entities are deleted after each layout is measured.
+
+    :param redis_server: Redis datastore, should not be serving production
+    :param entities: List of entity dicts
+    :param key_prefix: Prefix for the sample's Redis keys
+    :rtype dict: Bytes per million entities and keys per entity for each
+                 layout, and the ratio of compact hashes with a small
+                 hash encoding
+    """
+    output = {'entities':len(entities)}
+    for layout in [EXPLODED,COMPACT]:
+        before_memory = redis_server.info()['used_memory']
+        before_keys = redis_server.dbsize()
+        entity_keys = []
+        for counter,entity in enumerate(entities):
+            entity_key = "{0}:{1}".format(key_prefix,counter)
+            save_entity(redis_server,entity_key,entity,layout)
+            entity_keys.append(entity_key)
+        used_memory = redis_server.info()['used_memory'] - before_memory
+        used_keys = redis_server.dbsize() - before_keys
+        output[layout] = {'bytes_per_million':int(used_memory*(1000000.0/max(len(entities),1))),
+                          'keys_per_entity':used_keys/float(max(len(entities),1))}
+        if layout == COMPACT and len(entity_keys) > 0:
+            small_hashes = 0
+            for entity_key in entity_keys:
+                if redis_server.object('encoding',entity_key) in SMALL_HASH_ENCODINGS:
+                    small_hashes += 1
+            output['small_hash_ratio'] = small_hashes/float(len(entity_keys))
+        sample_keys = redis_server.keys("{0}:*".format(key_prefix))
+        for counter in range(0,len(sample_keys),500):
+            redis_server.delete(*sample_keys[counter:counter+500])
+    return output
@@ -0,0 +1,332 @@
+"""
+ :mod:`facet_index` RDA Core facet index
+
+ The MARC Batch app maintains the facet index while ingesting RDA Core
+ entities. For each faceted element of an entity there is a sorted set of
+ the element's values scored by the number of entities with the value, and
+ a postings set of the entity keys for each value::
+
+   facet:rdaCore:Manifestation:rdaCarrierType               zset
+   facet:rdaCore:Manifestation:rdaCarrierType:online resource set
+   facets-of:rdaCore:Manifestation:1                        set
+
+ The facets-of set holds the element and value pairs indexed for an entity
+ so that the entity can be removed from the index when it is purged or
+ tombstoned.
+
+ Facet filters are answered by intersecting the postings with ZINTERSTORE
+ into a sorted set that expires after FILTER_TTL seconds, the same filters
+ reuse the sorted set and pages are read from it with ZRANGE. ZINTERSTORE
+ doesn't create a key for an empty result, so a cached marker key with the
+ same expiration records that the filter was run. Manifestations
+ can also be filtered by creator, the rdaCreator filter uses the
+ person-works sorted sets of the Creator Search App's creator index.
+"""
+__author__ = "Jeremy Nelson"
+
+import json,hashlib
+from creator_search.redis_helpers import CREATOR_PERSONS_KEY,PERSON_WORKS_KEY
+from creator_search.redis_helpers import normalize_name
+
+FACET_KEY = "facet:rdaCore:{0}:{1}"
+POSTINGS_KEY = "facet:rdaCore:{0}:{1}:{2}"
+ENTITY_FACETS_KEY = "facets-of:{0}"
+FILTER_KEY = "facet-filter:{0}:{1}"
+FILTER_CACHED_KEY = "facet-filter:{0}:{1}:cached"
+# Seconds a filter's results are kept for paging and repeated filters
+FILTER_TTL = 300
+
+# Faceted elements by entity with the label displayed for each element
+FACET_ELEMENTS = {"Work":[("rdaFormOfWork","form of work")],
+                  "Expression":[("rdaContentType","content type"),
+                                ("rdaLanguageOfExpression","language of expression")],
+                  "Manifestation":[("rdaCarrierType","carrier type"),
+                                   ("rdaCopyrightDate","copyright date")],
+                  "Item":[("rdaRestrictionOnUse","restrictions on use")]}
+# Elements with year values that can be filtered by a range of years
+RANGE_FACETS = ['rdaCopyrightDate']
+# Filters Manifestations by a creator's normalized name or Person key
+CREATOR_FILTER = 'rdaCreator'
+
+
+def get_entity_name(entity_key):
+    """
+    Helper function returns the entity name from an entity key, i.e.
+    Manifestation for rdaCore:Manifestation:1
+
+    :param entity_key: RDA Core entity key
+    """
+    return entity_key.split(":")[1]
+
+def get_facet_elements(entity_name):
+    """
+    Function returns the faceted element names of an entity
+
+    :param entity_name: Work, Expression, Manifestation, or Item
+    """
+    return [element for element,label in FACET_ELEMENTS.get(entity_name,[])]
+
+def normalize_value(raw_value):
+    """
+    Function normalizes an element value for the facet index by removing
+    surrounding whitespace and trailing ISBD punctuation, returned as a
+    utf-8 string
+
+    :param raw_value: Element value
+    """
+    if isinstance(raw_value,unicode):
+        raw_value = raw_value.encode('utf8')
+    return raw_value.strip().rstrip(" ./,;:").strip()
+
+def add_facets(redis_server,entity_key,element,values):
+    """
+    Function adds an entity to the postings of each of the element's
+    values, a value's count is only incremented when the entity is new to
+    the value's postings
+
+    :param redis_server: Redis datastore
+    :param entity_key: RDA Core entity key
+    :param element: Faceted element name
+    :param values: List of element values
+    """
+    entity_name = get_entity_name(entity_key)
+    facet_values = []
+    for raw_value in values:
+        value = normalize_value(raw_value)
+        if len(value) > 0 and not value in facet_values:
+            facet_values.append(value)
+    if len(facet_values) < 1:
+        return
+    postings_pipeline = redis_server.pipeline()
+    for value in facet_values:
+        postings_pipeline.sadd(POSTINGS_KEY.format(entity_name,element,value),
+                               entity_key)
+    added = postings_pipeline.execute()
+    facet_pipeline = redis_server.pipeline()
+    for value,is_new in zip(facet_values,added):
+        if not is_new:
+            continue
+        facet_pipeline.zincrby(FACET_KEY.format(entity_name,element),
+                               value,
+                               1)
+        facet_pipeline.sadd(ENTITY_FACETS_KEY.format(entity_key),
+                            json.dumps([element,value]))
+    facet_pipeline.execute()
+
+def remove_facets(redis_server,entity_key):
+    """
+    Function removes an entity from the postings of all of its facet
+    values and decrements the values' counts, values without entities
+    are removed
+
+    :param redis_server: Redis datastore
+    :param entity_key: RDA Core entity key
+    """
+    entity_name = get_entity_name(entity_key)
+    entity_facets_key = ENTITY_FACETS_KEY.format(entity_key)
+    entity_facets = [[part.encode('utf8') for part in json.loads(row)]
+                     for row in redis_server.smembers(entity_facets_key)]
+    if len(entity_facets) < 1:
+        return
+    postings_pipeline = redis_server.pipeline()
+    for element,value in entity_facets:
+        postings_pipeline.srem(POSTINGS_KEY.format(entity_name,element,value),
+                               entity_key)
+    removed = postings_pipeline.execute()
+    facet_pipeline = redis_server.pipeline()
+    for (element,value),is_removed in zip(entity_facets,removed):
+        if not is_removed:
+            continue
+        facet_key = FACET_KEY.format(entity_name,element)
+        facet_pipeline.zincrby(facet_key,value,-1)
+        facet_pipeline.zremrangebyscore(facet_key,'-inf',0)
+    facet_pipeline.delete(entity_facets_key)
+    facet_pipeline.execute()
+
+def get_facet(redis_server,entity_name,element,limit=10):
+    """
+    Function returns the values of a faceted element with the most
+    entities, as a list of dicts with the value and count
+
+    :param redis_server: Redis datastore
+    :param entity_name: Work, Expression, Manifestation, or Item
+    :param element: Faceted element name
+    :param limit: Maximum number of values, default is 10
+    """
+    return [{'value':value.decode('utf8','ignore'),
+             'count':int(count)}
+            for value,count in redis_server.zrevrange(FACET_KEY.format(entity_name,element),
+                                                      0,
+                                                      limit-1,
+                                                      withscores=True)]
+
+def get_facets(redis_server,entity_name,limit=10):
+    """
+    Function returns the facet breakdowns of all of an entity's faceted
+    elements, the element's count is the number of distinct values
+
+    :param redis_server: Redis datastore
+    :param entity_name: Work, Expression, Manifestation, or Item
+    :param limit: Maximum number of values for each element, default is 10
+    """
+    facet_pipeline = redis_server.pipeline(transaction=False)
+    for element,label in FACET_ELEMENTS.get(entity_name,[]):
+        facet_key = FACET_KEY.format(entity_name,element)
+        facet_pipeline.zcard(facet_key)
+        facet_pipeline.zrevrange(facet_key,0,limit-1,withscores=True)
+    results = facet_pipeline.execute()
+    facets = []
+    for i,(element,label) in enumerate(FACET_ELEMENTS.get(entity_name,[])):
+        count,members = results[i*2],results[i*2+1]
+        facets.append({'element':element,
+                       'label':label,
+                       'count':count,
+                       'members':[{'value':value.decode('utf8','ignore'),
+                                   'count':int(score)}
+                                  for value,score in members]})
+    return facets
+
+def get_postings(redis_server,entity_name,element,value):
+    """
+    Function returns the entity keys with a facet value
+
+    :param redis_server: Redis datastore
+    :param entity_name: Work, Expression, Manifestation, or Item
+    :param element: Faceted element name
+    :param value: Facet value
+    """
+    return redis_server.smembers(POSTINGS_KEY.format(entity_name,
+                                                     element,
+                                                     normalize_value(value)))
+
+def parse_filter(raw_filter):
+    """
+    Function parses a filter from a query string, element:value or
+    element:from-to for a range of years, returns an (element,value)
+    tuple where the value is a (from,to) tuple for a range
+
+    :param raw_filter: Filter string, i.e. rdaCarrierType:videodisc
+    """
+    if isinstance(raw_filter,unicode):
+        # Query string values are unicode, keys are utf-8
+        raw_filter = raw_filter.encode('utf8')
+    if raw_filter.find(":") < 0:
+        raise ValueError("Facet filter {0} should be element:value".format(raw_filter))
+    element,value = raw_filter.split(":",1)
+    if element in RANGE_FACETS and value.find("-") > -1:
+        start,end = value.split("-",1)
+        return (element,(int(start),int(end)))
+    return (element,value)
+
+def __creator_postings__(redis_server,values):
+    """
+    Helper function returns the person-works keys of the Persons merged
+    under each creator's normalized name, or of a Person key
+
+    :param redis_server: Redis datastore
+    :param values: List of creator names or Person keys
+    """
+    person_keys = []
+    for value in values:
+        if value.startswith('rdaCore:Person:'):
+            person_keys.append(value)
+        else:
+            person_keys.extend(redis_server.smembers(CREATOR_PERSONS_KEY.format(normalize_name(value))))
+    return [PERSON_WORKS_KEY.format(person_key) for person_key in person_keys]
+
+def __filter_postings__(redis_server,entity_name,element,value):
+    """
+    Helper function returns the postings keys a filter matches with the
+    weight of each key, a range matches all of the years in the range.
+    The person-works sorted sets of a creator filter are scored by date so
+    they are weighted 0, leaving every entity in a filter with one score.
+
+    :param redis_server: Redis datastore
+    :param entity_name: Work, Expression, Manifestation, or Item
+    :param element: Faceted element name
+    :param value: Facet value, a list of values, or a (from,to) tuple
+    """
+    if type(value) == tuple:
+        start,end = value
+        values = [year for year in redis_server.zrange(FACET_KEY.format(entity_name,element),0,-1)
+                  if year.isdigit() and start <= int(year) <= end]
+    elif type(value) == list:
+        values = [normalize_value(row) for row in value]
+    else:
+        values = [normalize_value(value)]
+    if element == CREATOR_FILTER:
+        if entity_name != "Manifestation":
+            raise ValueError("Creator filters only filter Manifestations")
+        return dict([(key,0) for key in __creator_postings__(redis_server,values)])
+    return dict([(POSTINGS_KEY.format(entity_name,element,row),1) for row in values])
+
+def filter_entities(redis_server,
+                    entity_name,
+                    filters,
+                    offset=0,
+                    limit=20,
+                    ttl=FILTER_TTL):
+    """
+    Function returns the total and a page of the entity keys matching all
+    of the filters. A filter's values are combined with ZUNIONSTORE and the
+    filters intersected with ZINTERSTORE into short-lived sorted sets, the
+    results are cached for ttl seconds so paging and repeated filters only
+    read the cached sorted set.
+
+    :param redis_server: Redis datastore, temporary keys are written so a
+                         read replica can't be used
+    :param entity_name: Work, Expression, Manifestation, or Item
+    :param filters: List of (element,value) tuples, the value can be a
+                    list of values or a (from,to) tuple of years
+    :param offset: Offset of the page, default is 0
+    :param limit: Page size, default is 20
+    :param ttl: Seconds to cache the results, default is FILTER_TTL
+    :rtype tuple: Total and list of entity keys
+    """
+    if len(filters) < 1:
+        raise ValueError("filter_entities requires at least one filter")
+    # Filters are checked before any keys are written
+    if not FACET_ELEMENTS.has_key(entity_name):
+        raise ValueError("{0} isn't a faceted entity".format(entity_name))
+    filter_elements = get_facet_elements(entity_name)+RANGE_FACETS+[CREATOR_FILTER]
+    for element,value in filters:
+        if not element in filter_elements:
+            raise ValueError("{0} isn't a facet of {1}".format(element,entity_name))
+    canonical = sorted([(element,list(value) if type(value) in (list,tuple) else value)
+                        for element,value in filters])
+    filter_id = hashlib.sha1(json.dumps([entity_name,canonical])).hexdigest()
+    filter_key = FILTER_KEY.format(entity_name,filter_id)
+    cached_key = FILTER_CACHED_KEY.format(entity_name,filter_id)
+    # Refreshing the expirations is also the cache check
+    cache_pipeline = redis_server.pipeline(transaction=False)
+    cache_pipeline.expire(cached_key,ttl)
+    cache_pipeline.expire(filter_key,ttl)
+    is_cached,has_results = cache_pipeline.execute()
+    if not is_cached:
+        filter_pipeline = redis_server.pipeline()
+        intersect_keys = []
+        for i,(element,value) in enumerate(filters):
+            postings_keys = __filter_postings__(redis_server,
+                                                entity_name,
+                                                element,
+                                                value)
+            union_key = "{0}:{1}".format(filter_key,i)
+            if len(postings_keys) > 0:
+                # Every entity keeps one score so results are sorted
+                # lexically by key, i.e. rdaCore:Manifestation:10 comes
+                # before rdaCore:Manifestation:2
+                filter_pipeline.zunionstore(union_key,postings_keys,aggregate='MAX')
+            else:
+                filter_pipeline.delete(union_key)
+            intersect_keys.append(union_key)
+        filter_pipeline.zinterstore(filter_key,intersect_keys)
+        filter_pipeline.expire(filter_key,ttl)
+        filter_pipeline.set(cached_key,1)
+        filter_pipeline.expire(cached_key,ttl)
+        filter_pipeline.delete(*intersect_keys)
+        filter_pipeline.execute()
+    results_pipeline = redis_server.pipeline(transaction=False)
+    results_pipeline.zcard(filter_key)
+    results_pipeline.zrange(filter_key,offset,offset+limit-1)
+    total,entity_keys = results_pipeline.execute()
+    return total,entity_keys
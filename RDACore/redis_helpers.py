@@ -3,7 +3,9 @@
 """
 import pymarc,redis,re
 import logging,sys
-from app_settings import APP
+from app_settings import APP,READ_REDIS_SERVER,REDIS_SERVER,FILTER_PAGE_SIZE
+from entity_storage import get_title_labels
+import facet_index,subject_index
 try:
     raise ImportError
 ##    import aristotle.settings as settings
@@ -22,17 +24,104 @@ except ImportError:
     volatile_redis = None
     
 
-# RDA Core should reside on primary DB of 0
-redis_server = redis.StrictRedis(host=REDIS_HOST,
-                                 port=REDIS_PORT)    
+# RDA Core should reside on primary DB of 0, the facet counts are read
+# from a replica when one is available
+redis_server = READ_REDIS_SERVER
+filter_server = REDIS_SERVER
 
 
     
 def get_facets(entity_name):
+    """
+    Function returns the number of an entity's instances and the
+    breakdowns of the entity's facets from the facet index
+
+    :param entity_name: Work, Expression, Manifestation, or Item
+    """
     facets = {"label":entity_name,
-              "count":redis_server.get("global:rdaCore:{0}".format(entity_name))}
+              "count":redis_server.get("global:rdaCore:{0}".format(entity_name)),
+              "elements":facet_index.get_facets(redis_server,entity_name)}
     return facets
 
+def filter_facets(entity_name,raw_filters,page=1,page_size=FILTER_PAGE_SIZE):
+    """
+    Function returns a page of the entities matching all of the facet
+    filters with the total number of matching entities
+
+    :param entity_name: Work, Expression, Manifestation, or Item
+    :param raw_filters: List of element:value or element:from-to filters
+    :param page: Page number starting with 1, default is 1
+    :param page_size: Page size, default is FILTER_PAGE_SIZE
+    """
+    filters = [facet_index.parse_filter(row) for row in raw_filters]
+    total,entity_keys = facet_index.filter_entities(filter_server,
+                                                    entity_name,
+                                                    filters,
+                                                    (page-1)*page_size,
+                                                    page_size)
+    results = []
+    for entity_key,title in zip(entity_keys,
+                                get_title_labels(redis_server,entity_keys)):
+        results.append({'key':entity_key,
+                        'title':title})
+    return {'entity':entity_name,
+            'filters':raw_filters,
+            'page':page,
+            'total':total,
+            'results':results}
+
+def get_subject_facets(limit=10):
+    """
+    Function returns the topical and geographic headings with the most
+    Manifestations from the subject index
+
+    :param limit: Maximum number of headings for each type, default is 10
+    """
+    return subject_index.get_subject_facets(redis_server,limit)
+
+def browse_subjects(user_input,before=5,after=5):
+    """
+    Function returns the subject headings around a heading in alphabetical
+    order with their counts
+
+    :param user_input: Heading or the start of a heading
+    :param before: Number of headings before, default is 5
+    :param after: Number of headings after, default is 5
+    """
+    return {'query':user_input,
+            'headings':subject_index.browse_subjects(redis_server,
+                                                     user_input,
+                                                     before,
+                                                     after)}
+
+def subject_titles(subject_type,heading,page=1,page_size=FILTER_PAGE_SIZE):
+    """
+    Function returns a page of the Manifestations with a subject heading
+    and their titles
+
+    :param subject_type: topical or geographic
+    :param heading: Heading
+    :param page: Page number starting with 1, default is 1
+    :param page_size: Page size, default is FILTER_PAGE_SIZE
+    """
+    if not subject_type in [row[0] for row in subject_index.SUBJECT_TYPES]:
+        raise ValueError("Unknown subject type {0}".format(subject_type))
+    total,entity_keys = subject_index.get_subject_postings(redis_server,
+                                                           subject_type,
+                                                           heading,
+                                                           (page-1)*page_size,
+                                                           page_size)
+    results = []
+    for entity_key,title in zip(entity_keys,
+                                get_title_labels(redis_server,entity_keys)):
+        results.append({'key':entity_key,
+                        'title':title})
+    return {'type':subject_type,
+            'heading':heading,
+            'page':page,
+            'total':total,
+            'results':results}
+
     
     
     
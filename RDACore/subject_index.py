@@ -0,0 +1,278 @@
+"""
+ :mod:`subject_index` RDA Core subject heading index
+
+ The MARC Batch app indexes the topical (650 $a) and geographic (651 $a,
+ 650 and 651 $z) headings of each Manifestation. A heading's postings
+ sorted set holds the Manifestation keys with the heading scored by their
+ date, like the Persons' works, so a page of a broad heading is a ZRANGE
+ instead of a sort of the whole postings. The counts sorted set of
+ each subject type scores the headings by their number of Manifestations,
+ and the sort set keeps every heading in alphabetical order for subject
+ browse::
+
+   subject-index:topical                 zset  heading counts
+   subject-index:topical:{normalized}    zset  Manifestation keys by date
+   subject-sort-set                      zset  normalized headings
+   subject-label-hash                    hash  normalized -> heading
+   subjects-of:rdaCore:Manifestation:1   set   indexed headings
+
+ The sort set members all have a score of 0 so ZRANK and ZRANGE are in
+ lexical order, the same as the creator-sort-set of the Creator Search App.
+"""
+__author__ = "Jeremy Nelson"
+
+import json,unicodedata
+from creator_search.redis_helpers import get_sort_rank
+from date_index import DATE_INDEX_KEY,get_record_date
+
+SUBJECT_COUNTS_KEY = "subject-index:{0}"
+SUBJECT_POSTINGS_KEY = "subject-index:{0}:{1}"
+SUBJECT_SORT_KEY = "subject-sort-set"
+SUBJECT_LABEL_HASH = "subject-label-hash"
+ENTITY_SUBJECTS_KEY = "subjects-of:{0}"
+
+# Subfields of each subject type by MARC tag
+SUBJECT_TYPES = [("topical",[('650','a')]),
+                 ("geographic",[('651','a'),('650','z'),('651','z')])]
+
+
+def normalize_subject(raw_heading):
+    """
+    Function returns the display label and the normalized sort form of a
+    heading, the sort form is lower case without diacritics, both without
+    trailing punctuation, as utf-8 strings
+
+    :param raw_heading: Heading, i.e. Indians of North America.
+    """
+    if not isinstance(raw_heading,unicode):
+        raw_heading = raw_heading.decode('utf8','ignore')
+    label = ' '.join(raw_heading.split()).rstrip(' .,;:')
+    normalized = ''.join([char for char in unicodedata.normalize('NFKD',label)
+                          if not unicodedata.combining(char)]).lower()
+    return label.encode('utf8'),normalized.encode('utf8')
+
+def get_subjects(marc_record):
+    """
+    Function returns the subject headings of a MARC record as a list of
+    (subject_type,label,normalized) tuples without duplicates
+
+    :param marc_record: MARC record
+    """
+    subjects,seen = [],[]
+    for subject_type,subfields in SUBJECT_TYPES:
+        for tag,code in subfields:
+            for field in marc_record.get_fields(tag):
+                for raw_heading in field.get_subfields(code):
+                    label,normalized = normalize_subject(raw_heading)
+                    if len(normalized) < 1 or (subject_type,normalized) in seen:
+                        continue
+                    seen.append((subject_type,normalized))
+                    subjects.append((subject_type,label,normalized))
+    return subjects
+
+def add_subjects(redis_server,entity_key,marc_record):
+    """
+    Function adds a Manifestation to the postings of its MARC record's
+    subject headings, a heading's count is only incremented when the
+    Manifestation is new to the heading's postings
+
+    :param redis_server: Redis datastore
+    :param entity_key: Manifestation key
+    :param marc_record: MARC record
+    """
+    subjects = get_subjects(marc_record)
+    if len(subjects) < 1:
+        return
+    score = get_record_date(marc_record) or 0
+    postings_pipeline = redis_server.pipeline()
+    for subject_type,label,normalized in subjects:
+        postings_pipeline.zadd(SUBJECT_POSTINGS_KEY.format(subject_type,normalized),
+                               score,
+                               entity_key)
+    added = postings_pipeline.execute()
+    subject_pipeline = redis_server.pipeline()
+    for (subject_type,label,normalized),is_new in zip(subjects,added):
+        if not is_new:
+            continue
+        subject_pipeline.zincrby(SUBJECT_COUNTS_KEY.format(subject_type),
+                                 normalized,
+                                 1)
+        subject_pipeline.zadd(SUBJECT_SORT_KEY,0,normalized)
+        subject_pipeline.hsetnx(SUBJECT_LABEL_HASH,normalized,label)
+        subject_pipeline.sadd(ENTITY_SUBJECTS_KEY.format(entity_key),
+                              json.dumps([subject_type,normalized]))
+    subject_pipeline.execute()
+
+def remove_subjects(redis_server,entity_key):
+    """
+    Function removes a Manifestation from the postings of its subject
+    headings and decrements the headings' counts, headings without
+    Manifestations are removed from the counts and the sort set
+
+    :param redis_server: Redis datastore
+    :param entity_key: Manifestation key
+    """
+    entity_subjects_key = ENTITY_SUBJECTS_KEY.format(entity_key)
+    entity_subjects = [[part.encode('utf8') for part in json.loads(row)]
+                       for row in redis_server.smembers(entity_subjects_key)]
+    if len(entity_subjects) < 1:
+        return
+    postings_pipeline = redis_server.pipeline()
+    for subject_type,normalized in entity_subjects:
+        postings_pipeline.zrem(SUBJECT_POSTINGS_KEY.format(subject_type,normalized),
+                               entity_key)
+    removed = postings_pipeline.execute()
+    subject_pipeline = redis_server.pipeline()
+    for (subject_type,normalized),is_removed in zip(entity_subjects,removed):
+        if not is_removed:
+            continue
+        counts_key = SUBJECT_COUNTS_KEY.format(subject_type)
+        subject_pipeline.zincrby(counts_key,normalized,-1)
+        subject_pipeline.zremrangebyscore(counts_key,'-inf',0)
+    subject_pipeline.delete(entity_subjects_key)
+    subject_pipeline.execute()
+    # Headings no longer in any subject type leave the browse
+    headings = list(set([normalized for subject_type,normalized in entity_subjects]))
+    count_pipeline = redis_server.pipeline()
+    for normalized in headings:
+        for subject_type,subfields in SUBJECT_TYPES:
+            count_pipeline.zscore(SUBJECT_COUNTS_KEY.format(subject_type),
+                                  normalized)
+    scores = count_pipeline.execute()
+    orphans = []
+    for i,normalized in enumerate(headings):
+        row = scores[i*len(SUBJECT_TYPES):(i+1)*len(SUBJECT_TYPES)]
+        if len([score for score in row if score is not None]) < 1:
+            orphans.append(normalized)
+    if len(orphans) > 0:
+        orphan_pipeline = redis_server.pipeline()
+        orphan_pipeline.zrem(SUBJECT_SORT_KEY,*orphans)
+        orphan_pipeline.hdel(SUBJECT_LABEL_HASH,*orphans)
+        orphan_pipeline.execute()
+
+def get_headings(redis_server,normalized_headings):
+    """
+    Function returns a dict with the label and the count of each subject
+    type for a list of normalized headings, with one pipeline
+
+    :param redis_server: Redis datastore
+    :param normalized_headings: List of normalized headings
+    """
+    heading_pipeline = redis_server.pipeline(transaction=False)
+    for normalized in normalized_headings:
+        heading_pipeline.hget(SUBJECT_LABEL_HASH,normalized)
+        for subject_type,subfields in SUBJECT_TYPES:
+            heading_pipeline.zscore(SUBJECT_COUNTS_KEY.format(subject_type),
+                                    normalized)
+    results = heading_pipeline.execute()
+    size = len(SUBJECT_TYPES)+1
+    headings = []
+    for i,normalized in enumerate(normalized_headings):
+        row = results[i*size:(i+1)*size]
+        heading = {'heading':(row[0] or normalized).decode('utf8','ignore'),
+                   'normalized':normalized.decode('utf8','ignore')}
+        for (subject_type,subfields),score in zip(SUBJECT_TYPES,row[1:]):
+            heading[subject_type] = int(score or 0)
+        headings.append(heading)
+    return headings
+
+def get_subject_facets(redis_server,limit=10):
+    """
+    Function returns the headings of each subject type with the most
+    Manifestations, as a list of dicts of the subject type, the number of
+    headings, and the heading members with their counts
+
+    :param redis_server: Redis datastore
+    :param limit: Maximum number of headings for each type, default is 10
+    """
+    facet_pipeline = redis_server.pipeline(transaction=False)
+    for subject_type,subfields in SUBJECT_TYPES:
+        counts_key = SUBJECT_COUNTS_KEY.format(subject_type)
+        facet_pipeline.zcard(counts_key)
+        facet_pipeline.zrevrange(counts_key,0,limit-1,withscores=True)
+    results = facet_pipeline.execute()
+    label_pipeline = redis_server.pipeline(transaction=False)
+    for i in range(len(SUBJECT_TYPES)):
+        for normalized,count in results[i*2+1]:
+            label_pipeline.hget(SUBJECT_LABEL_HASH,normalized)
+    labels = label_pipeline.execute()
+    facets = []
+    for i,(subject_type,subfields) in enumerate(SUBJECT_TYPES):
+        members = []
+        for normalized,count in results[i*2+1]:
+            label = labels.pop(0) or normalized
+            members.append({'value':label.decode('utf8','ignore'),
+                            'normalized':normalized.decode('utf8','ignore'),
+                            'count':int(count)})
+        facets.append({'type':subject_type,
+                       'count':results[i*2],
+                       'members':members})
+    return facets
+
+def browse_subjects(redis_server,user_input,before=5,after=5):
+    """
+    Function returns the headings before and after a heading in
+    alphabetical order with their counts, for subject browse
+
+    :param redis_server: Redis datastore
+    :param user_input: Heading or the start of a heading
+    :param before: Number of headings before, default is 5
+    :param after: Number of headings after, default is 5
+    """
+    label,normalized = normalize_subject(user_input)
+    rank = redis_server.zrank(SUBJECT_SORT_KEY,normalized)
+    if rank is None:
+        rank = get_sort_rank(redis_server,SUBJECT_SORT_KEY,normalized)
+        after -= 1
+    normalized_headings = redis_server.zrange(SUBJECT_SORT_KEY,
+                                              max(rank-before,0),
+                                              rank+after)
+    return get_headings(redis_server,normalized_headings)
+
+def get_subject_postings(redis_server,subject_type,heading,offset=0,limit=20):
+    """
+    Function returns the number of Manifestations with a heading and a
+    page of their keys in date order
+
+    :param redis_server: Redis datastore
+    :param subject_type: topical or geographic
+    :param heading: Heading or normalized heading
+    :param offset: Offset of the page, default is 0
+    :param limit: Page size, default is 20
+    :rtype tuple: Total and list of Manifestation keys
+    """
+    label,normalized = normalize_subject(heading)
+    postings_key = SUBJECT_POSTINGS_KEY.format(subject_type,normalized)
+    postings_pipeline = redis_server.pipeline(transaction=False)
+    postings_pipeline.zcard(postings_key)
+    postings_pipeline.zrange(postings_key,offset,offset+limit-1)
+    total,entity_keys = postings_pipeline.execute()
+    return total,entity_keys
+
+def migrate_subject_postings(redis_server):
+    """
+    Function converts the postings sets of a datastore indexed before the
+    postings were sorted sets, each Manifestation is scored by its date
+    in the date index or 0
+
+    :param redis_server: Redis datastore
+    :rtype int: Number of postings converted
+    """
+    converted = 0
+    for subject_type,subfields in SUBJECT_TYPES:
+        for normalized in redis_server.zrange(SUBJECT_COUNTS_KEY.format(subject_type),0,-1):
+            postings_key = SUBJECT_POSTINGS_KEY.format(subject_type,normalized)
+            if redis_server.type(postings_key) != 'set':
+                continue
+            entity_keys = list(redis_server.smembers(postings_key))
+            date_pipeline = redis_server.pipeline(transaction=False)
+            for entity_key in entity_keys:
+                date_pipeline.zscore(DATE_INDEX_KEY,entity_key)
+            scores = date_pipeline.execute()
+            postings_pipeline = redis_server.pipeline()
+            postings_pipeline.delete(postings_key)
+            for entity_key,score in zip(entity_keys,scores):
+                postings_pipeline.zadd(postings_key,score or 0,entity_key)
+            postings_pipeline.execute()
+            converted += 1
+    return converted
@@ -6,11 +6,332 @@ when you run "manage.py test".
 import redis
 from django.test import TestCase
 import pymarc
+from aristotle.settings import REDIS_TEST_DB
+from entity_storage import *
+from facet_index import add_facets,get_facets,get_postings,remove_facets
+from facet_index import filter_entities,parse_filter
+from date_index import *
+from subject_index import add_subjects,browse_subjects,get_subject_facets
+from subject_index import get_subject_postings,migrate_subject_postings
+from subject_index import remove_subjects
 
-        
-        
+test_ds = redis.StrictRedis(db=REDIS_TEST_DB)
 
+class EntityStorageTest(TestCase):
 
+    def setUp(self):
+        self.entity = {'legacy-bib-number':'b1234567',
+                       'rdaExtent':['1 online resource','204 p.'],
+                       'identifiers':{'ISBN':'1234-1231',
+                                      'lccn':'PS21 .D5185 1978'},
+                       'rdaTitle':{'rdaTitleProper':'Test Record Title',
+                                   'label':'Test Record Title'}}
+        save_entity(test_ds,
+                    'rdaCore:Manifestation:1',
+                    self.entity,
+                    EXPLODED)
+        save_entity(test_ds,
+                    'rdaCore:Manifestation:2',
+                    self.entity,
+                    COMPACT)
 
-    
-        
+    def test_exploded_layout(self):
+        self.assertEquals(test_ds.hget('rdaCore:Manifestation:1','rdaExtent'),
+                          'rdaCore:Manifestation:1:rdaExtent')
+        self.assertEquals(get_entity(test_ds,'rdaCore:Manifestation:1'),
+                          self.entity)
+
+    def test_compact_layout(self):
+        self.assertEquals(test_ds.keys('rdaCore:Manifestation:2*'),
+                          ['rdaCore:Manifestation:2'])
+        self.assertEquals(get_entity(test_ds,'rdaCore:Manifestation:2'),
+                          self.entity)
+
+    def test_get_element(self):
+        for entity_key in ['rdaCore:Manifestation:1','rdaCore:Manifestation:2']:
+            self.assertEquals(get_element(test_ds,entity_key,'legacy-bib-number'),
+                              'b1234567')
+            self.assertEquals(get_element(test_ds,entity_key,'rdaExtent'),
+                              ['1 online resource','204 p.'])
+            self.assertEquals(get_element(test_ds,entity_key,'identifiers'),
+                              self.entity['identifiers'])
+            self.assertEquals(get_element(test_ds,entity_key,'rdaNote'),
+                              None)
+
+    def test_get_title_labels(self):
+        self.assertEquals(get_title_labels(test_ds,
+                                           ['rdaCore:Manifestation:1',
+                                            'rdaCore:Manifestation:2',
+                                            'rdaCore:Manifestation:3']),
+                          ['Test Record Title','Test Record Title',None])
+
+    def test_pack_entity(self):
+        pack_entity(test_ds,'rdaCore:Manifestation:1')
+        self.assertEquals(test_ds.keys('rdaCore:Manifestation:1*'),
+                          ['rdaCore:Manifestation:1'])
+        self.assertEquals(get_entity(test_ds,'rdaCore:Manifestation:1'),
+                          self.entity)
+
+    def tearDown(self):
+        test_ds.flushdb()
+
+class FacetIndexTest(TestCase):
+
+    def setUp(self):
+        add_facets(test_ds,
+                   'rdaCore:Manifestation:1',
+                   'rdaCarrierType',
+                   ['online resource','videodisc.'])
+        add_facets(test_ds,
+                   'rdaCore:Manifestation:2',
+                   'rdaCarrierType',
+                   ['online resource'])
+
+    def test_add_facets(self):
+        self.assertEquals(get_postings(test_ds,
+                                       'Manifestation',
+                                       'rdaCarrierType',
+                                       'online resource'),
+                          set(['rdaCore:Manifestation:1',
+                               'rdaCore:Manifestation:2']))
+        # Adding the same value again doesn't change the count
+        add_facets(test_ds,
+                   'rdaCore:Manifestation:2',
+                   'rdaCarrierType',
+                   ['online resource'])
+        carrier_type = get_facets(test_ds,'Manifestation')[0]
+        self.assertEquals(carrier_type['count'],2)
+        self.assertEquals(carrier_type['members'],
+                          [{'value':'online resource','count':2},
+                           {'value':'videodisc','count':1}])
+
+    def test_remove_facets(self):
+        remove_facets(test_ds,'rdaCore:Manifestation:1')
+        self.assertEquals(get_facets(test_ds,'Manifestation')[0]['members'],
+                          [{'value':'online resource','count':1}])
+        self.assertEquals(test_ds.keys('facets-of:*'),
+                          ['facets-of:rdaCore:Manifestation:2'])
+
+    def test_filter_entities(self):
+        for i,year in enumerate(['1999','2004','2010']):
+            add_facets(test_ds,
+                       'rdaCore:Manifestation:{0}'.format(i+1),
+                       'rdaCopyrightDate',
+                       [year])
+        filters = [parse_filter('rdaCarrierType:online resource'),
+                   parse_filter('rdaCopyrightDate:2000-2010')]
+        self.assertEquals(filter_entities(test_ds,'Manifestation',filters),
+                          (1,['rdaCore:Manifestation:2']))
+        # The results and the cached marker
+        self.assertEquals(len(test_ds.keys('facet-filter:*')),2)
+        # Cached results are paged without intersecting the postings again
+        add_facets(test_ds,
+                   'rdaCore:Manifestation:3',
+                   'rdaCarrierType',
+                   ['online resource'])
+        self.assertEquals(filter_entities(test_ds,'Manifestation',filters,limit=1),
+                          (1,['rdaCore:Manifestation:2']))
+        self.assertEquals(filter_entities(test_ds,
+                                          'Manifestation',
+                                          [('rdaCarrierType',['videodisc','online resource'])],
+                                          offset=1,
+                                          limit=1),
+                          (3,['rdaCore:Manifestation:2']))
+
+    def test_empty_filter_cached(self):
+        filters = [parse_filter('rdaCarrierType:microfiche')]
+        self.assertEquals(filter_entities(test_ds,'Manifestation',filters),
+                          (0,[]))
+        add_facets(test_ds,
+                   'rdaCore:Manifestation:3',
+                   'rdaCarrierType',
+                   ['microfiche'])
+        self.assertEquals(filter_entities(test_ds,'Manifestation',filters),
+                          (0,[]))
+
+    def test_invalid_filters(self):
+        self.assertRaises(ValueError,
+                          filter_entities,
+                          test_ds,
+                          'Person',
+                          [parse_filter('rdaCarrierType:videodisc')])
+        self.assertRaises(ValueError,
+                          filter_entities,
+                          test_ds,
+                          'Manifestation',
+                          [parse_filter('rdaFormOfWork:novel')])
+        self.assertEquals(test_ds.keys('facet-filter:*'),[])
+
+    def test_non_ascii_filter(self):
+        add_facets(test_ds,
+                   'rdaCore:Expression:1',
+                   'rdaLanguageOfExpression',
+                   [u'Fran\xe7ais'.encode('utf8')])
+        self.assertEquals(filter_entities(test_ds,
+                                          'Expression',
+                                          [parse_filter(u'rdaLanguageOfExpression:Fran\xe7ais')]),
+                          (1,['rdaCore:Expression:1']))
+        remove_facets(test_ds,'rdaCore:Expression:1')
+        self.assertEquals(get_facets(test_ds,'Expression')[1]['members'],[])
+
+    def test_creator_filter(self):
+        test_ds.sadd('creator-persons:twain mark','rdaCore:Person:1')
+        test_ds.zadd('person-works:rdaCore:Person:1',1884,'rdaCore:Manifestation:2')
+        test_ds.zadd('person-works:rdaCore:Person:1',1876,'rdaCore:Manifestation:3')
+        filters = [parse_filter('rdaCreator:Twain, Mark, 1835-1910'),
+                   parse_filter('rdaCarrierType:online resource')]
+        self.assertEquals(filter_entities(test_ds,'Manifestation',filters),
+                          (1,['rdaCore:Manifestation:2']))
+        self.assertRaises(ValueError,
+                          filter_entities,
+                          test_ds,
+                          'Work',
+                          [parse_filter('rdaCreator:rdaCore:Person:1')])
+
+    def tearDown(self):
+        test_ds.flushdb()
+
+class DateIndexTest(TestCase):
+
+    def setUp(self):
+        self.marc_record = pymarc.Record()
+        self.marc_record.add_field(pymarc.Field('008',
+                                                data='100803s199u    nyu           000 0 eng d'))
+        self.marc_record.add_field(pymarc.Field('264',
+                                                indicators=[' ','1'],
+                                                subfields=['c','2011']))
+
+    def test_get_record_date(self):
+        self.assertEquals(get_record_date(self.marc_record),1990.0)
+        self.marc_record['008'].data = '100803e19950315nyu           000 0 eng d'
+        self.assertEquals(round(get_record_date(self.marc_record),4),
+                          1995.0315)
+        self.marc_record['008'].data = '100803nuuuuuuuunyu           000 0 eng d'
+        self.assertEquals(get_record_date(self.marc_record),2011.0)
+
+    def test_get_date_range(self):
+        for i,record_date in enumerate([1989.0,1990.0,1995.0315,1996.0]):
+            add_date(test_ds,
+                     'rdaCore:Manifestation:{0}'.format(i+1),
+                     record_date)
+        self.assertEquals(get_date_range(test_ds,1990,1995),
+                          ['rdaCore:Manifestation:2',
+                           'rdaCore:Manifestation:3'])
+        self.assertEquals(get_date_range(test_ds,1980,2000,offset=1,limit=2),
+                          ['rdaCore:Manifestation:2',
+                           'rdaCore:Manifestation:3'])
+        self.assertEquals(count_date_range(test_ds,1990,1995),2)
+        remove_date(test_ds,'rdaCore:Manifestation:2')
+        self.assertEquals(count_date_range(test_ds,1990,1995),1)
+
+    def test_get_facet_years(self):
+        self.marc_record['008'].data = '100803e19950315nyu           000 0 eng d'
+        self.assertEquals(get_facet_years(self.marc_record),['1995'])
+        self.marc_record['008'].data = '100803c19859999nyu           000 0 eng d'
+        self.assertEquals(get_facet_years(self.marc_record),['1985'])
+        self.marc_record['008'].data = '100803t20102009nyu           000 0 eng d'
+        self.assertEquals(get_facet_years(self.marc_record),['2010','2009'])
+        self.marc_record['008'].data = '100803nuuuuuuuunyu           000 0 eng d'
+        self.assertEquals(get_facet_years(self.marc_record),[])
+
+    def tearDown(self):
+        test_ds.flushdb()
+
+class SubjectIndexTest(TestCase):
+
+    def setUp(self):
+        first_record = pymarc.Record()
+        first_record.add_field(pymarc.Field('650',
+                                            indicators=[' ','0'],
+                                            subfields=['a','Indians of North America',
+                                                       'z','Colorado.']))
+        first_record.add_field(pymarc.Field('651',
+                                            indicators=[' ','0'],
+                                            subfields=['a','Colorado',
+                                                       'x','History.']))
+        second_record = pymarc.Record()
+        second_record.add_field(pymarc.Field('650',
+                                             indicators=[' ','0'],
+                                             subfields=['a','Mountaineering.']))
+        second_record.add_field(pymarc.Field('650',
+                                             indicators=[' ','0'],
+                                             subfields=['a','Indians of North America.']))
+        add_subjects(test_ds,'rdaCore:Manifestation:1',first_record)
+        add_subjects(test_ds,'rdaCore:Manifestation:2',second_record)
+        add_subjects(test_ds,'rdaCore:Manifestation:2',second_record)
+
+    def test_add_subjects(self):
+        topical,geographic = get_subject_facets(test_ds)
+        self.assertEquals(topical['count'],2)
+        self.assertEquals(topical['members'][0],
+                          {'value':u'Indians of North America',
+                           'normalized':u'indians of north america',
+                           'count':2})
+        self.assertEquals(geographic['members'],
+                          [{'value':u'Colorado',
+                            'normalized':u'colorado',
+                            'count':1}])
+        self.assertEquals(get_subject_postings(test_ds,
+                                               'topical',
+                                               'Indians of North America'),
+                          (2,['rdaCore:Manifestation:1',
+                              'rdaCore:Manifestation:2']))
+
+    def test_browse_subjects(self):
+        headings = browse_subjects(test_ds,'Indians',before=1,after=1)
+        self.assertEquals([row['heading'] for row in headings],
+                          [u'Colorado',u'Indians of North America'])
+        self.assertEquals(headings[1]['topical'],2)
+        self.assertEquals(test_ds.zcard('subject-sort-set'),3)
+        self.assertEquals([row['heading'] for row in browse_subjects(test_ds,'Z',before=1)],
+                          [u'Mountaineering'])
+
+    def test_remove_subjects(self):
+        remove_subjects(test_ds,'rdaCore:Manifestation:2')
+        topical,geographic = get_subject_facets(test_ds)
+        self.assertEquals(topical['members'],
+                          [{'value':u'Indians of North America',
+                            'normalized':u'indians of north america',
+                            'count':1}])
+        self.assertEquals(test_ds.zrange('subject-sort-set',0,-1),
+                          ['colorado','indians of north america'])
+
+    def test_remove_non_ascii_subjects(self):
+        marc_record = pymarc.Record()
+        marc_record.add_field(pymarc.Field('650',
+                                           indicators=[' ','0'],
+                                           subfields=['a',u'Bart\u00f3k, B\u00e9la.'.encode('utf8')]))
+        add_subjects(test_ds,'rdaCore:Manifestation:3',marc_record)
+        self.assertEquals(test_ds.zcard('subject-sort-set'),4)
+        remove_subjects(test_ds,'rdaCore:Manifestation:3')
+        self.assertEquals(test_ds.zcard('subject-sort-set'),3)
+
+    def test_postings_date_order(self):
+        marc_record = pymarc.Record()
+        marc_record.add_field(pymarc.Field('008',
+                                           data='850101s1885    xx            000 0 eng d'))
+        marc_record.add_field(pymarc.Field('650',
+                                           indicators=[' ','0'],
+                                           subfields=['a','Mountaineering.']))
+        add_subjects(test_ds,'rdaCore:Manifestation:10',marc_record)
+        self.assertEquals(get_subject_postings(test_ds,
+                                               'topical',
+                                               'Mountaineering',
+                                               offset=1,
+                                               limit=1),
+                          (2,['rdaCore:Manifestation:10']))
+
+    def test_migrate_subject_postings(self):
+        postings_key = 'subject-index:topical:mountaineering'
+        test_ds.delete(postings_key)
+        test_ds.sadd(postings_key,'rdaCore:Manifestation:2')
+        test_ds.sadd(postings_key,'rdaCore:Manifestation:3')
+        test_ds.zadd(DATE_INDEX_KEY,1885.0,'rdaCore:Manifestation:3')
+        self.assertEquals(migrate_subject_postings(test_ds),1)
+        self.assertEquals(test_ds.zrange(postings_key,0,-1,withscores=True),
+                          [('rdaCore:Manifestation:2',0.0),
+                           ('rdaCore:Manifestation:3',1885.0)])
+        self.assertEquals(migrate_subject_postings(test_ds),0)
+
+    def tearDown(self):
+        test_ds.flushdb()
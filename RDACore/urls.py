@@ -7,4 +7,6 @@ from django.conf.urls.defaults import *
 
 urlpatterns = patterns('RDACore.views',
     url(r"^$","default",name='rda-core-home'),
+    url(r"^facets/$","facets",name='rda-core-facets'),
+    url(r"^subjects/$","subjects",name='rda-core-subjects'),
 )
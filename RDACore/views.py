@@ -7,7 +7,9 @@ from django.views.generic.simple import direct_to_template
 from django.http import Http404,HttpResponse,HttpResponseRedirect
 from aristotle.settings import INSTITUTION
 from app_settings import APP,FACETS
-from redis_helpers import get_facets
+from redis_helpers import get_facets,filter_facets
+from redis_helpers import browse_subjects,get_subject_facets,subject_titles
+import json
 
 def default(request):
     """
@@ -48,5 +50,49 @@ def default(request):
                               'rda-core-app.html',
                               {'app':APP,
                                'facets':facets,
-                               'institution':INSTITUTION})
-                               
+                               'institution':INSTITUTION,
+                               'subjects':get_subject_facets()})
+
+def facets(request):
+    """
+    JSON view returns a page of the entities matching all of the facet
+    filters, i.e. ?entity=Manifestation&filter=rdaCarrierType:videodisc&filter=rdaCopyrightDate:2000-2010
+    or the Manifestations of a creator with filter=rdaCreator:Twain, Mark
+
+    :param request: HTTP Request
+    """
+    entity_name = request.REQUEST.get('entity','Manifestation')
+    raw_filters = request.GET.getlist('filter')
+    try:
+        page = max(int(request.REQUEST.get('page',1)),1)
+        results = filter_facets(entity_name,raw_filters,page)
+    except ValueError,e:
+        results = {'result':'error',
+                   'text':str(e)}
+    return HttpResponse(json.dumps(results),
+                        mimetype='application/json')
+
+def subjects(request):
+    """
+    JSON view of the subject index, ?heading= returns a page of the titles
+    with a heading, ?q= browses the headings around a heading, otherwise
+    the topical and geographic headings with the most titles, i.e.
+    ?type=geographic&heading=Colorado
+
+    :param request: HTTP Request
+    """
+    try:
+        if request.REQUEST.has_key('heading'):
+            page = max(int(request.REQUEST.get('page',1)),1)
+            results = subject_titles(request.REQUEST.get('type','topical'),
+                                     request.REQUEST.get('heading'),
+                                     page)
+        elif request.REQUEST.has_key('q'):
+            results = browse_subjects(request.REQUEST.get('q'))
+        else:
+            results = {'subjects':get_subject_facets(int(request.REQUEST.get('limit',10)))}
+    except ValueError,e:
+        results = {'result':'error',
+                   'text':str(e)}
+    return HttpResponse(json.dumps(results),
+                        mimetype='application/json')
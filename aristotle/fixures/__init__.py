@@ -1,19 +1,18 @@
 """
  mod:`__init__` This loads all RST and JSON files in the fixures directories
  and making the contents available for use within the Aristotle Library Apps
- project
+ project. Each file is only read and parsed the first time it is used.
 """
 __author__ = "Jeremy Nelson"
 
 import os,sys
-import json
+import json,hashlib
 
 CURRENT_DIR = os.path.abspath(os.path.dirname(__file__))
-rst_loader = dict()
-json_loader = dict()
-
-fixures_walker = os.walk(CURRENT_DIR)
-fixures_listing = next(fixures_walker)[2]
+# Rendered fixures are cached here by the fixure's path and modified time,
+# the directory must be owned by the process's user and not writable by
+# others so the rendered HTML can't be replaced
+CACHE_DIR = os.path.join(CURRENT_DIR,'rendered-cache')
 
 def get_file(filename,fixures_dir=CURRENT_DIR):
     """
@@ -26,11 +25,127 @@ def get_file(filename,fixures_dir=CURRENT_DIR):
     file_obj.close()
     return file_contents
 
-for filename in fixures_listing:
-    root,extension = os.path.splitext(filename)
-    if extension == '.json':
-        raw_contents = get_file(filename)
-        json_loader[root] = json.loads(raw_contents)
-    elif extension == '.rst':
-        rst_loader[root] = get_file(filename)
-        
+def get_json(filename,fixures_dir=CURRENT_DIR):
+    """
+    Helper function returns the parsed contents of a JSON fixure
+
+    :param filename: Filename
+    """
+    return json.loads(get_file(filename,fixures_dir))
+
+def get_cached(filename,fixures_dir,render,cache_dir=None):
+    """
+    Helper function returns a rendered fixure from the disk cache, the
+    fixure is rendered and cached if it is new or has changed. A fixure
+    that fails to render isn't cached, and the cache is skipped if its
+    directory isn't private to the process's user.
+
+    :param filename: Filename
+    :param fixures_dir: Fixures directory
+    :param render: Function takes the file contents and returns unicode
+    :param cache_dir: Cache directory, default is CACHE_DIR
+    """
+    from aristotle.lib.common import get_private_dir
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+    if not get_private_dir(cache_dir):
+        return render(get_file(filename,fixures_dir))
+    location = os.path.join(fixures_dir,filename)
+    cache_prefix = "{0}-{1}-".format(os.path.splitext(filename)[0],
+                                     hashlib.md5(location).hexdigest()[:12])
+    cache_filename = "{0}{1!r}.html".format(cache_prefix,
+                                            os.path.getmtime(location))
+    cache_location = os.path.join(cache_dir,cache_filename)
+    if os.path.exists(cache_location):
+        return get_file(cache_filename,cache_dir).decode('utf-8')
+    contents = render(get_file(filename,fixures_dir))
+    try:
+        temp_location = "{0}.{1}".format(cache_location,os.getpid())
+        cache_file = open(temp_location,'wb')
+        cache_file.write(contents.encode('utf-8'))
+        cache_file.close()
+        os.rename(temp_location,cache_location)
+        # Removes the HTML rendered from earlier versions of the fixure
+        for stale_filename in os.listdir(cache_dir):
+            if stale_filename.startswith(cache_prefix) and\
+               stale_filename != cache_filename:
+                os.remove(os.path.join(cache_dir,stale_filename))
+    except (IOError,OSError):
+        pass
+    return contents
+
+
+class FixureLoader(object):
+    """
+    :class:`FixureLoader` is a read-only dict of the fixures with an
+    extension in a directory, keyed by filename without the extension.
+    A fixure is loaded the first time it is accessed and then memoized
+    until the fixure's file is modified.
+    """
+
+    def __init__(self,fixures_dir,extension,load=get_file,include=None):
+        """
+        Initializes `FixureLoader`
+
+        :param fixures_dir: Fixures directory
+        :param extension: Fixure file extension, i.e. .json
+        :param load: Function takes the filename and fixures directory
+                     and returns the fixure, default is the file contents
+        :param include: Optional function takes a filename root and
+                        returns True if the fixure is included
+        """
+        self.fixures_dir = fixures_dir
+        self.extension = extension
+        self.load = load
+        self.include = include
+        self.loaded = dict()
+        self.__filenames__ = None
+
+    def filenames(self):
+        """
+        Returns a dict of fixure filenames by key, listed the first time
+        """
+        if self.__filenames__ is None:
+            self.__filenames__ = dict()
+            for filename in os.listdir(self.fixures_dir):
+                root,extension = os.path.splitext(filename)
+                if extension != self.extension:
+                    continue
+                if self.include is not None and not self.include(root):
+                    continue
+                self.__filenames__[root] = filename
+        return self.__filenames__
+
+    def __getitem__(self,key):
+        filename = self.filenames()[key]
+        modified = os.path.getmtime(os.path.join(self.fixures_dir,filename))
+        loaded = self.loaded.get(key)
+        if loaded is None or loaded[0] != modified:
+            self.loaded[key] = (modified,self.load(filename,self.fixures_dir))
+        return self.loaded[key][1]
+
+    def __contains__(self,key):
+        return self.filenames().has_key(key)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.filenames())
+
+    def has_key(self,key):
+        return key in self
+
+    def get(self,key,default=None):
+        if not key in self:
+            return default
+        return self[key]
+
+    def keys(self):
+        return self.filenames().keys()
+
+    def items(self):
+        return [(key,self[key]) for key in self.keys()]
+
+rst_loader = FixureLoader(CURRENT_DIR,'.rst')
+json_loader = FixureLoader(CURRENT_DIR,'.json',get_json)
@@ -5,21 +5,33 @@ __author__ = 'Jeremy Nelson'
 
 import urllib2,os,logging
 import sys,redis
+import hashlib,tempfile,json,gzip,stat
 import namespaces as ns
 from lxml import etree
+from datastores import configure_datastore,get_datastore
 try:
     import config
-    REDIS_HOST = config.REDIS_HOST
-    REDIS_PORT = config.REDIS_PORT
-    REDIS_DB = config.REDIS_DB
+    configure_datastore('frbr',
+                        host=config.REDIS_HOST,
+                        port=config.REDIS_PORT,
+                        db=config.REDIS_DB)
 except ImportError:
-    REDIS_HOST = '127.0.0.1'
-    REDIS_PORT = 6379
-    REDIS_DB = 0
+    pass
 
-redis_server = redis.StrictRedis(host=REDIS_HOST,
-                                 port=REDIS_PORT,
-                                 db=REDIS_DB)
+try:
+    import aristotle.settings as settings
+except ImportError:
+    # For use outside of the Aristotle Library Apps environment
+    settings = None
+
+redis_server = get_datastore('frbr')
+
+# Schemas extracted from XSD and RDF files are cached as JSON here, the
+# directory must be owned by the process's user and not writable by others
+SCHEMA_CACHE_DIR = getattr(settings,
+                           'SCHEMA_CACHE_DIR',
+                           os.path.join(os.path.abspath(os.path.dirname(__file__)),
+                                        'schema-cache'))
 
 def create_key_from_url(raw_url):
     """
@@ -40,32 +52,73 @@ def create_key_from_url(raw_url):
     new_key = new_key + org_url.path 
     return new_key
 
-def load_rdf_skos(redis_key,rdf_url):
+def open_rdf(rdf_location):
+    """
+    Opens a RDF document from a URL or a local file, gzipped if the
+    location ends with .gz, for streaming
+
+    :param rdf_location: URL or path to the RDF document
     """
-    Loads skos:ConceptSchema coded in RDF from a URL
+    if urllib2.urlparse.urlparse(rdf_location).scheme in ['http','https','ftp']:
+        rdf_file = urllib2.urlopen(rdf_location)
+        if rdf_location.endswith('.gz'):
+            # GzipFile needs to seek so the download is spooled to disk
+            spooled_file = tempfile.TemporaryFile()
+            for chunk in iter(lambda: rdf_file.read(65536),''):
+                spooled_file.write(chunk)
+            spooled_file.seek(0)
+            return gzip.GzipFile(fileobj=spooled_file,mode='rb')
+        return rdf_file
+    if rdf_location.endswith('.gz'):
+        return gzip.open(rdf_location,'rb')
+    return open(rdf_location,'rb')
+
+def load_rdf_skos(redis_key,rdf_location,redis_server=redis_server,batch_size=1000):
+    """
+    Loads skos:ConceptSchema coded in RDF from a URL or a local file. The
+    document is parsed as a stream, each top-level element is cleared after
+    it is read, and the concept labels are added in pipelined chunks, so a
+    large vocabulary neither fills memory nor blocks the Redis server.
+    Persisting the datastore is left to the server's own snapshots.
 
     :param redis_key: Base Redis key
-    :param rdf_url: URL to RDF document
+    :param rdf_location: URL or path to RDF document
+    :param redis_server: Redis datastore, default is the frbr datastore
+    :param batch_size: Number of labels in each pipeline
+    :rtype int: Number of concept labels read
     """
-    raw_rdf = urllib2.urlopen(rdf_url).read()
-    skos_rdf = etree.XML(raw_rdf)
-    title_element = skos_rdf.find('{%s}ConceptScheme/{%s}title' %\
-                                  (ns.SKOS,ns.DC))
-    if title_element is None:
+    title,root,count = None,None,0
+    skos_pipeline = redis_server.pipeline(transaction=False)
+    rdf_file = open_rdf(rdf_location)
+    for event,element in etree.iterparse(rdf_file,events=('start','end')):
+        if event == 'start':
+            if root is None:
+                root = element
+            continue
+        if element.getparent() is not root:
+            continue
+        if element.tag == '{%s}ConceptScheme' % ns.SKOS:
+            title_element = element.find('{%s}title' % ns.DC)
+            if title_element is not None:
+                title = title_element.text
+        elif element.tag == '{%s}Concept' % ns.SKOS:
+            label = element.find('{%s}prefLabel' % ns.SKOS)
+            if label is not None and label.text != 'Published':
+                skos_pipeline.sadd(redis_key,label.text)
+                count += 1
+                if count % batch_size == 0:
+                    skos_pipeline.execute()
+        # Frees the element and the elements already read before it
+        element.clear()
+        while element.getprevious() is not None:
+            del root[0]
+    skos_pipeline.execute()
+    rdf_file.close()
+    if title is None:
         title = redis_key.title()
-    else:
-        title = title_element.text
     redis_server.set('%s:title' % redis_key,title)
-    all_concepts = skos_rdf.findall('{%s}Concept' % ns.SKOS)
-    for concept in all_concepts:
-        label = concept.find('{%s}prefLabel' % ns.SKOS)
-        if label is not None:
-            if label.text != 'Published':
-                redis_server.sadd(redis_key,
-                                  label.text)
-                print("Added %s to %s" % (label.text,
-                                          redis_key))
-    redis_server.save()
+    logging.info("Added %s concepts to %s" % (count,redis_key))
+    return count
 
 def get_python_classname(raw_classname):
     """
@@ -79,6 +132,145 @@ def get_python_classname(raw_classname):
     class_name = class_name.replace("-","")
     return class_name
 
+def get_private_dir(directory):
+    """
+    Function creates a directory only the process's user can access and
+    returns True if the directory is owned by the user and not writable
+    by anyone else
+
+    :param directory: Directory path
+    """
+    try:
+        if not os.path.exists(directory):
+            os.makedirs(directory,0700)
+        dir_stat = os.lstat(directory)
+    except OSError:
+        return False
+    if not stat.S_ISDIR(dir_stat.st_mode):
+        return False
+    if dir_stat.st_uid != os.getuid():
+        return False
+    return dir_stat.st_mode & (stat.S_IWGRP|stat.S_IWOTH) == 0
+
+def __utf8__(value):
+    if isinstance(value,unicode):
+        return value.encode('utf8')
+    return value
+
+def load_cached_schema(cache_location,digest):
+    """
+    Function loads and validates a JSON schema cache, returns the schema
+    or None if the cache is missing, stale, or isn't a valid schema
+
+    :param cache_location: Path to the cached schema
+    :param digest: SHA1 digest of the current sources
+    """
+    try:
+        cache_file = open(cache_location,'rb')
+        try:
+            cached = json.load(cache_file)
+        finally:
+            cache_file.close()
+    except (IOError,ValueError):
+        return None
+    if type(cached) != dict or cached.get('digest') != digest:
+        return None
+    if type(cached.get('schema')) != list:
+        return None
+    schema = []
+    for row in cached['schema']:
+        if type(row) != list or len(row) != 2:
+            return None
+        class_name,params = row
+        if not isinstance(class_name,basestring) or type(params) != dict:
+            return None
+        class_params = {}
+        for key,value in params.iteritems():
+            if value is not None and not isinstance(value,basestring):
+                return None
+            class_params[__utf8__(key)] = __utf8__(value)
+        schema.append((__utf8__(class_name),class_params))
+    return schema
+
+def get_cached_schema(name,sources,extract,cache_dir=None):
+    """
+    Function returns a schema extracted from the raw source files, saved
+    as JSON to the schema cache with a SHA1 digest of the sources so the
+    sources are only parsed again when they change. A cache that is stale
+    or can't be read is rebuilt, and the cache is skipped if its directory
+    isn't private to the process's user.
+
+    :param name: Schema name, used for the cache filename
+    :param sources: List of raw source file contents
+    :param extract: Function takes the raw sources and returns the schema
+    :param cache_dir: Cache directory, default is SCHEMA_CACHE_DIR
+    :rtype list: List of (class name, class params) tuples
+    """
+    if cache_dir is None:
+        cache_dir = SCHEMA_CACHE_DIR
+    digest = hashlib.sha1()
+    for raw_source in sources:
+        digest.update(raw_source)
+    digest = digest.hexdigest()
+    if not get_private_dir(cache_dir):
+        logging.warning("Schema cache %s isn't private, not caching %s" % (cache_dir,
+                                                                          name))
+        return extract(*sources)
+    cache_location = os.path.join(cache_dir,
+                                  '%s.json' % name)
+    schema = load_cached_schema(cache_location,digest)
+    if schema is not None:
+        return schema
+    schema = extract(*sources)
+    try:
+        temp_location = "%s.%s" % (cache_location,os.getpid())
+        cache_file = open(temp_location,'wb')
+        json.dump({'digest':digest,'schema':schema},cache_file)
+        cache_file.close()
+        os.rename(temp_location,cache_location)
+    except (IOError,OSError):
+        pass
+    return schema
+
+def create_classes(schema,current_module):
+    """
+    Function creates a :class:`BaseModel` class in the current module for
+    each class in a schema
+
+    :param schema: List of (class name, class params) tuples
+    :param current_module: Current module
+    """
+    for class_name,params in schema:
+        params = dict(params)
+        params['__module__'] = current_module.__name__
+        new_class = type('%s' % class_name,
+                         (BaseModel,),
+                         params)
+        setattr(current_module,class_name,new_class)
+
+def extract_dynamic_classes(raw_rdf,redis_prefix):
+    """
+    Function parses the rdfs:Class elements of an RDF file into a schema
+    for :func:`create_classes`
+
+    :param raw_rdf: Raw RDF
+    :param redis_prefix: Redis Prefix
+    :rtype list: List of (class name, class params) tuples
+    """
+    rdf = etree.XML(raw_rdf)
+    all_classes = rdf.findall('{%s}Class' % ns.RDFS)
+    label_xpath = "{%s}label[@{%s}lang='en']" % (ns.RDFS,ns.XML)
+    schema = []
+    for rdf_class in all_classes:
+        rdf_ID = rdf_class.get("{%s}ID" % ns.RDF)
+        label = rdf_class.find(label_xpath)
+        class_name = get_python_classname(label.text)
+        params = {'rdf_ID':rdf_ID,
+                  'redis_key': '%s:%s' % (redis_prefix,
+                                          class_name)}
+        schema.append((class_name,params))
+    return schema
+
 def load_dynamic_classes(rdf_url,redis_prefix,current_module):
     """
     Function takes an URL to an RDF file, parses out and creates
@@ -87,9 +279,6 @@ def load_dynamic_classes(rdf_url,redis_prefix,current_module):
     :param rdf_url: URL or file location to the RDF file
     :param current_module: Current module
     """
-    ns_map = {'rdf':'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
-              'rdfs':'http://www.w3.org/2000/01/rdf-schema#',
-              'xml':'http://www.w3.org/XML/1998/namespace'}
     try:
         raw_rdf = urllib2.urlopen(rdf_url).read()
     except (urllib2.URLError,ValueError):
@@ -97,57 +286,52 @@ def load_dynamic_classes(rdf_url,redis_prefix,current_module):
     finally:
         print("Error %s loading %s" % (sys.exc_info(),
                                        rdf_url))
-    rdf = etree.XML(raw_rdf)
-    all_classes = rdf.findall('{%s}Class' % ns.RDFS)
-    for rdf_class in all_classes:
-        rdf_ID = rdf_class.get("{%s}ID" % ns.RDF)
-        label = rdf_class.find("{%s}label[@{%s}lang='en']" %\
-                               (ns.RDFS,
-                                ns.XML))
-        parent_classes = rdf_class.findall("{%s}subClassOf" %\
-                                           ns.RDFS)
-        super_classes = []
-        for parent in parent_classes:
-            parent_id = parent.get("{%s}resource" % ns.RDF)
-            parent_id = parent_id.replace("#","")
-            parent = rdf.find("{%s}Class[@{%s}ID='%s']" %\
-                              (ns.RDFS,
-                               ns.RDF,
-                               parent_id))
-            if parent is not None:
-                parent_label = parent.find("{%s}label[@{%s}lang='en']" %\
-                                           (ns.RDFS,
-                                            ns.XML))
-                super_classes.append(get_python_classname(parent_label.text))
-        if len(super_classes) < 1:
-            super_classes.append(object)
-        class_name = get_python_classname(label.text)
-        params = {'rdf_ID':rdf_ID,
-                  'redis_key': '%s:%s' % (redis_prefix,
-                                          class_name)}
-        all_prop_xpath = "{%s}Property/{%s}range[@{%s}resource='#%s']" %\
-                                     (ns.RDF,
-                                      ns.RDFS,
-                                      ns.RDF,
-                                      rdf_ID)
-        all_ranges = rdf.findall(all_prop_xpath)
-        properties = []
-        for rdf_range in all_ranges:
-            rdf_property = rdf_range.getparent()
-            prop_name = rdf_property.find("{%s}label[@{%s}lang='en']" %\
-                                          (ns.RDFS,
-                                           ns.XML))
-            if prop_name is not None:
-                properties.append(prop_name.text)
-##        print("New class %s, properties %s" %\
-##              (class_name,properties))
-        
-        new_class = type('%s' % class_name,
-                         (BaseModel,),
-                         params)
-        setattr(current_module,class_name,new_class)
-                        
-        
+    schema = get_cached_schema('%s-%s' % (redis_prefix,
+                                          os.path.basename(rdf_url)),
+                               [raw_rdf],
+                               lambda raw_rdf: extract_dynamic_classes(raw_rdf,
+                                                                       redis_prefix))
+    create_classes(schema,current_module)
+
+def extract_rda_classes(redis_prefix,raw_rda_frbr,*raw_rda_rels):
+    """
+    Function parses the RDA FRBR entity RDF and the RDA relationship
+    RDF files into a schema, the class params are the reg:name of each
+    property with the entity as its domain.
+
+    :param redis_prefix: Redis Prefix
+    :param raw_rda_frbr: Raw FRBR entity RDA RDF
+    :param raw_rda_rels: Raw RDA Properties RDF
+    :rtype list: List of (class name, class params) tuples
+    """
+    rda_frbr = etree.XML(raw_rda_frbr)
+    # Maps each rdfs:domain to its property names in one pass over the
+    # relationship files instead of a findall for every entity
+    domain_properties = {}
+    for raw_rda_rel in raw_rda_rels:
+        rda_rel = etree.XML(raw_rda_rel)
+        for desc in rda_rel.findall('{%s}Description' % ns.RDF):
+            name = desc.find('{%s}name' % ns.REG)
+            if name is None:
+                continue
+            for domain in desc.findall('{%s}domain' % ns.RDFS):
+                resource = domain.get('{%s}resource' % ns.RDF)
+                if not domain_properties.has_key(resource):
+                    domain_properties[resource] = []
+                domain_properties[resource].append(name.text)
+    schema = []
+    for desc in rda_frbr.findall("{%s}Description" % ns.RDF):
+        rda_url = desc.get('{%s}about' % ns.RDF)
+        reg_name = desc.find('{%s}name' % ns.REG)
+        if reg_name is not None:
+            class_name = reg_name.text
+            params = {'redis_key': '%s:%s' % (redis_prefix,
+                                              class_name)}
+            for name in domain_properties.get(rda_url,[]):
+                params[name] = None
+            schema.append((class_name,params))
+    return schema
+
 def load_rda_classes(rda_frbr_file,
                      rda_rel_files,
                      redis_prefix,
@@ -161,40 +345,15 @@ def load_rda_classes(rda_frbr_file,
     :param redis_prefix: Redis Prefix 
     :param current_moduel: Current module
     """
-    raw_rda_frbr = open(rda_frbr_file,'rb').read()
-    rda_frbr = etree.XML(raw_rda_frbr)
-    rda_rels_xml = []
+    sources = [open(rda_frbr_file,'rb').read()]
     for filename in rda_rel_files:
-        raw_rda_rel = open(filename,'rb').read()
-        rda_rel = etree.XML(raw_rda_rel)
-        rda_rels_xml.append(rda_rel)
-    
-    all_desc = rda_frbr.findall("{%s}Description" % ns.RDF)
-    for desc in all_desc:
-        rda_url = desc.get('{%s}about' % ns.RDF)
-        all_properties = []
-        for rda_rel in rda_rels_xml:
-            rda_properties = rda_rel.findall('{%s}Description/{%s}domain[@{%s}resource="%s"]' % (ns.RDF,
-                                                                                                 ns.RDFS,
-                                                                                                 ns.RDF,
-                                                                                                 rda_url))
-            all_properties.extend(rda_properties)
-        reg_name = desc.find('{%s}name' % ns.REG)
-        if reg_name is not None:
-            class_name = reg_name.text
-            params = {'redis_key': '%s:%s' % (redis_prefix,
-                                              class_name)}
-            for prop in all_properties:
-                parent = prop.getparent()
-                name = parent.find('{%s}name' % ns.REG)
-                params[name.text] = None
-                #label = parent.find('{%s}label' % ns.RDFS)
-                #params[label.text] = None
-            #logging.error("Params = %s" % params)
-            new_class = type('%s' % class_name,
-                             (BaseModel,),
-                             params)
-            setattr(current_module,class_name,new_class)
+        sources.append(open(filename,'rb').read())
+    schema = get_cached_schema('%s-%s' % (redis_prefix,
+                                          os.path.basename(rda_frbr_file)),
+                               sources,
+                               lambda *sources: extract_rda_classes(redis_prefix,
+                                                                    *sources))
+    create_classes(schema,current_module)
          
     
 class BaseModel(object):
@@ -203,6 +362,9 @@ class BaseModel(object):
     use by various modules in the FRBR Redis Datastore Project. This
     class should not be used directly but should be extended by sub-classes
     depending on its use.
+
+    In unit of work mode, property changes are kept on the instance and
+    written to Redis in one pipeline by :meth:`flush`.
     """
        
     def __init__(self,**kwargs):
@@ -213,6 +375,10 @@ class BaseModel(object):
         :param redis_key: Redis Key, required
         :param redis_server: Redis server, if not present will be set the
                              default Redis server.
+        :param redis_ID: Optional ID already reserved in the Redis
+                         datastore, used by :meth:`bulk_create`
+        :param unit_of_work: Boolean, keep property changes until
+                             :meth:`flush`, default is False
         """
         if kwargs.has_key("redis_key"):
             self.redis_key = kwargs.pop("redis_key")
@@ -220,25 +386,99 @@ class BaseModel(object):
             self.redis_server = kwargs.pop("redis_server")
         else:
             self.redis_server = redis_server
-        self.redis_ID = self.redis_server.incr("global:%s" % self.redis_key)
+        self.unit_of_work = kwargs.pop("unit_of_work",False)
+        if kwargs.has_key("redis_ID"):
+            self.redis_ID = kwargs.pop("redis_ID")
+        else:
+            self.redis_ID = self.redis_server.incr("global:%s" % self.redis_key)
         self.frbr_key = "%s:%s" % (self.redis_key,self.redis_ID)
+        self.pending_properties = {}
+        self.pending_sets = {}
+        # Names of the properties this instance has set, a new instance
+        # is the only writer of its properties
+        self.property_names = set()
         for k,v in kwargs.iteritems():
             if type(v) == list or type(v) == set:
                 new_key = "%s:%s" % (self.frbr_key,k)
-                for item in v:
-                    self.redis_server.sadd(new_key,item)
-                self.redis_server.hset(self.frbr_key,k,new_key)
+                self.pending_sets[new_key] = list(v)
+                self.pending_properties[k] = new_key
             else:
-                self.redis_server.hset(self.frbr_key,k,v)
+                self.pending_properties[k] = v
+            self.property_names.add(k)
             setattr(self,k,v)
+        if not self.unit_of_work:
+            self.flush()
+
+    @classmethod
+    def bulk_create(cls,
+                    entities,
+                    redis_server=redis_server,
+                    batch_size=1000):
+        """
+        Creates an instance for each dict of properties, the IDs are
+        reserved with one INCR and the properties are written in one
+        pipeline for every batch_size instances.
+
+        :param entities: List of dicts of properties
+        :param redis_server: Redis server
+        :param batch_size: Number of instances per pipeline, default is 1000
+        :rtype list: List of new instances
+        """
+        entities = list(entities)
+        if len(entities) < 1:
+            return []
+        last_ID = redis_server.incr("global:%s" % cls.redis_key,
+                                    len(entities))
+        first_ID = last_ID - len(entities) + 1
+        instances = []
+        pipeline = redis_server.pipeline()
+        for i,properties in enumerate(entities):
+            params = dict(properties)
+            params['redis_server'] = redis_server
+            params['redis_ID'] = first_ID + i
+            params['unit_of_work'] = True
+            instance = cls(**params)
+            instance.flush(pipeline)
+            instance.unit_of_work = False
+            instances.append(instance)
+            if not (i+1)%batch_size:
+                pipeline.execute()
+        pipeline.execute()
+        return instances
+
+    def flush(self,pipeline=None):
+        """
+        Writes the pending property changes with one HMSET and a SADD
+        for each set property
+
+        :param pipeline: Optional Redis pipeline, executed by the caller,
+                         default executes a new pipeline
+        """
+        if len(self.pending_properties) < 1 and len(self.pending_sets) < 1:
+            return
+        execute = pipeline is None
+        if execute:
+            pipeline = self.redis_server.pipeline()
+        for set_key,members in self.pending_sets.iteritems():
+            if len(members) > 0:
+                pipeline.sadd(set_key,*members)
+        if len(self.pending_properties) > 0:
+            pipeline.hmset(self.frbr_key,self.pending_properties)
+        self.pending_properties = {}
+        self.pending_sets = {}
+        if execute:
+            pipeline.execute()
 
     def get_property(self,obj_property):
         """
         Function tries to retrieve the property from the FRBR Redis 
-        datastore.
+        datastore, in unit of work mode a pending value is returned
+        without a round-trip.
         
         :param obj_property: Required, name of the property
         """
+        if self.pending_properties.has_key(obj_property):
+            return self.pending_properties[obj_property]
         return self.redis_server.hget(self.frbr_key,obj_property)
           
         
@@ -251,6 +491,7 @@ class BaseModel(object):
         :param entity: Optional, an entity to add as a set if multiple
                        instances of :class:`BaseModel` property exists 
         """
+        self.flush()
         existing_properties = self.get_property(obj_property)
         property_key = "%s:%s" % (self.frbr_key,obj_property)
         if entity is not None:
@@ -271,11 +512,30 @@ class BaseModel(object):
     def set_property(self,obj_property,value):
         """
         Method sets property to value. If obj_property already exists
-        and value is de-duped and turned into a set if needed.
+        and value is de-duped and turned into a set if needed. In unit
+        of work mode the change is kept until :meth:`flush`, a second
+        value replaces a pending value, and the instance's own property
+        names are checked instead of reading the property from Redis.
 
         :param obj_property: name of property
         :param value: Value of property
         """
+        if self.unit_of_work:
+            if obj_property in self.property_names and\
+               not self.pending_properties.has_key(obj_property):
+                return
+            new_redis_key = "%s:%s" % (self.frbr_key,
+                                       obj_property)
+            self.pending_sets.pop(new_redis_key,None)
+            if type(value) == list and len(value) != 1:
+                self.pending_sets[new_redis_key] = list(value)
+                self.pending_properties[obj_property] = new_redis_key
+            elif type(value) == list:
+                self.pending_properties[obj_property] = value[0]
+            else:
+                self.pending_properties[obj_property] = value
+            self.property_names.add(obj_property)
+            return
         existing_properties = self.get_property(obj_property)
         if existing_properties is None:
             if type(value) == list:
@@ -0,0 +1,425 @@
+"""
+ :mod:`datastores` Registry of the named Redis datastores used by the
+ Aristotle Library Apps. Each datastore's client is created the first time
+ it is requested and datastores on the same Redis server share a bounded
+ connection pool with socket timeouts, so a worker process holds a fixed
+ number of connections and fails fast when Redis is slow.
+
+ The host and port of each datastore come from the project settings,
+ REDIS_DATASTORES in the settings overrides the connection of any
+ datastore, i.e. REDIS_DATASTORES = {'title':{'host':'10.0.0.5','port':6379}}
+
+ Read-only paths can spread their reads across replicas of a datastore
+ listed in REDIS_REPLICAS, i.e. REDIS_REPLICAS = {'master':[{'host':'10.0.0.6'}]},
+ while ingest jobs keep writing to the datastore itself. A replica's lag
+ is the seconds since it last heard from its master, not how far behind
+ the master it is, see :func:`get_replica_lag`.
+"""
+__author__ = "Jeremy Nelson"
+
+import time
+import redis
+
+try:
+    import aristotle.settings as settings
+except ImportError:
+    # For use outside of the Aristotle Library Apps environment
+    settings = None
+
+# Names of the settings for each datastore's connection
+DATASTORE_SETTINGS = {'master':{'host':'REDIS_MASTER_HOST',
+                                'port':'REDIS_MASTER_PORT'},
+                      'access':{'host':'REDIS_ACCESS_HOST',
+                                'port':'REDIS_ACCESS_PORT'},
+                      'productivity':{'host':'REDIS_PRODUCTIVITY_HOST',
+                                      'port':'REDIS_PRODUCTIVITY_PORT',
+                                      'password':'REDIS_PASSWORD'},
+                      # Title search has used its own local Redis
+                      'title':{},
+                      # Library hours have used the local Redis, move them
+                      # with REDIS_DATASTORES = {'hours':{'host':...}}
+                      'hours':{}}
+# RDA Core entities and the FRBR classes are stored on the master
+for name in ['work','expression','manifestation','item','frbr']:
+    DATASTORE_SETTINGS[name] = DATASTORE_SETTINGS['master']
+DEFAULT_CONNECTION = {'host':'127.0.0.1',
+                      'port':6379,
+                      'db':0,
+                      'password':None}
+DEFAULT_CONNECTIONS = {'title':{'port':6384}}
+# Maximum connections per process to a Redis server, a command raises a
+# ConnectionError instead of opening more
+MAX_CONNECTIONS = getattr(settings,'REDIS_MAX_CONNECTIONS',32)
+# Seconds before a Redis command times out
+SOCKET_TIMEOUT = getattr(settings,'REDIS_SOCKET_TIMEOUT',5)
+# Seconds between checks of a replica's replication lag
+REPLICA_CHECK_INTERVAL = getattr(settings,'REDIS_REPLICA_CHECK_INTERVAL',5)
+# Client methods that write, a read datastore raises a ValueError for them
+# and for a sort with a store key
+WRITE_COMMANDS = set(['append','bgrewriteaof','bgsave','blpop','brpop',
+                      'brpoplpush','decr','delete','expire','expireat',
+                      'flushall','flushdb','getset','hdel','hincrby',
+                      'hmset','hset','hsetnx','incr','linsert','lpop',
+                      'lpush','lpushx','lrem','lset','ltrim','move',
+                      'mset','msetnx','persist','publish','rename',
+                      'renamenx','rpop','rpoplpush','rpush','rpushx',
+                      'sadd','save','sdiffstore','set','setbit','setex',
+                      'setnx','setrange','shutdown','sinterstore','smove',
+                      'spop','srem','sunionstore','zadd','zincrby',
+                      'zinterstore','zrem','zremrangebyrank',
+                      'zremrangebyscore','zunionstore'])
+
+datastores = dict()
+connection_pools = dict()
+configured = dict()
+configured_replicas = dict()
+replica_clients = dict()
+replica_status = dict()
+
+
+def get_connection(name):
+    """
+    Function returns the connection dict of a datastore from the defaults,
+    the project settings, and any configure_datastore overrides
+
+    :param name: Datastore name
+    """
+    if not DATASTORE_SETTINGS.has_key(name) and not configured.has_key(name):
+        raise ValueError("Unknown Redis datastore {0}".format(name))
+    connection = dict(DEFAULT_CONNECTION)
+    connection.update(DEFAULT_CONNECTIONS.get(name,{}))
+    for key,setting in DATASTORE_SETTINGS.get(name,{}).iteritems():
+        if hasattr(settings,setting):
+            connection[key] = getattr(settings,setting)
+    connection.update(getattr(settings,'REDIS_DATASTORES',{}).get(name,{}))
+    connection.update(configured.get(name,{}))
+    return connection
+
+def configure_datastore(name,**connection):
+    """
+    Function sets the connection of a datastore, a client already
+    handed out for the datastore keeps its old connection
+
+    :param name: Datastore name
+    :param connection: host, port, db, and password
+    """
+    configured[name] = connection
+    datastores.pop(name,None)
+
+def configure_replicas(name,*replicas):
+    """
+    Function sets the read replicas of a datastore, replacing the
+    replicas from the project settings
+
+    :param name: Datastore name
+    :param replicas: Connection dicts, missing values are taken from the
+                     datastore's connection
+    """
+    configured_replicas[name] = list(replicas)
+
+def get_replica_connections(name):
+    """
+    Function returns the connection dicts of a datastore's read replicas
+
+    :param name: Datastore name
+    """
+    if configured_replicas.has_key(name):
+        replicas = configured_replicas[name]
+    else:
+        replicas = getattr(settings,'REDIS_REPLICAS',{}).get(name,[])
+    if len(replicas) < 1:
+        return []
+    connection = get_connection(name)
+    connections = []
+    for replica in replicas:
+        replica_connection = dict(connection)
+        replica_connection.update(replica)
+        connections.append(replica_connection)
+    return connections
+
+def get_pool_key(connection):
+    return (connection['host'],
+            connection['port'],
+            connection['db'],
+            connection['password'])
+
+def get_connection_pool(connection):
+    """
+    Function returns the shared connection pool for a Redis server and
+    database
+
+    :param connection: Connection dict
+    """
+    pool_key = get_pool_key(connection)
+    if not connection_pools.has_key(pool_key):
+        connection_pools[pool_key] = redis.ConnectionPool(max_connections=MAX_CONNECTIONS,
+                                                          socket_timeout=SOCKET_TIMEOUT,
+                                                          host=connection['host'],
+                                                          port=connection['port'],
+                                                          db=connection['db'],
+                                                          password=connection['password'])
+    return connection_pools[pool_key]
+
+def get_datastore(name):
+    """
+    Function returns the Redis client for a datastore, the client is
+    created the first time and doesn't connect until its first command
+
+    :param name: Datastore name, i.e. master, work, title, or productivity
+    """
+    if not datastores.has_key(name):
+        pool = get_connection_pool(get_connection(name))
+        datastores[name] = redis.StrictRedis(connection_pool=pool)
+    return datastores[name]
+
+def get_replica(connection):
+    """
+    Function returns the Redis client for a replica's connection
+
+    :param connection: Connection dict
+    """
+    pool_key = get_pool_key(connection)
+    if not replica_clients.has_key(pool_key):
+        replica_clients[pool_key] = redis.StrictRedis(connection_pool=get_connection_pool(connection))
+    return replica_clients[pool_key]
+
+def get_replica_lag(connection):
+    """
+    Function returns the seconds since a replica last heard from its
+    master, 0 for a server that isn't replicating, or None if the replica
+    is down. The lag is checked at most once every REPLICA_CHECK_INTERVAL
+    seconds.
+
+    This is master_last_io_seconds_ago, not the replication lag. An idle
+    master only pings its replicas every repl-ping-slave-period seconds
+    and a replica that just heard from its master can still be behind on
+    a large backlog of writes, so a max_lag is a bound on how long ago the
+    replica was known to be connected rather than on how stale it is.
+
+    :param connection: Connection dict
+    """
+    pool_key = get_pool_key(connection)
+    checked,lag = replica_status.get(pool_key,(None,None))
+    if checked is not None and time.time()-checked < REPLICA_CHECK_INTERVAL:
+        return lag
+    try:
+        info = get_replica(connection).info()
+        if info.get('role') != 'slave':
+            lag = 0
+        elif info.get('master_link_status') != 'up':
+            # Replica keeps serving its last copy of the master
+            lag = float('inf')
+        else:
+            lag = int(info.get('master_last_io_seconds_ago',0))
+    except redis.RedisError:
+        lag = None
+    replica_status[pool_key] = (time.time(),lag)
+    return lag
+
+def mark_replica_down(connection):
+    """
+    Function skips a replica until its next check
+
+    :param connection: Connection dict
+    """
+    replica_status[get_pool_key(connection)] = (time.time(),None)
+
+def check_read(name,attr,args=(),kwargs={}):
+    """
+    Function raises a ValueError for a client method that writes
+
+    :param name: Datastore name
+    :param attr: Client method
+    :param args: Optional positional arguments of the call
+    :param kwargs: Optional keyword arguments of the call
+    """
+    if attr in WRITE_COMMANDS or\
+       (attr == 'sort' and (kwargs.get('store') is not None or\
+                            (len(args) > 7 and args[7] is not None))):
+        raise ValueError("{0} writes to Redis, use get_datastore('{1}')".format(attr,
+                                                                               name))
+
+def get_read_datastore(name,max_lag=None):
+    """
+    Function returns a :class:`ReadDatastore` for the read-only paths of
+    an app
+
+    :param name: Datastore name
+    :param max_lag: Seconds since a replica last heard from its master,
+                    default is no limit
+    """
+    return ReadDatastore(name,max_lag)
+
+def check_datastores(names=None):
+    """
+    Function pings each datastore, returns a dict of the round-trip in
+    milliseconds by datastore name or None if the datastore is down
+
+    :param names: Optional list of datastore names, default is all
+    """
+    if names is None:
+        names = sorted(set(DATASTORE_SETTINGS.keys()+configured.keys()))
+    health = dict()
+    for name in names:
+        start = time.time()
+        try:
+            get_datastore(name).ping()
+            health[name] = round((time.time()-start)*1000.0,3)
+        except redis.RedisError:
+            health[name] = None
+    return health
+
+def reset_datastores():
+    """
+    Function disconnects and removes all of the clients and pools
+    """
+    for pool in connection_pools.values():
+        pool.disconnect()
+    connection_pools.clear()
+    datastores.clear()
+    replica_clients.clear()
+    replica_status.clear()
+
+
+class ReadDatastore(object):
+    """
+    :class:`ReadDatastore` sends each read command to the next replica of
+    a datastore that is up and within the app's staleness tolerance. The
+    datastore itself is used when no replica qualifies or a replica fails
+    during a command or a pipeline execute. Write commands raise a
+    ValueError.
+    """
+
+    def __init__(self,name,max_lag=None):
+        """
+        Initializes `ReadDatastore`
+
+        :param name: Datastore name
+        :param max_lag: Seconds since a replica last heard from its
+                        master, default is no limit
+        """
+        self.name = name
+        self.max_lag = max_lag
+        self.next_replica = 0
+
+    def replicas(self):
+        """
+        Returns the connection dicts of the replicas reads can use
+        """
+        replicas = []
+        for connection in get_replica_connections(self.name):
+            lag = get_replica_lag(connection)
+            if lag is None:
+                continue
+            if self.max_lag is None or lag <= self.max_lag:
+                replicas.append(connection)
+        return replicas
+
+    def choose(self):
+        """
+        Returns the connection dict of the next replica in turn, or None
+        for the datastore
+        """
+        replicas = self.replicas()
+        if len(replicas) < 1:
+            return None
+        self.next_replica = (self.next_replica+1) % len(replicas)
+        return replicas[self.next_replica]
+
+    def pipeline(self,transaction=True,shard_hint=None):
+        """
+        Returns a :class:`ReadPipeline` for the next replica in turn
+
+        :param transaction: Boolean, wraps the commands in MULTI/EXEC,
+                            default is True
+        :param shard_hint: Optional shard hint
+        """
+        return ReadPipeline(self.name,
+                            self.choose(),
+                            transaction=transaction,
+                            shard_hint=shard_hint)
+
+    def __getattr__(self,attr):
+        check_read(self.name,attr)
+        connection = self.choose()
+        if connection is None:
+            command = getattr(get_datastore(self.name),attr)
+        else:
+            command = getattr(get_replica(connection),attr)
+        if not callable(command):
+            return command
+        def read(*args,**kwargs):
+            check_read(self.name,attr,args,kwargs)
+            if connection is None:
+                return command(*args,**kwargs)
+            try:
+                return command(*args,**kwargs)
+            except redis.ConnectionError:
+                mark_replica_down(connection)
+                return getattr(get_datastore(self.name),attr)(*args,**kwargs)
+        return read
+
+
+class ReadPipeline(object):
+    """
+    :class:`ReadPipeline` queues read commands for a replica and sends
+    them with one round-trip, the commands are sent again to the
+    datastore itself if the replica fails during the execute
+    """
+
+    def __init__(self,name,connection,**kwargs):
+        """
+        Initializes `ReadPipeline`
+
+        :param name: Datastore name
+        :param connection: Connection dict of the replica, None for the
+                           datastore
+        :param kwargs: Keyword arguments of the client's pipeline
+        """
+        self.name = name
+        self.connection = connection
+        self.pipeline_kwargs = kwargs
+        self.commands = []
+
+    def __len__(self):
+        return len(self.commands)
+
+    def __getattr__(self,attr):
+        check_read(self.name,attr)
+        if not callable(getattr(redis.StrictRedis,attr,None)):
+            raise AttributeError(attr)
+        def queue(*args,**kwargs):
+            check_read(self.name,attr,args,kwargs)
+            self.commands.append((attr,args,kwargs))
+            return self
+        return queue
+
+    def send(self,redis_server):
+        """
+        Sends the queued commands to a Redis client, returns the results
+
+        :param redis_server: Redis client
+        """
+        redis_pipeline = redis_server.pipeline(**self.pipeline_kwargs)
+        for attr,args,kwargs in self.commands:
+            getattr(redis_pipeline,attr)(*args,**kwargs)
+        return redis_pipeline.execute()
+
+    def execute(self):
+        """
+        Sends the queued commands to the replica, or to the datastore if
+        the replica fails, and returns the results
+        """
+        try:
+            if self.connection is not None:
+                try:
+                    return self.send(get_replica(self.connection))
+                except redis.ConnectionError:
+                    mark_replica_down(self.connection)
+                    self.connection = None
+            return self.send(get_datastore(self.name))
+        finally:
+            self.commands = []
+
+    def reset(self):
+        self.commands = []
@@ -6,22 +6,22 @@ __author__ = 'Jeremy Nelson'
 import redis,urllib2,sys,os
 from lxml import etree
 import namespaces as ns
-from common import BaseModel
+from common import BaseModel,create_classes,get_cached_schema
 
 
-def setup_rda_core(rda_core_schema_file):
+def extract_rda_core(schema_xml):
     """
-    Setup RDA Core classes for use in the FRBR-Redis datastore project
+    Extracts the RDA Core classes and their properties from the RDA Core
+    XML schema
 
-    :param rda_core_schema_file:
+    :param schema_xml: Raw RDA Core XML schema
+    :rtype list: List of (class name, class params) tuples
     """
-    raw_schema = open(rda_core_schema_file,'rb')
-    schema_xml = raw_schema.read()
-    raw_schema.close()
     schema_doc = etree.XML(schema_xml)
     # Use xpath to extract all of the complexTypes from the root element
     # We will use the name of the complexType element as the class name
     complexTypes = schema_doc.findall('{%s}complexType' % ns.SCHEMA)
+    schema = []
     for entity in complexTypes:
         class_name = entity.attrib['name']
         class_params = {'redis_key':'frbr_rda:%s' % class_name}
@@ -31,10 +31,23 @@ def setup_rda_core(rda_core_schema_file):
         for row in properties:
             # Quick hack to remove redundant rda prefix for properties
             class_params[row.attrib['name'].replace('rda','')] = None
-        new_class = type('%s' % class_name,
-                         (BaseModel,),
-                         class_params)
-        setattr(current_module,class_name,new_class)
+        schema.append((class_name,class_params))
+    return schema
+
+def setup_rda_core(rda_core_schema_file):
+    """
+    Setup RDA Core classes for use in the FRBR-Redis datastore project,
+    the XML schema is only parsed when it changes
+
+    :param rda_core_schema_file:
+    """
+    raw_schema = open(rda_core_schema_file,'rb')
+    schema_xml = raw_schema.read()
+    raw_schema.close()
+    schema = get_cached_schema(os.path.basename(rda_core_schema_file),
+                               [schema_xml],
+                               extract_rda_core)
+    create_classes(schema,current_module)
             
         
 current_module = sys.modules[__name__]
@@ -143,6 +143,7 @@ TEMPLATE_DIRS = (
     os.path.join(PROJECT_HOME,'reserve_search/templates/reserve_search/snippets/'),
     os.path.join(PROJECT_HOME,'title_search/templates/title_search/'),
     os.path.join(PROJECT_HOME,'title_search/templates/title_search/snippets/'),
+    os.path.join(PROJECT_HOME,'creator_search/templates/creator_search/'),
     # Put strings here, like "/home/html/django_templates" or "C:/www/django/templates".
     # Always use forward slashes, even on Windows.
     # Don't forget to use absolute paths, not relative paths.
@@ -159,6 +160,7 @@ INSTALLED_APPS = (
     'article_search',
     'book_search',
     'call_number',
+    'creator_search',
     'dbfinder',
     'fedora_batch',
     'hours',
@@ -15,6 +15,7 @@ urlpatterns = patterns('',
     url(r'^apps/article_search/', include('article_search.urls')),
     url(r'^apps/book_search/', include('book_search.urls')),
     url(r'^apps/call_number/', include('call_number.urls')),
+    url(r'^apps/creator_search/', include('creator_search.urls')),
     url(r'^apps/dbfinder/', include('dbfinder.urls')),
 ##    url(r'^apps/fedora_batch','fedora_batch.views.default'),
     url(r'^apps/fedora_batch/home.html','fedora_batch.views.default'),
@@ -0,0 +1,5 @@
+"""
+ :mod:`benchmarks` Benchmark suite for the catalog's hot paths, run with
+ python -m benchmarks.harness
+"""
+__author__ = "Jeremy Nelson"
@@ -0,0 +1,379 @@
+"""
+ :mod:`harness` Benchmark harness for the catalog's hot paths. Times the
+ rdaCore ingest, call number normalization and browsing, title typeahead,
+ metaphone, the vendor MARC jobs, and the order lookups at increasing
+ scales, writing the results as JSON so a run can be compared against a
+ saved baseline before deploying.
+
+ The benchmarks flush their datastore, so they only run against an
+ empty Redis database given with --host and --db, or fakeredis. Every
+ datastore in :mod:`aristotle.lib.datastores` is configured to the
+ benchmark datastore without read replicas.
+
+ Usage::
+
+    python -m benchmarks.harness --host 127.0.0.1 --db 15 --scales 10000,100000
+    python -m benchmarks.harness --fakeredis --compare baseline.json
+"""
+__author__ = "Jeremy Nelson"
+
+import os,sys,time,json
+import datetime,random,shutil
+import tempfile,traceback
+import optparse
+import redis
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE','aristotle.settings')
+
+from benchmarks.marc_generator import generate_records,write_marc_file,title
+
+DEFAULT_SCALES = [10000,100000,1000000]
+# Number of lookups timed for the read benchmarks at every scale
+QUERY_COUNT = 1000
+# Fraction ops_per_second can drop against a baseline before failing
+REGRESSION_THRESHOLD = 0.2
+
+
+def get_datastore(connection=None):
+    """
+    Function returns the Redis datastore fixture for the benchmarks, the
+    Redis database of the connection if it is empty or fakeredis without
+    a connection. A database with keys raises a ValueError as the
+    benchmarks flush it.
+
+    :param connection: Connection dict of host, port, and db, default
+                       is fakeredis
+    :rtype tuple: Redis datastore and the name of the datastore
+    """
+    if connection is None:
+        try:
+            import fakeredis
+        except ImportError:
+            raise ValueError("--fakeredis requires the fakeredis package")
+        return fakeredis.FakeStrictRedis(),'fakeredis'
+    datastore = redis.StrictRedis(host=connection['host'],
+                                  port=connection['port'],
+                                  db=connection['db'])
+    size = datastore.dbsize()
+    if size > 0:
+        raise ValueError("Redis {0}:{1} db {2} has {3} keys, benchmarks only run against an empty database".format(connection['host'],
+                                                                                                                  connection['port'],
+                                                                                                                  connection['db'],
+                                                                                                                  size))
+    return datastore,'redis'
+
+def use_datastore(datastore,connection=None):
+    """
+    Function configures every datastore of :mod:`aristotle.lib.datastores`
+    to the benchmark datastore without read replicas, before the
+    benchmarked apps create their clients, and points the module level
+    Redis clients of the benchmarked apps at the benchmark datastore
+
+    :param datastore: Redis datastore fixture
+    :param connection: Connection dict of the datastore, None for
+                       fakeredis
+    """
+    from aristotle.lib import datastores
+    for name in set(datastores.DATASTORE_SETTINGS.keys()+datastores.configured.keys()):
+        datastores.configure_replicas(name)
+        if connection is None:
+            # fakeredis has no connection, its client is registered
+            datastores.datastores[name] = datastore
+        else:
+            datastores.configure_datastore(name,
+                                           password=None,
+                                           **connection)
+    import call_number.redis_helpers
+    import orders.redis_helpers
+    call_number.redis_helpers.redis_server = datastore
+    orders.redis_helpers.redis_server = datastore
+    try:
+        from marc_batch.jobs import rdaCore_redis
+    except ImportError:
+        # ingest_record benchmark reports the import error
+        return
+    for name in ['WORK_REDIS','EXPRESSION_REDIS','MANIFESTATION_REDIS',
+                 'ITEM_REDIS','TITLE_REDIS','redis_server']:
+        setattr(rdaCore_redis,name,datastore)
+
+def summarize(name,scale,timings):
+    """
+    Function returns a result dict from a list of per operation timings
+
+    :param name: Benchmark name
+    :param scale: Number of records at this scale
+    :param timings: List of seconds per operation
+    """
+    timings = sorted(timings)
+    total = sum(timings)
+    operations = len(timings)
+    result = {'name':name,
+              'scale':scale,
+              'operations':operations,
+              'seconds':round(total,4)}
+    if operations > 0:
+        result['ops_per_second'] = round(operations/max(total,0.000001),2)
+        result['mean_ms'] = round(total*1000.0/operations,4)
+        result['p50_ms'] = round(timings[int(operations*0.5)]*1000.0,4)
+        result['p99_ms'] = round(timings[min(int(operations*0.99),operations-1)]*1000.0,4)
+    return result
+
+def time_calls(name,scale,func,arguments):
+    """
+    Function times func for each tuple of arguments
+
+    :param name: Benchmark name
+    :param scale: Number of records at this scale
+    :param func: Function to benchmark
+    :param arguments: Iterable of argument tuples
+    """
+    timings = []
+    for args in arguments:
+        start = time.time()
+        func(*args)
+        timings.append(time.time() - start)
+    return summarize(name,scale,timings)
+
+def time_once(name,scale,func,*args):
+    """
+    Function times a single call of a bulk operation, i.e. loading a MARC
+    file, reported as operations per record
+
+    :param name: Benchmark name
+    :param scale: Number of records at this scale
+    :param func: Function to benchmark
+    """
+    start = time.time()
+    func(*args)
+    seconds = time.time() - start
+    return {'name':name,
+            'scale':scale,
+            'operations':scale,
+            'seconds':round(seconds,4),
+            'ops_per_second':round(scale/max(seconds,0.000001),2),
+            'mean_ms':round(seconds*1000.0/scale,4)}
+
+def bench_ingest_record(datastore,scale,marc_file):
+    from marc_batch.jobs.rdaCore_redis import ingest_record
+    return [time_calls('ingest_record',
+                       scale,
+                       ingest_record,
+                       ((record,datastore) for record in generate_records(scale)))]
+
+def bench_lccn_normalize(datastore,scale,marc_file):
+    from call_number.redis_helpers import lccn_normalize
+    return [time_calls('lccn_normalize',
+                       scale,
+                       lccn_normalize,
+                       ((record['050'].value(),) for record in generate_records(scale)))]
+
+def bench_get_slice(datastore,scale,marc_file):
+    from call_number.redis_helpers import get_slice
+    total = datastore.zcard('lccn-sort-set')
+    if total < 1:
+        raise ValueError("get_slice requires ingest_record to populate lccn-sort-set")
+    rand = random.Random(scale)
+    starts = [rand.randint(0,max(total-10,0)) for i in range(min(scale,QUERY_COUNT))]
+    return [time_calls('get_slice',
+                       scale,
+                       get_slice,
+                       ((start,start+9) for start in starts))]
+
+def bench_typeahead_search_title(datastore,scale,marc_file):
+    from title_search.search_helpers import add_marc_title,typeahead_search_title
+    results = [time_calls('add_marc_title',
+                          scale,
+                          add_marc_title,
+                          ((record,datastore) for record in generate_records(scale)))]
+    rand = random.Random(scale)
+    queries = []
+    for i in range(min(scale,QUERY_COUNT)):
+        query = title(rand)
+        queries.append((query[:rand.randint(3,len(query))],datastore))
+    results.append(time_calls('typeahead_search_title',
+                              scale,
+                              typeahead_search_title,
+                              queries))
+    return results
+
+def bench_metaphone(datastore,scale,marc_file):
+    from aristotle.lib import metaphone
+    rand = random.Random(scale)
+    return [time_calls('metaphone.dm',
+                       scale,
+                       metaphone.dm,
+                       ((unicode(title(rand).split(" ")[0]),) for i in xrange(scale)))]
+
+def bench_vendor_jobs(datastore,scale,marc_file):
+    from marc_batch.jobs.springer import SpringerEBookJob
+    from marc_batch.jobs.ybp_ebl import ybp_ebl
+    from marc_batch.jobs.ybp_ebrary import ybp_ebrary
+    results = []
+    for job_class in [SpringerEBookJob,ybp_ebl,ybp_ebrary]:
+        job = job_class(open(marc_file,'rb'))
+        results.append(time_once('{0}.load'.format(job_class.__name__),
+                                 scale,
+                                 job.load))
+        results.append(time_once('{0}.output'.format(job_class.__name__),
+                                 scale,
+                                 job.output))
+        del job
+    return results
+
+def bench_orders(datastore,scale,marc_file):
+    from orders.redis_helpers import load_order_records,get_entity
+    results = [time_once('load_order_records',
+                         scale,
+                         load_order_records,
+                         marc_file)]
+    rand = random.Random(scale)
+    numbers = ["{0}A".format(rand.randint(1,scale)) for i in range(min(scale,QUERY_COUNT))]
+    results.append(time_calls('orders.get_entity',
+                              scale,
+                              lambda number: get_entity(number=number),
+                              ((number,) for number in numbers)))
+    return results
+
+BENCHMARKS = [('ingest_record',bench_ingest_record),
+              ('lccn_normalize',bench_lccn_normalize),
+              ('get_slice',bench_get_slice),
+              ('typeahead_search_title',bench_typeahead_search_title),
+              ('metaphone',bench_metaphone),
+              ('vendor_jobs',bench_vendor_jobs),
+              ('orders',bench_orders)]
+
+def run(scales=DEFAULT_SCALES,names=None,connection=None):
+    """
+    Function runs the benchmarks at each scale against a flushed
+    datastore fixture
+
+    :param scales: List of record counts
+    :param names: Optional list of benchmark names, default is all
+    :param connection: Connection dict of host, port, and db of an
+                       empty Redis database, default is fakeredis
+    :rtype dict: Benchmark report
+    """
+    datastore,datastore_name = get_datastore(connection)
+    use_datastore(datastore,connection)
+    report = {'started':datetime.datetime.now().isoformat(),
+              'datastore':datastore_name,
+              'python':sys.version.split(" ")[0],
+              'results':[]}
+    work_directory = tempfile.mkdtemp(prefix='benchmarks')
+    try:
+        for scale in scales:
+            datastore.flushdb()
+            marc_file = write_marc_file(os.path.join(work_directory,
+                                                     '{0}.mrc'.format(scale)),
+                                        scale)
+            for name,benchmark in BENCHMARKS:
+                if names is not None and not name in names:
+                    continue
+                sys.stderr.write("{0} at {1}\n".format(name,scale))
+                try:
+                    report['results'].extend(benchmark(datastore,scale,marc_file))
+                except Exception:
+                    error = traceback.format_exc().splitlines()[-1]
+                    report['results'].append({'name':name,
+                                              'scale':scale,
+                                              'error':error})
+            os.remove(marc_file)
+    finally:
+        datastore.flushdb()
+        shutil.rmtree(work_directory)
+    report['finished'] = datetime.datetime.now().isoformat()
+    return report
+
+def compare(report,baseline,threshold=REGRESSION_THRESHOLD):
+    """
+    Function compares a benchmark report to a baseline report, returns
+    a list of regressions where ops_per_second dropped by more than
+    the threshold
+
+    :param report: Benchmark report
+    :param baseline: Baseline benchmark report
+    :param threshold: Fraction of allowed slowdown, default is 0.2
+    """
+    baseline_results = {}
+    for result in baseline.get('results',[]):
+        baseline_results[(result['name'],result['scale'])] = result
+    regressions = []
+    for result in report['results']:
+        previous = baseline_results.get((result['name'],result['scale']))
+        if previous is None or not previous.has_key('ops_per_second'):
+            continue
+        if not result.has_key('ops_per_second'):
+            regressions.append("{0} at {1}: {2}".format(result['name'],
+                                                        result['scale'],
+                                                        result.get('error')))
+            continue
+        floor = previous['ops_per_second']*(1.0-threshold)
+        if result['ops_per_second'] < floor:
+            regressions.append("{0} at {1}: {2} ops/sec, baseline {3}".format(result['name'],
+                                                                              result['scale'],
+                                                                              result['ops_per_second'],
+                                                                              previous['ops_per_second']))
+    return regressions
+
+def main(argv=None):
+    parser = optparse.OptionParser()
+    parser.add_option('--scales',
+                      default=','.join([str(x) for x in DEFAULT_SCALES]),
+                      help="Comma separated record counts")
+    parser.add_option('--only',
+                      default=None,
+                      help="Comma separated benchmark names")
+    parser.add_option('--output',
+                      default='benchmark-results.json',
+                      help="JSON results file")
+    parser.add_option('--compare',
+                      default=None,
+                      help="Baseline JSON results file")
+    parser.add_option('--threshold',
+                      type='float',
+                      default=REGRESSION_THRESHOLD)
+    parser.add_option('--host',
+                      default=None,
+                      help="Host of the Redis server for the benchmarks")
+    parser.add_option('--port',
+                      type='int',
+                      default=6379)
+    parser.add_option('--db',
+                      type='int',
+                      default=None,
+                      help="Empty Redis database, flushed by the benchmarks")
+    parser.add_option('--fakeredis',
+                      action='store_true',
+                      default=False)
+    options,args = parser.parse_args(argv)
+    connection = None
+    if not options.fakeredis:
+        if options.host is None or options.db is None:
+            parser.error("--host and --db of an empty Redis database, or --fakeredis, are required")
+        connection = {'host':options.host,
+                      'port':options.port,
+                      'db':options.db}
+    names = None
+    if options.only is not None:
+        names = options.only.split(",")
+    try:
+        report = run([int(x) for x in options.scales.split(",")],
+                     names,
+                     connection)
+    except ValueError,e:
+        sys.stderr.write("{0}\n".format(e))
+        return 2
+    json.dump(report,open(options.output,'wb'),indent=2)
+    print("Benchmark results saved to {0}".format(options.output))
+    if options.compare is not None:
+        regressions = compare(report,
+                              json.load(open(options.compare,'rb')),
+                              options.threshold)
+        for regression in regressions:
+            print("REGRESSION {0}".format(regression))
+        if len(regressions) > 0:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,176 @@
+"""
+ :mod:`marc_generator` Generates synthetic MARC21 records for benchmarking
+ the ingest, call number, title search, vendor job and order apps
+"""
+__author__ = "Jeremy Nelson"
+
+import random
+import pymarc
+from pymarc import Field
+
+WORDS = ['adventure','american','art','century','children','city','colorado',
+         'culture','democracy','economic','empire','environment','europe',
+         'family','frontier','garden','history','house','introduction',
+         'language','letters','life','literature','mountain','music','nature',
+         'new','night','philosophy','poems','policy','politics','religion',
+         'river','science','society','stories','study','theory','war','water',
+         'west','women','world','writing','year']
+
+SURNAMES = ['Adams','Baker','Chavez','Dawson','Ellis','Fischer','Garcia',
+            'Hughes','Ito','Jensen','Kowalski','Lopez','Martin','Nguyen',
+            "O'Brien",'Patel','Quinn','Rossi','Schmidt','Tanaka']
+
+FORENAMES = ['Ann','Carlos','Dana','Emil','Grace','Henry','Jane','Kenji',
+             'Maria','Paul','Ruth','Samuel']
+
+SUBJECTS = ['Mountains','Rivers','Women authors','Economic history',
+            'Civil rights','Architecture','Ecology','Music theory']
+
+LC_CLASSES = ['B','BF','D','DA','E','F','GV','HD','HQ','JK','LB','ML',
+              'N','NA','PN','PR','PS','QA','QH','Z']
+
+
+def call_number(rand):
+    """
+    Returns a random Library of Congress call number
+
+    :param rand: random.Random instance
+    """
+    return "{0}{1}{2} .{3}{4} {5}".format(rand.choice(LC_CLASSES),
+                                         rand.randint(1,9999),
+                                         rand.choice(['','.5','.25']),
+                                         rand.choice('ABCDEFGHJKLMNPRSTW'),
+                                         rand.randint(10,999),
+                                         rand.randint(1900,2012))
+
+def title(rand):
+    """
+    Returns a random title
+
+    :param rand: random.Random instance
+    """
+    words = [rand.choice(WORDS) for i in range(rand.randint(2,6))]
+    return ' '.join(words).capitalize()
+
+def synthetic_record(number,rand=None):
+    """
+    Function returns a synthetic MARC21 bibliographic record with the
+    fields used by the rdaCore ingest, call number, title search, vendor
+    jobs and the order app. Records are repeatable for the same number.
+
+    :param number: Record number, used for the 001, 907 and 995
+    :param rand: Optional random.Random instance, default seeds with number
+    """
+    if rand is None:
+        rand = random.Random(number)
+    year = rand.randint(1900,2012)
+    record = pymarc.Record()
+    record.leader = '00000nam a2200000 a 4500'
+    record.add_field(Field(tag='001',data='ebr{0:08d}'.format(number)))
+    record.add_field(Field(tag='006',data='m        d        '))
+    record.add_field(Field(tag='007',data='cr cn |||m|||a'))
+    record.add_field(Field(tag='008',
+                           data='120101s{0}    xx      o     000 0 eng d'.format(year)))
+    record.add_field(Field(tag='020',
+                           indicators=[' ',' '],
+                           subfields=['a','978{0:010d} (electronic bk.)'.format(number)]))
+    record.add_field(Field(tag='035',
+                           indicators=[' ',' '],
+                           subfields=['a','.b{0:07d}x'.format(number)]))
+    record.add_field(Field(tag='040',
+                           indicators=[' ',' '],
+                           subfields=['a','YBP','c','YBP']))
+    record.add_field(Field(tag='050',
+                           indicators=[' ','4'],
+                           subfields=['a',call_number(rand)]))
+    record.add_field(Field(tag='082',
+                           indicators=['0','4'],
+                           subfields=['a','{0}.{1}'.format(rand.randint(0,999),
+                                                           rand.randint(0,99)),
+                                      '2','22']))
+    surname,forename = rand.choice(SURNAMES),rand.choice(FORENAMES)
+    record.add_field(Field(tag='100',
+                           indicators=['1',' '],
+                           subfields=['a','{0}, {1}.'.format(surname,forename)]))
+    record.add_field(Field(tag='245',
+                           indicators=['1','0'],
+                           subfields=['a','{0} /'.format(title(rand)),
+                                      'c','{0} {1}.'.format(forename,surname)]))
+    record.add_field(Field(tag='246',
+                           indicators=['3',' '],
+                           subfields=['a',title(rand)]))
+    record.add_field(Field(tag='260',
+                           indicators=[' ',' '],
+                           subfields=['a','New York :',
+                                      'b','Example Press,',
+                                      'c','c{0}.'.format(year)]))
+    record.add_field(Field(tag='300',
+                           indicators=[' ',' '],
+                           subfields=['a','{0} p.'.format(rand.randint(40,900))]))
+    record.add_field(Field(tag='490',
+                           indicators=['1',' '],
+                           subfields=['a','Example series ;','v','vol. {0}'.format(rand.randint(1,50))]))
+    record.add_field(Field(tag='506',
+                           indicators=[' ',' '],
+                           subfields=['a','Access limited to subscribers.']))
+    record.add_field(Field(tag='538',
+                           indicators=[' ',' '],
+                           subfields=['a','Mode of access: World Wide Web.']))
+    record.add_field(Field(tag='650',
+                           indicators=[' ','0'],
+                           subfields=['a',rand.choice(SUBJECTS),
+                                      'z',rand.choice(['Colorado','France','Japan'])]))
+    record.add_field(Field(tag='710',
+                           indicators=['2',' '],
+                           subfields=['a','Ebrary, Inc.']))
+    record.add_field(Field(tag='776',
+                           indicators=['0','8'],
+                           subfields=['i','Print version:','z','0{0:09d}'.format(number)]))
+    record.add_field(Field(tag='830',
+                           indicators=[' ','0'],
+                           subfields=['a','Example series ;','v','v. {0}'.format(rand.randint(1,50))]))
+    record.add_field(Field(tag='856',
+                           indicators=['4','0'],
+                           subfields=['u','http://www.springerlink.com/10.1007/978-{0}'.format(number),
+                                      'z','Click to view']))
+    record.add_field(Field(tag='907',
+                           indicators=[' ',' '],
+                           subfields=['a','.b{0:07d}x'.format(number)]))
+    if number%2:
+        invoice = 'Inv# PCARD {0}A'.format(number)
+    else:
+        invoice = 'Inv# {0}A'.format(number)
+    record.add_field(Field(tag='995',
+                           indicators=[' ',' '],
+                           subfields=['a','{0} Dated:0{1}-1{2}-12 Amt:${3}.{4:02d} On:0{1}-2{2}-12 Voucher#{5}'.format(
+                               invoice,
+                               rand.randint(1,9),
+                               rand.randint(0,9),
+                               rand.randint(1,500),
+                               rand.randint(0,99),
+                               rand.randint(1000,1100))]))
+    return record
+
+def generate_records(count,start=1):
+    """
+    Generator yields count synthetic MARC21 records
+
+    :param count: Number of records
+    :param start: Starting record number, default is 1
+    """
+    for number in xrange(start,start+count):
+        yield synthetic_record(number)
+
+def write_marc_file(file_location,count,start=1):
+    """
+    Function writes count synthetic MARC21 records to a file
+
+    :param file_location: Path to MARC file
+    :param count: Number of records
+    :param start: Starting record number, default is 1
+    """
+    marc_file = open(file_location,'wb')
+    for record in generate_records(count,start):
+        marc_file.write(record.as_marc())
+    marc_file.close()
+    return file_location
@@ -1,16 +1,18 @@
-import redis
+from aristotle.lib.datastores import get_datastore,get_read_datastore
 APP = {'current_view': {'title':'Call Number'},
        'description': 'The Call Number Search App provides a typeahead Call Number search and a browse shelf widget. ',
        'icon_url':'call_number_search.png',
        'url':'call_number/'}
 
 SEED_RECORD_ID = 'rdaCore:Expression:280'
-try:
-    import aristotle.settings as settings
-    REDIS_HOST = settings.REDIS_MASTER_HOST
-    REDIS_PORT = settings.REDIS_MASTER_PORT
-except:
-    # Setup for local development
-    REDIS_HOST = '127.0.0.1'
-    REDIS_PORT = 6379
-REDIS_SERVER = redis.StrictRedis(host=REDIS_HOST,port=REDIS_PORT)
+REDIS_SERVER = get_datastore('master')
+# Seconds a replica may lag before browse and typeahead reads go to the
+# master, set REDIS_REPLICAS in the settings to use replicas
+MAX_REPLICA_LAG = 60
+READ_REDIS_SERVER = get_read_datastore('master',MAX_REPLICA_LAG)
+# Width numbers are zero-padded to in SuDoc and local call number sort keys
+CALL_NUMBER_WIDTH = 6
+# Local call number schemes in shelf order, local call numbers matching a
+# scheme's pattern shelve together before the call numbers that don't
+# match any scheme, i.e. [('media',r'^(CD|DVD|VHS)\b')]
+LOCAL_SCHEMES = []
@@ -3,9 +3,12 @@
 """
 import pymarc,redis,re
 import logging,sys
-from app_settings import APP,SEED_RECORD_ID,REDIS_SERVER
+from app_settings import APP,SEED_RECORD_ID,READ_REDIS_SERVER
+from app_settings import CALL_NUMBER_WIDTH,LOCAL_SCHEMES
+from RDACore.entity_storage import get_element,get_title_labels
 
-redis_server = REDIS_SERVER
+# Module functions only read, ingest functions are passed the master
+redis_server = READ_REDIS_SERVER
 
 english_alphabet = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H', 
                     'I', 'J', 'K', 'L', 'M', 'N', 'O', 'P', 
@@ -15,6 +18,11 @@ english_alphabet = ['A', 'B', 'C', 'D', 'E', 'F', 'G', 'H',
 lccn_first_cutter_re = re.compile(r"^(\D+)(\d+)")
 #lc_regex = re.compile(r"^(?P<leading>[A-Z]{1,3})(?P<number>\d{1,4}.?\w{0,1}\d*)\s*(?P<decimal>[.|\w]*\d*)\s*(?P<cutter1alpha>\w*)\s*(?P<last>\d*)")
 lc_regex = re.compile(r"^(?P<leading>[A-Z]{1,3})(?P<number>\d{1,4}.?\d{0,1}\d*)\s*(?P<cutter1>[.|\w]*\d*)\s*(?P<cutter2>\w*)\s*(?P<last>\d*)")
+dewey_regex = re.compile(r"^(?P<number>\d{1,3})(\.(?P<decimal>\d+))?\s*(?P<cutter>.*)$")
+sort_token_re = re.compile(r"(\d+)|([A-Z]+)|([:./-])")
+# SuDoc separators file in the order colon, dash, period, slash
+SUDOC_SEPARATORS = {':':'!','-':'-','.':'.','/':'/'}
+CALL_NUMBER_TYPES = ['lccn','sudoc','dewey','local']
    
 def get_all(call_number,slice_size=10):
     """
@@ -25,21 +33,13 @@ def get_all(call_number,slice_size=10):
     :param slice_size: Slice size, default is 10
     :rtype list: List of call numbers
     """
-    lccn_rank = redis_server.zrank('lccn-sort-set',call_number)
-    if lccn_rank is not None:
-        return redis_server.zrange('lccn-sort-set',
-                                   lccn_rank-slice_size,
-                                   lccn_rank+slice_size)
-    sudoc_rank = redis_server.zrank('sudoc-sort-set',call_number)
-    if sudoc_rank is not None:
-        return redis_server.zrange('sudoc-sort-set',
-                                   sudoc_rank-slice_size,
-                                   sudo_rank+slice_size)
-    local_rank = redis_server.zrank('local-sort-set',call_number)
-    if local_rank is not None:
-        return redis_server.zrange('local-sort-set',
-                                   local_rank-slice_size,
-                                   local_rank+slice_size)
+    for call_number_type in CALL_NUMBER_TYPES:
+        sort_set = '{0}-sort-set'.format(call_number_type)
+        rank = redis_server.zrank(sort_set,call_number)
+        if rank is not None:
+            return redis_server.zrange(sort_set,
+                                       max(rank-slice_size,0),
+                                       rank+slice_size)
         
 
 
@@ -50,7 +50,7 @@ def get_previous(call_number,
     param call_number using the get_slice method.
 
     :param call_number: Call Number String
-    :param call_number_type: Type of call number (lccn, sudoc, or local)
+    :param call_number_type: Type of call number (lccn, sudoc, dewey, or local)
     :rtype list: List of two records 
     """
     current_rank = get_rank(call_number,
@@ -68,7 +68,7 @@ def get_next(call_number,
     param call_number using the get_slice method.
 
     :param call_number: Call Number String
-    :param call_number_type: Type of call number (lccn, sudoc, or local)
+    :param call_number_type: Type of call number (lccn, sudoc, dewey, or local)
     :rtype list: List of two records 
     """
     current_rank = get_rank(call_number,
@@ -83,11 +83,11 @@ def get_rank(call_number,
              call_number_type='lccn'):
     """
     Function takes a call_number, iterates through Redis datastore hash values
-    for lccn, sudoc, and local, and if call_number is present returns the
-    rank from the sorted set.
+    for lccn, sudoc, dewey, and local, and if call_number is present returns
+    the rank from the sorted set.
 
     :param call_number: Call Number String
-    :param call_number_type: Type of call number (lccn, sudoc, or local)
+    :param call_number_type: Type of call number (lccn, sudoc, dewey, or local)
     :rtype integer or None:
     """
     print("{0}-hash {1}".format(call_number_type,call_number))
@@ -95,7 +95,7 @@ def get_rank(call_number,
                             call_number):
         entity_key = redis_server.hget("{0}-hash".format(call_number_type),
                                        call_number)
-        entity_idents = redis_server.hgetall("{0}:identifiers".format(entity_key))
+        entity_idents = get_element(redis_server,entity_key,'identifiers') or {}
         if entity_idents.has_key("{0}-normalized".format(call_number_type)):
             current_rank = redis_server.zrank('{0}-sort-set'.format(call_number_type),
                                               entity_idents["{0}-normalized".format(call_number_type)])
@@ -112,8 +112,8 @@ def get_slice(start,stop,
 
     :param start: Beginning of slice of sorted call number
     :param stop: End of slice of sorted call numbers
-    :param call_number_type: Type of call number (lccn, sudoc, or local), defaults
-                             to lccn.
+    :param call_number_type: Type of call number (lccn, sudoc, dewey, or local),
+                             defaults to lccn.
     :rtype: List of entities saved as Redis records
     """
     entities = []
@@ -121,13 +121,15 @@ def get_slice(start,stop,
                                        start,
                                        stop)
     for number in record_slice:
-        if call_number_type == 'lccn':
-            entity_key = redis_server.hget('lccn-normalized-hash',number)
-        else:
+        # Sort sets hold normalized call numbers, older SuDoc and local
+        # sort sets hold the raw call numbers
+        entity_key = redis_server.hget('{0}-normalized-hash'.format(call_number_type),
+                                       number)
+        if entity_key is None:
             entity_key = redis_server.hget('{0}-hash'.format(call_number_type),
                                            number)
-        call_number = redis_server.hget('{0}:identifiers'.format(entity_key),
-                                        call_number_type)
+        identifiers = get_element(redis_server,entity_key,'identifiers') or {}
+        call_number = identifiers.get(call_number_type)
         record = get_record(call_number=call_number)
         entities.append(record)
     return entities
@@ -135,7 +137,7 @@ def get_slice(start,stop,
 def get_record(**kwargs):
     call_number = kwargs.get('call_number')
     record_info = {'call_number':call_number}
-    for hash_base in ['lccn','sudoc','local']:
+    for hash_base in CALL_NUMBER_TYPES:
         hash_name = '{0}-hash'.format(hash_base)
         if redis_server.hexists(hash_name,call_number):
             record_info['type_of'] = hash_base
@@ -144,10 +146,8 @@ def get_record(**kwargs):
                                                   'rdaManifestationOfExpression')
             record_info['bib_number'] = redis_server.hget(manifestation_key,
                                                           'legacy-bib-number')
-            title_list = list(redis_server.smembers(redis_server.hget(manifestation_key,
-                                                                 'rdaTitle')))
-            title_list.reverse()
-            record_info['rdaTitle'] = u''.join([x.decode('utf-8','ignore') for x in title_list])
+            title_label = get_title_labels(redis_server,[manifestation_key])[0] or ''
+            record_info['rdaTitle'] = title_label.decode('utf-8','ignore')
             work_key = redis_server.hget(manifestation_key,
                                          'rdaWorkManifested')
             if redis_server.hexists(work_key,
@@ -182,7 +182,7 @@ def get_set_callnumbers(marc_record,
                         redis_server,
                         redis_key):
     """
-    Sets sudoc, lc, and local call numbers from the MARC record values
+    Sets sudoc, lc, dewey, and local call numbers from the MARC record values
  
     :param marc_record: MARC21 record
     :param redis_server: Redis Server
@@ -194,11 +194,11 @@ def get_set_callnumbers(marc_record,
     sudoc_field = marc_record['086']
     if sudoc_field is not None:
         call_number = sudoc_field.value()
-        quick_set_callnumber(identifiers_key,
-                             "sudoc",
-                             call_number,
-                             redis_server,
-                             redis_key)
+        callnumber_set(identifiers_key,
+                       "sudoc",
+                       call_number,
+                       redis_server,
+                       redis_key)
     lccn_field = marc_record['050']
     if lccn_field is not None:
         call_number = lccn_field.value()
@@ -216,19 +216,34 @@ def get_set_callnumbers(marc_record,
                      redis_server,
                      redis_key)
         else:
-            quick_set_callnumber(identifiers_key,
-                                 "local",
-                                 call_number,
-                                 redis_server,
-                                 redis_key)
+            callnumber_set(identifiers_key,
+                           "local",
+                           call_number,
+                           redis_server,
+                           redis_key)
     local_099 = marc_record['099']
     if local_099 is not None:
         call_number = local_099.value()
-        quick_set_callnumber(identifiers_key,
-                             "local",
-                             call_number,
-                             redis_server,
-                             redis_key)
+        callnumber_set(identifiers_key,
+                       "local",
+                       call_number,
+                       redis_server,
+                       redis_key)
+    # Locally assigned Dewey numbers in the 092 are used without an 082,
+    # only the first $a is the classification number, later ones are
+    # alternative numbers
+    dewey_field = marc_record['082']
+    if dewey_field is None:
+        dewey_field = marc_record['092']
+    if dewey_field is not None and dewey_field['a'] is not None:
+        call_number = ' '.join([part for part in [dewey_field['a'],dewey_field['b']]
+                                if part is not None])
+        if len(call_number) > 0:
+            callnumber_set(identifiers_key,
+                           "dewey",
+                           call_number,
+                           redis_server,
+                           redis_key)
         
     
 def ingest_call_numbers(marc_record,redis_server,entity_key):
@@ -236,7 +251,7 @@ def ingest_call_numbers(marc_record,redis_server,entity_key):
     `ingest_call_numbers` function takes a MARC record and
     a RDACore FRBR Redis Expression or Manifestation key, ingests the
     record and depending on the call number type (currently using
-    three types of call numbers; LCCN, SuDoc, and local)
+    four types of call numbers; LCCN, SuDoc, Dewey, and local)
     associates the call number to the entity key in a
     hash and then adds the call number to a sorted set, with
     the weight score using a custom sort algorithm depending
@@ -247,7 +262,36 @@ def ingest_call_numbers(marc_record,redis_server,entity_key):
     :param entity_key: Redis FRBR RDACore Entity key
     """
     get_set_callnumbers(marc_record,redis_server,entity_key)
-    
+
+def remove_call_numbers(redis_server,entity_key):
+    """
+    `remove_call_numbers` function is the inverse of `ingest_call_numbers`,
+    removes the entity's call numbers from the call number hashes and
+    sorted sets so that a re-ingested or deleted record no longer shows
+    up when browsing.
+
+    :param redis_server: Redis Server
+    :param entity_key: Redis FRBR RDACore Entity key
+    """
+    identifiers = get_element(redis_server,entity_key,'identifiers') or {}
+    call_number_pipeline = redis_server.pipeline()
+    for call_number_type in CALL_NUMBER_TYPES:
+        if not identifiers.has_key(call_number_type):
+            continue
+        call_number = identifiers.get(call_number_type)
+        call_number_pipeline.hdel('{0}-hash'.format(call_number_type),
+                                  call_number)
+        normalized_key = '{0}-normalized'.format(call_number_type)
+        if identifiers.has_key(normalized_key):
+            call_number_pipeline.hdel('{0}-normalized-hash'.format(call_number_type),
+                                      identifiers.get(normalized_key))
+            call_number_pipeline.zrem('{0}-sort-set'.format(call_number_type),
+                                      identifiers.get(normalized_key))
+        else:
+            call_number_pipeline.zrem('{0}-sort-set'.format(call_number_type),
+                                      call_number)
+    call_number_pipeline.execute()
+
 
 def search(query):
     set_rank = redis_server.zrank('call-number-sorted-search-set',query)
@@ -290,6 +334,127 @@ def lccn_normalize(raw_callnumber):
             cutter2 = cutter2.replace('.','')
             output +=  '{:<04}'.format(cutter2)
     return output
+
+def pad_sort_key(raw_callnumber,separators,width=CALL_NUMBER_WIDTH):
+    """
+    Function returns a sort key with the numbers in a call number
+    zero-padded to a fixed width so that numbers file numerically,
+    letters upper case, and separators replaced so they file in order.
+    Spaces between numbers and letters are ignored, i.e. G74 and G 74
+    have the same sort key.
+
+    :param raw_callnumber: Call number
+    :param separators: Dict of separator replacements
+    :param width: Width of numbers, default is CALL_NUMBER_WIDTH
+    """
+    output,last = '',None
+    for number,alpha,separator in sort_token_re.findall(raw_callnumber.upper()):
+        if len(separator) > 0:
+            output += separators.get(separator,separator)
+            last = None
+            continue
+        if last is not None:
+            output += ' '
+        if len(number) > 0:
+            output += number.zfill(width)
+        else:
+            output += alpha
+        last = number or alpha
+    return output
+
+def sudoc_normalize(raw_callnumber):
+    """
+    Function returns a sort key for a Superintendent of Documents
+    classification number, i.e. Y 4.G 74/7:SE 2/2 is
+    Y 000004.G 000074/000007!SE 000002/000002
+    """
+    output = pad_sort_key(raw_callnumber,SUDOC_SEPARATORS)
+    if len(output) < 1:
+        return None
+    return output
+
+def dewey_normalize(raw_callnumber):
+    """
+    Function returns a sort key for a Dewey Decimal classification number,
+    the whole number is zero-padded to three digits and the decimal and
+    Cutter number are left as is because they file as decimals. Prime
+    marks from the 082 are removed, i.e. 823/.914 is 823.914
+    """
+    callnumber = raw_callnumber.replace('/','').replace("'",'').strip()
+    dewey_result = dewey_regex.search(callnumber)
+    if dewey_result is None:
+        return None
+    dewey_result = dewey_result.groupdict()
+    output = '{:>03}'.format(dewey_result.get('number'))
+    if dewey_result.get('decimal') is not None:
+        output += '.{0}'.format(dewey_result.get('decimal'))
+    cutter = ' '.join(dewey_result.get('cutter').upper().replace('.',' ').split())
+    if len(cutter) > 0:
+        output += ' {0}'.format(cutter)
+    return output
+
+def local_normalize(raw_callnumber,schemes=LOCAL_SCHEMES):
+    """
+    Function returns a sort key for a local call number that starts with
+    the position of the first local scheme the call number matches, call
+    numbers that don't match a scheme file last
+
+    :param raw_callnumber: Local call number
+    :param schemes: List of (name,pattern) local schemes in shelf order,
+                    default is LOCAL_SCHEMES
+    """
+    position = len(schemes)
+    for i,(name,pattern) in enumerate(schemes):
+        if re.search(pattern,raw_callnumber,re.IGNORECASE) is not None:
+            position = i
+            break
+    output = pad_sort_key(raw_callnumber,{})
+    if len(output) < 1:
+        return None
+    return '{0:02} {1}'.format(position,output)
+
+NORMALIZERS = {'lccn':lccn_normalize,
+               'sudoc':sudoc_normalize,
+               'dewey':dewey_normalize,
+               'local':local_normalize}
+
+def callnumber_set(identifiers_key,
+                   call_number_type,
+                   call_number,
+                   redis_server,
+                   redis_key):
+    """
+    Sets hash and sorted set for normalized and raw call numbers, the
+    sorted set holds the normalized call numbers so a browse is a range
+    of the sorted set in shelf order. A call number that can't be
+    normalized is added as is.
+
+    :param identifiers_key: Key to the RDA Records rdaIdentifiersForTheExpression
+    :param call_number_type: lccn, sudoc, dewey, or local
+    :param call_number: Call number
+    :param redis_server: Redis Server
+    :param redis_key: Redis key
+    """
+    normalized_call_number = NORMALIZERS[call_number_type](call_number)
+    if normalized_call_number is None:
+        normalized_call_number = call_number
+    call_number_pipeline = redis_server.pipeline()
+    call_number_pipeline.hset(identifiers_key,
+                              call_number_type,
+                              call_number)
+    call_number_pipeline.hset(identifiers_key,
+                              '{0}-normalized'.format(call_number_type),
+                              normalized_call_number)
+    call_number_pipeline.hset('{0}-hash'.format(call_number_type),
+                              call_number,
+                              redis_key)
+    call_number_pipeline.hset('{0}-normalized-hash'.format(call_number_type),
+                              normalized_call_number,
+                              redis_key)
+    call_number_pipeline.zadd('{0}-sort-set'.format(call_number_type),
+                              0,
+                              normalized_call_number)
+    call_number_pipeline.execute()
         
 def lccn_set(identifiers_key,
              call_number,
@@ -304,20 +469,54 @@ def lccn_set(identifiers_key,
     :param redis_server: Redis Server
     :param redis_key: Redis key
     """
-    redis_server.hset(identifiers_key,
-                      'lccn',
-                      call_number)
-    normalized_call_number = lccn_normalize(call_number)
-    redis_server.hset(identifiers_key,
-                      'lccn-normalized',
-                      normalized_call_number)
-    redis_server.hset('lccn-hash',call_number,redis_key)
-    redis_server.hset('lccn-normalized-hash',
-                      normalized_call_number,
-                      redis_key)
-    redis_server.zadd('lccn-sort-set',
-                      0,
-                      normalized_call_number)
+    callnumber_set(identifiers_key,
+                   'lccn',
+                   call_number,
+                   redis_server,
+                   redis_key)
     
     
     
+
+def normalize_call_numbers(redis_server,call_number_types=['sudoc','local']):
+    """
+    Function re-normalizes the call numbers of existing entities, for
+    migrating a datastore with SuDoc and local sort sets of raw call
+    numbers or after a change to a normalizer, i.e. to LOCAL_SCHEMES.
+    Raw and outdated normalized call numbers are replaced in the sort set
+    with the current normalized call numbers.
+
+    :param redis_server: Redis datastore
+    :param call_number_types: Call number types, default is sudoc and local
+    :rtype int: Number of call numbers re-normalized
+    """
+    changed = 0
+    for call_number_type in call_number_types:
+        sort_set = '{0}-sort-set'.format(call_number_type)
+        normalized_hash = '{0}-normalized-hash'.format(call_number_type)
+        normalized_key = '{0}-normalized'.format(call_number_type)
+        call_numbers = redis_server.hgetall('{0}-hash'.format(call_number_type))
+        for call_number,redis_key in call_numbers.iteritems():
+            identifiers_key = redis_server.hget(redis_key,'identifiers') or\
+                              '{0}:identifiers'.format(redis_key)
+            old_normalized = redis_server.hget(identifiers_key,normalized_key)
+            normalized_call_number = NORMALIZERS[call_number_type](call_number) or\
+                                     call_number
+            if old_normalized == normalized_call_number:
+                continue
+            call_number_pipeline = redis_server.pipeline()
+            if old_normalized is None:
+                # Raw call number unless it is another entity's sort key
+                if redis_server.hget(normalized_hash,call_number) is None:
+                    call_number_pipeline.zrem(sort_set,call_number)
+            elif redis_server.hget(normalized_hash,old_normalized) == redis_key:
+                call_number_pipeline.zrem(sort_set,old_normalized)
+                call_number_pipeline.hdel(normalized_hash,old_normalized)
+            call_number_pipeline.execute()
+            callnumber_set(identifiers_key,
+                           call_number_type,
+                           call_number,
+                           redis_server,
+                           redis_key)
+            changed += 1
+    return changed
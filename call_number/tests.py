@@ -2,9 +2,22 @@
  mod:`tests` Unit tests for Call Number Application
 """
 __author__ = "Jeremy Nelson"
+import redis
 from django.test import TestCase
 from django.test.client import Client
-from redis_helpers import lccn_normalize
+from redis_helpers import lccn_normalize,sudoc_normalize,dewey_normalize
+from redis_helpers import local_normalize,get_set_callnumbers
+from redis_helpers import normalize_call_numbers
+import pymarc
+from aristotle.settings import REDIS_TEST_DB
+from aristotle.lib.datastores import configure_datastore,configure_replicas
+from aristotle.lib.datastores import get_read_datastore,reset_datastores
+from aristotle.lib.datastores import get_pool_key,get_replica_connections
+from aristotle.lib.datastores import get_replica_lag,replica_status
+from aristotle.lib.common import BaseModel,get_cached_schema,get_private_dir
+import os,shutil,tempfile,time
+
+test_ds = redis.StrictRedis(db=REDIS_TEST_DB)
 
 web_client = Client()
 
@@ -26,7 +39,245 @@ class LCCNNormalizeTest(TestCase):
                           lccn_normalize('C1.D11'))
         self.assertEquals('D 001540D220 000 000 1990',
                           lccn_normalize('D15.4 .D22 1990'))
-                          
-        
-    
-        
+
+class SuDocNormalizeTest(TestCase):
+
+    def test_normalization(self):
+        self.assertEquals('Y 000004.G 000074/000007!SE 000002/000002',
+                          sudoc_normalize('Y 4.G 74/7:SE 2/2'))
+        self.assertEquals(sudoc_normalize('Y 4.G74/7:SE2/2'),
+                          sudoc_normalize('Y 4.G 74/7:SE 2/2'))
+
+    def test_shelf_order(self):
+        shelf = ['A 1.2:',
+                 'A 1.2/2:',
+                 'A 1.10:',
+                 'A 13.2:F 76',
+                 'Y 4.G 74/7:SE 2/2',
+                 'Y 4.G 74/7:SE 2/10']
+        self.assertEquals(sorted(shelf,key=sudoc_normalize),
+                          shelf)
+
+class DeweyNormalizeTest(TestCase):
+
+    def test_normalization(self):
+        self.assertEquals('005.133 P99L',
+                          dewey_normalize('5.133 P99l'))
+        self.assertEquals('823.914 F123A 1990',
+                          dewey_normalize("823/.914 .F123a 1990"))
+        self.assertEquals(None,
+                          dewey_normalize('[E]'))
+
+    def test_shelf_order(self):
+        shelf = ['5.133 P99l',
+                 '92 L45',
+                 '813.54',
+                 '823 F123',
+                 '823.1',
+                 '823.914']
+        self.assertEquals(sorted(shelf,key=dewey_normalize),
+                          shelf)
+
+class LocalNormalizeTest(TestCase):
+
+    def test_normalization(self):
+        self.assertEquals('00 CD 000012',
+                          local_normalize('CD12'))
+        self.assertEquals('01 CD 000012',
+                          local_normalize('CD 12',
+                                          [('media',r'^(DVD|VHS)')]))
+        self.assertEquals('00 DVD 000002',
+                          local_normalize('dvd 2',
+                                          [('media',r'^(DVD|VHS)')]))
+
+    def test_get_set_callnumbers(self):
+        marc_record = pymarc.Record()
+        marc_record.add_field(pymarc.Field(tag='082',
+                                           indicators=['0','4'],
+                                           subfields=['a','823/.914',
+                                                      'a','823/.92',
+                                                      'b','F123']))
+        marc_record.add_field(pymarc.Field(tag='099',
+                                           indicators=[' ',' '],
+                                           subfields=['a','DVD 10']))
+        get_set_callnumbers(marc_record,test_ds,'rdaCore:Expression:1')
+        self.assertEquals(test_ds.zrange('dewey-sort-set',0,-1),
+                          ['823.914 F123'])
+        self.assertEquals(test_ds.hget('dewey-normalized-hash','823.914 F123'),
+                          'rdaCore:Expression:1')
+        self.assertEquals(test_ds.hget('rdaCore:Expression:1:identifiers','local-normalized'),
+                          '00 DVD 000010')
+
+    def test_normalize_call_numbers(self):
+        # SuDoc call number ingested before the sort sets were normalized
+        test_ds.hset('rdaCore:Expression:2','identifiers','rdaCore:Expression:2:identifiers')
+        test_ds.hset('rdaCore:Expression:2:identifiers','sudoc','Y 4.G 74/7:SE 2/2')
+        test_ds.hset('sudoc-hash','Y 4.G 74/7:SE 2/2','rdaCore:Expression:2')
+        test_ds.zadd('sudoc-sort-set',0,'Y 4.G 74/7:SE 2/2')
+        self.assertEquals(normalize_call_numbers(test_ds),1)
+        self.assertEquals(test_ds.zrange('sudoc-sort-set',0,-1),
+                          ['Y 000004.G 000074/000007!SE 000002/000002'])
+        self.assertEquals(test_ds.hget('sudoc-normalized-hash',
+                                       'Y 000004.G 000074/000007!SE 000002/000002'),
+                          'rdaCore:Expression:2')
+        self.assertEquals(normalize_call_numbers(test_ds),0)
+
+    def tearDown(self):
+        test_ds.flushdb()
+
+class ReadDatastoreTest(TestCase):
+
+    def setUp(self):
+        configure_datastore('call-number-test',db=REDIS_TEST_DB)
+        test_ds.set('global:rdaCore:Work',5)
+        self.read_ds = get_read_datastore('call-number-test',60)
+
+    def test_replica(self):
+        configure_replicas('call-number-test',{'host':'localhost'})
+        self.assertEquals(self.read_ds.choose()['host'],
+                          'localhost')
+        self.assertEquals(self.read_ds.get('global:rdaCore:Work'),
+                          '5')
+
+    def test_replica_down(self):
+        configure_replicas('call-number-test',{'port':1})
+        self.assertEquals(self.read_ds.choose(),None)
+        self.assertEquals(self.read_ds.get('global:rdaCore:Work'),
+                          '5')
+
+    def test_no_replicas(self):
+        configure_replicas('call-number-test')
+        self.assertEquals(self.read_ds.choose(),None)
+        self.assertEquals(self.read_ds.get('global:rdaCore:Work'),
+                          '5')
+
+    def test_pipeline(self):
+        configure_replicas('call-number-test',{'host':'localhost'})
+        read_pipeline = self.read_ds.pipeline()
+        read_pipeline.get('global:rdaCore:Work').exists('global:rdaCore:Item')
+        self.assertEquals(read_pipeline.execute(),['5',False])
+        self.assertEquals(len(read_pipeline),0)
+
+    def test_pipeline_replica_fails(self):
+        # Replica passed its last check but is down for the execute
+        configure_replicas('call-number-test',{'port':1})
+        replica = get_replica_connections('call-number-test')[0]
+        replica_status[get_pool_key(replica)] = (time.time(),0)
+        read_pipeline = self.read_ds.pipeline()
+        self.assertEquals(read_pipeline.connection['port'],1)
+        read_pipeline.get('global:rdaCore:Work')
+        self.assertEquals(read_pipeline.execute(),['5'])
+        self.assertEquals(get_replica_lag(replica),None)
+
+    def test_writes(self):
+        self.assertRaises(ValueError,getattr,self.read_ds,'set')
+        self.assertRaises(ValueError,self.read_ds.sort,'global:rdaCore:Work',store='copy')
+        self.assertRaises(ValueError,getattr,self.read_ds.pipeline(),'zadd')
+
+    def tearDown(self):
+        reset_datastores()
+        test_ds.flushdb()
+
+class SchemaCacheTest(TestCase):
+
+    def setUp(self):
+        self.cache_dir = os.path.join(tempfile.mkdtemp(),'schema-cache')
+        self.extracted = []
+
+    def extract(self,raw_source):
+        self.extracted.append(raw_source)
+        return [('Work',{'redis_key':'frbr_rda:Work',
+                         'title':None})]
+
+    def test_cache_hit(self):
+        schema = get_cached_schema('test',['<xml/>'],self.extract,self.cache_dir)
+        self.assertEquals(get_cached_schema('test',['<xml/>'],self.extract,self.cache_dir),
+                          schema)
+        self.assertEquals(self.extracted,['<xml/>'])
+        self.assertEquals(type(schema[0][0]),str)
+        self.assertEquals(os.stat(self.cache_dir).st_mode & 0777,0700)
+
+    def test_stale_cache(self):
+        get_cached_schema('test',['<xml/>'],self.extract,self.cache_dir)
+        get_cached_schema('test',['<xml version="2"/>'],self.extract,self.cache_dir)
+        self.assertEquals(self.extracted,['<xml/>','<xml version="2"/>'])
+
+    def test_corrupt_cache(self):
+        get_private_dir(self.cache_dir)
+        for raw_cache in ['cos\nsystem\n(S"echo"\ntR.',
+                          '{"digest":"x","schema":[["Work",5]]}']:
+            cache_file = open(os.path.join(self.cache_dir,'test.json'),'wb')
+            cache_file.write(raw_cache)
+            cache_file.close()
+            self.assertEquals(get_cached_schema('test',['<xml/>'],self.extract,self.cache_dir),
+                              self.extract('<xml/>'))
+        self.assertEquals(len(self.extracted),4)
+
+    def test_shared_cache_dir(self):
+        get_private_dir(self.cache_dir)
+        os.chmod(self.cache_dir,0777)
+        get_cached_schema('test',['<xml/>'],self.extract,self.cache_dir)
+        self.assertEquals(os.listdir(self.cache_dir),[])
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.cache_dir))
+
+class TestEntity(BaseModel):
+    redis_key = 'rdaCore:TestEntity'
+
+class BaseModelTest(TestCase):
+
+    def test_flush(self):
+        entity = TestEntity(redis_server=test_ds,
+                            unit_of_work=True,
+                            title='Roughing It')
+        entity.set_property('subjects',['Nevada','Mining camps'])
+        self.assertEquals(test_ds.hgetall(entity.frbr_key),{})
+        entity.flush()
+        self.assertEquals(test_ds.hget(entity.frbr_key,'title'),'Roughing It')
+        self.assertEquals(test_ds.smembers(entity.get_property('subjects')),
+                          set(['Nevada','Mining camps']))
+
+    def test_flush_in_pipeline(self):
+        entity = TestEntity(redis_server=test_ds,
+                            unit_of_work=True,
+                            title='Roughing It')
+        pipeline = test_ds.pipeline()
+        entity.flush(pipeline)
+        self.assertEquals(test_ds.hgetall(entity.frbr_key),{})
+        pipeline.execute()
+        self.assertEquals(test_ds.hget(entity.frbr_key,'title'),'Roughing It')
+
+    def test_set_property(self):
+        entity = TestEntity(redis_server=test_ds,unit_of_work=True)
+        entity.set_property('title',['Roughing It','Innocents Abroad'])
+        entity.set_property('title','Roughing It')
+        entity.flush()
+        self.assertEquals(test_ds.hget(entity.frbr_key,'title'),'Roughing It')
+        self.assertFalse(test_ds.exists('{0}:title'.format(entity.frbr_key)))
+
+    def test_bulk_create(self):
+        test_ds.set('global:rdaCore:TestEntity',5)
+        entities = TestEntity.bulk_create([{'title':'Roughing It'},
+                                           {'title':'Innocents Abroad'},
+                                           {'title':'Life on the Mississippi'}],
+                                          redis_server=test_ds,
+                                          batch_size=2)
+        self.assertEquals([entity.frbr_key for entity in entities],
+                          ['rdaCore:TestEntity:6',
+                           'rdaCore:TestEntity:7',
+                           'rdaCore:TestEntity:8'])
+        self.assertEquals(test_ds.get('global:rdaCore:TestEntity'),'8')
+        self.assertEquals(test_ds.hget('rdaCore:TestEntity:8','title'),
+                          'Life on the Mississippi')
+
+    def test_redis_ID(self):
+        entity = TestEntity(redis_server=test_ds,
+                            redis_ID=42,
+                            title='Roughing It')
+        self.assertEquals(entity.frbr_key,'rdaCore:TestEntity:42')
+        self.assertEquals(test_ds.get('global:rdaCore:TestEntity'),None)
+        self.assertEquals(test_ds.hget('rdaCore:TestEntity:42','title'),'Roughing It')
+
+    def tearDown(self):
+        test_ds.flushdb()
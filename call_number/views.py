@@ -13,18 +13,17 @@ from django.utils.translation import ugettext
 import aristotle.settings as settings
 import redis_helpers,sys,logging
 import redis_helpers 
-from app_settings import APP,SEED_RECORD_ID,REDIS_SERVER
+from app_settings import APP,SEED_RECORD_ID,READ_REDIS_SERVER
+from RDACore.entity_storage import get_element
 
-redis_server = REDIS_SERVER
+redis_server = READ_REDIS_SERVER
 
 def setup_seed_rec():
     """
     Helper function returns a record based on the SEED_RECORD_ID
     for the default view
     """
-    seed_rec = redis_server.hgetall(SEED_RECORD_ID)
-    ident_key = '{0}:identifiers'.format(SEED_RECORD_ID)
-    idents = redis_server.hgetall(ident_key)
+    idents = get_element(redis_server,SEED_RECORD_ID,'identifiers') or {}
     if idents.has_key('lccn'):
         current = redis_helpers.get_record(call_number=idents['lccn'])
     return current
@@ -0,0 +1,15 @@
+from aristotle.lib.datastores import get_datastore,get_read_datastore
+
+REDIS_SERVER = get_datastore('master')
+MANIFESTATION_REDIS = get_datastore('manifestation')
+# Seconds a replica may lag before creator typeahead reads go to the
+# master
+MAX_REPLICA_LAG = 300
+READ_REDIS_SERVER = get_read_datastore('master',MAX_REPLICA_LAG)
+# Number of works in a page of a creator's works
+WORKS_PAGE_SIZE = 20
+
+APP = {'current_view': {'title':'Creator Search'},
+       'description': 'The Creator Search App provides a typeahead Creator search and browse of a creator\'s works',
+       'icon_url':'creator_search.png',
+       'url':'creator_search/'}
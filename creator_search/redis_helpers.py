@@ -0,0 +1,379 @@
+"""
+ :mod:`redis_helpers` Creator Search Helper Utilities
+
+ The creator index merges the RDA Core Persons whose headings only differ
+ by case, punctuation, diacritics, or dates under one normalized name::
+
+   creator-name-hash              hash  normalized name -> first Person key
+   creator-label-hash             hash  normalized name -> display heading
+   creator-persons:{name}         set   Person keys with the normalized name
+   creator-metaphones:{metaphone} set   normalized names with a name part's
+                                        double metaphone
+   creator-completions            zset  prefixes of the normalized name and
+                                        its rotations for typeahead
+   creator-sort-set               zset  normalized names for author browse
+   person-works:{person}          zset  Manifestation keys of a Person's
+                                        Works scored by date
+
+ The completions sorted set has a score of 0 for every member so Redis
+ keeps the members in lexical order, a typeahead is a ZRANK of the prefix
+ followed by a ZRANGE of the entries after it. A complete entry ends with
+ a * and the normalized name, i.e. "mark twain*twain mark".
+"""
+__author__ = "Jeremy Nelson"
+
+import re,unicodedata,hashlib
+from redis.exceptions import ResponseError
+from RDACore.entity_storage import get_element,get_title_labels
+try:
+    import aristotle.lib.metaphone as metaphone
+except ImportError:
+    import metaphone
+
+CREATOR_NAME_HASH = 'creator-name-hash'
+CREATOR_LABEL_HASH = 'creator-label-hash'
+CREATOR_PERSONS_KEY = 'creator-persons:{0}'
+METAPHONE_KEY = 'creator-metaphones:{0}'
+COMPLETION_KEY = 'creator-completions'
+SORT_KEY = 'creator-sort-set'
+PERSON_WORKS_KEY = 'person-works:{0}'
+# Works of merged Persons are combined in a sorted set that expires after
+# CREATOR_WORKS_TTL seconds
+CREATOR_WORKS_KEY = 'creator-works:{0}'
+CREATOR_WORKS_TTL = 300
+# Number of completion entries read with each ZRANGE
+COMPLETION_BATCH = 50
+
+# Dates and date qualifiers in a heading, i.e. 1835-1910, b. 1942, fl. 1850
+dates_re = re.compile(r"\b(?:b|d|ca|fl|approximately)\.?\s*(?=\d)|\d{2,4}\??-?(?:\d{2,4}\??)?",
+                      re.UNICODE|re.IGNORECASE)
+punctuation_re = re.compile(r"[^\w\s]",re.UNICODE)
+
+
+def normalize_name(raw_name):
+    """
+    Function returns the normalized form of a name heading, lower case
+    name parts without diacritics, punctuation, or dates as a utf-8 string
+
+    :param raw_name: Name heading, i.e. Twain, Mark, 1835-1910.
+    """
+    if not isinstance(raw_name,unicode):
+        raw_name = raw_name.decode('utf8','ignore')
+    name = ''.join([char for char in unicodedata.normalize('NFKD',raw_name)
+                    if not unicodedata.combining(char)])
+    name = dates_re.sub(' ',name.lower())
+    name = punctuation_re.sub(' ',name)
+    return ' '.join(name.split()).encode('utf8')
+
+def get_metaphones(normalized_name):
+    """
+    Function returns the primary double metaphones of a normalized
+    name's parts
+
+    :param normalized_name: Normalized name
+    """
+    metaphones = []
+    for part in normalized_name.split(" "):
+        first_phonetic,second_phonetic = metaphone.dm(part.decode('utf8','ignore'))
+        if len(first_phonetic) > 0 and not first_phonetic in metaphones:
+            metaphones.append(first_phonetic)
+    return metaphones
+
+def get_rotations(normalized_name):
+    """
+    Function returns the normalized name starting with each of its name
+    parts, so Twain, Mark completes from either twain or mark
+
+    :param normalized_name: Normalized name
+    """
+    parts = normalized_name.split(" ")
+    return [' '.join(parts[i:]+parts[:i]) for i in range(len(parts))]
+
+def index_creator(redis_server,person_key,raw_name):
+    """
+    Function adds a Person to the creator index, returns the normalized
+    name or None for a heading without a name
+
+    :param redis_server: Redis datastore
+    :param person_key: RDA Core Person key
+    :param raw_name: Name heading
+    """
+    normalized_name = normalize_name(raw_name)
+    if len(normalized_name) < 1:
+        return None
+    creator_pipeline = redis_server.pipeline()
+    creator_pipeline.hsetnx(CREATOR_NAME_HASH,normalized_name,person_key)
+    creator_pipeline.hsetnx(CREATOR_LABEL_HASH,normalized_name,raw_name)
+    creator_pipeline.sadd(CREATOR_PERSONS_KEY.format(normalized_name),person_key)
+    creator_pipeline.zadd(SORT_KEY,0,normalized_name)
+    for phonetic in get_metaphones(normalized_name):
+        creator_pipeline.sadd(METAPHONE_KEY.format(phonetic),normalized_name)
+    for rotation in get_rotations(normalized_name):
+        completions = [rotation[:i] for i in range(1,len(rotation)+1)]
+        completions.append("{0}*{1}".format(rotation,normalized_name))
+        for completion in completions:
+            creator_pipeline.zadd(COMPLETION_KEY,0,completion)
+    creator_pipeline.execute()
+    return normalized_name
+
+def get_or_add_person(redis_server,raw_name):
+    """
+    Function returns the Person key for a name heading, a new Person is
+    only created if no Person has the same normalized name. A heading
+    without a name, i.e. only dates or punctuation, returns None.
+
+    :param redis_server: Redis datastore
+    :param raw_name: Name heading
+    """
+    normalized_name = normalize_name(raw_name)
+    if len(normalized_name) < 1:
+        return None
+    person_key = redis_server.hget(CREATOR_NAME_HASH,normalized_name)
+    if person_key is not None:
+        return person_key
+    person_key = "rdaCore:Person:{0}".format(redis_server.incr("global:rdaCore:Person"))
+    redis_server.hset(person_key,
+                      'rdaPreferredNameForThePerson',
+                      raw_name)
+    redis_server.hset('person-name-hash',
+                      raw_name,
+                      person_key)
+    index_creator(redis_server,person_key,raw_name)
+    return person_key
+
+def index_persons(redis_server):
+    """
+    Function adds all of the existing Persons to the creator index, for
+    migrating a datastore ingested before the creator index. Persons with
+    the same normalized name are merged in the index.
+
+    :param redis_server: Redis datastore
+    :rtype int: Number of Persons checked
+    """
+    last_id = int(redis_server.get("global:rdaCore:Person") or 0)
+    for counter in range(1,last_id+1):
+        person_key = "rdaCore:Person:{0}".format(counter)
+        raw_name = redis_server.hget(person_key,'rdaPreferredNameForThePerson')
+        if raw_name is not None:
+            index_creator(redis_server,person_key,raw_name)
+    return last_id
+
+def get_creators(redis_server,normalized_names):
+    """
+    Function returns a dict with the display heading and merged Person
+    keys for each normalized name, with one pipeline
+
+    :param redis_server: Redis datastore
+    :param normalized_names: List of normalized names
+    """
+    if len(normalized_names) < 1:
+        return []
+    creator_pipeline = redis_server.pipeline(transaction=False)
+    for normalized_name in normalized_names:
+        creator_pipeline.hget(CREATOR_LABEL_HASH,normalized_name)
+        creator_pipeline.smembers(CREATOR_PERSONS_KEY.format(normalized_name))
+    results = creator_pipeline.execute()
+    creators = []
+    for i,normalized_name in enumerate(normalized_names):
+        label,persons = results[i*2],results[i*2+1]
+        creators.append({'name':normalized_name,
+                         'label':(label or normalized_name).decode('utf8','ignore'),
+                         'persons':sorted(persons)})
+    return creators
+
+def complete_creator(redis_server,user_input,limit=10):
+    """
+    Function returns the creators with a name part starting with the
+    user input, for typeahead
+
+    :param redis_server: Redis datastore
+    :param user_input: User input
+    :param limit: Maximum number of creators, default is 10
+    """
+    prefix = normalize_name(user_input)
+    if len(prefix) < 1:
+        return []
+    rank = redis_server.zrank(COMPLETION_KEY,prefix)
+    if rank is None:
+        return []
+    normalized_names = []
+    while len(normalized_names) < limit:
+        entries = redis_server.zrange(COMPLETION_KEY,
+                                      rank,
+                                      rank+COMPLETION_BATCH-1)
+        if len(entries) < 1:
+            break
+        rank += COMPLETION_BATCH
+        for entry in entries:
+            if not entry.startswith(prefix):
+                rank = None
+                break
+            if entry.find("*") > -1:
+                normalized_name = entry.split("*",1)[1]
+                if not normalized_name in normalized_names:
+                    normalized_names.append(normalized_name)
+                    if len(normalized_names) >= limit:
+                        break
+        if rank is None:
+            break
+    return get_creators(redis_server,normalized_names)
+
+def search_creators(redis_server,user_input):
+    """
+    Function returns the creators with name parts that sound like all of
+    the name parts in the user input
+
+    :param redis_server: Redis datastore
+    :param user_input: User input
+    """
+    metaphones = get_metaphones(normalize_name(user_input))
+    if len(metaphones) < 1:
+        return []
+    normalized_names = redis_server.sinter([METAPHONE_KEY.format(phonetic)
+                                            for phonetic in metaphones])
+    return get_creators(redis_server,sorted(normalized_names))
+
+def get_sort_rank(redis_server,sort_key,value):
+    """
+    Function returns the number of members of a sorted set in lexical
+    order before a value, the rank the value would have in the set,
+    without writing to the set so a read replica can be used. Uses
+    ZLEXCOUNT on Redis 2.8.9 or later and a binary search with ZRANGE on
+    earlier servers.
+
+    :param redis_server: Redis datastore
+    :param sort_key: Sorted set with a score of 0 for every member
+    :param value: Normalized value
+    """
+    try:
+        return redis_server.execute_command('ZLEXCOUNT',
+                                            sort_key,
+                                            '-',
+                                            '({0}'.format(value))
+    except ResponseError:
+        pass
+    low,high = 0,redis_server.zcard(sort_key)
+    while low < high:
+        middle = (low+high)/2
+        members = redis_server.zrange(sort_key,middle,middle)
+        if len(members) > 0 and members[0] < value:
+            low = middle+1
+        else:
+            high = middle
+    return low
+
+def browse_creators(redis_server,user_input,before=5,after=5):
+    """
+    Function returns the creators before and after a name in alphabetical
+    order, for author browse
+
+    :param redis_server: Redis datastore
+    :param user_input: User input
+    :param before: Number of creators before the name, default is 5
+    :param after: Number of creators after the name, default is 5
+    """
+    normalized_name = normalize_name(user_input)
+    rank = redis_server.zrank(SORT_KEY,normalized_name)
+    if rank is None:
+        rank = get_sort_rank(redis_server,SORT_KEY,normalized_name)
+        after -= 1
+    normalized_names = redis_server.zrange(SORT_KEY,
+                                           max(rank-before,0),
+                                           rank+after)
+    return get_creators(redis_server,normalized_names)
+
+def add_person_works(redis_server,person_keys,manifestation_key,score=0):
+    """
+    Function adds a Manifestation to the works of each of its Persons
+
+    :param redis_server: Redis datastore
+    :param person_keys: List of Person keys
+    :param manifestation_key: Manifestation key
+    :param score: Manifestation's normalized date, default is 0
+    """
+    works_pipeline = redis_server.pipeline()
+    for person_key in person_keys:
+        works_pipeline.zadd(PERSON_WORKS_KEY.format(person_key),
+                            score,
+                            manifestation_key)
+    works_pipeline.execute()
+
+def remove_work_creators(redis_server,work_key,work_server=None):
+    """
+    Function removes a Work's Manifestation from the works of the Work's
+    creators, does nothing for other entities
+
+    :param redis_server: Redis datastore of the Persons' works, the
+                         datastore passed to :func:`add_person_works`
+    :param work_key: Work key
+    :param work_server: Optional Redis datastore of the Work, default is
+                        redis_server
+    """
+    if work_server is None:
+        work_server = redis_server
+    person_keys = get_element(work_server,work_key,'rdaCreator')
+    manifestation_key = get_element(work_server,work_key,'rdaManifestationOfWork')
+    if person_keys is None or manifestation_key is None:
+        return
+    if type(person_keys) != list:
+        person_keys = [person_keys]
+    works_pipeline = redis_server.pipeline()
+    for person_key in person_keys:
+        works_pipeline.zrem(PERSON_WORKS_KEY.format(person_key),
+                            manifestation_key)
+    works_pipeline.execute()
+
+def get_creator_works(redis_server,
+                      person_keys,
+                      offset=0,
+                      limit=20,
+                      manifestation_server=None):
+    """
+    Function returns the total and a page of the works of a creator's
+    Persons in date order, the Work and bib number of each Manifestation
+    are read with one pipeline and the titles with another
+
+    :param redis_server: Redis datastore of the Persons, merged Persons
+                         write a temporary sorted set
+    :param person_keys: List of the creator's Person keys
+    :param offset: Offset of the page, default is 0
+    :param limit: Page size, default is 20
+    :param manifestation_server: Optional Redis datastore of the
+                                 Manifestations, default is redis_server
+    :rtype tuple: Total and list of dicts for the works
+    """
+    if manifestation_server is None:
+        manifestation_server = redis_server
+    if len(person_keys) < 1:
+        return 0,[]
+    if len(person_keys) == 1:
+        works_key = PERSON_WORKS_KEY.format(person_keys[0])
+    else:
+        works_key = CREATOR_WORKS_KEY.format(hashlib.sha1(' '.join(sorted(person_keys))).hexdigest())
+        # Refreshing the expiration is also the cache check
+        if not redis_server.expire(works_key,CREATOR_WORKS_TTL):
+            works_pipeline = redis_server.pipeline()
+            works_pipeline.zunionstore(works_key,
+                                       [PERSON_WORKS_KEY.format(person_key)
+                                        for person_key in person_keys],
+                                       aggregate='MIN')
+            works_pipeline.expire(works_key,CREATOR_WORKS_TTL)
+            works_pipeline.execute()
+    works_pipeline = redis_server.pipeline(transaction=False)
+    works_pipeline.zcard(works_key)
+    works_pipeline.zrange(works_key,offset,offset+limit-1)
+    total,manifestation_keys = works_pipeline.execute()
+    works_pipeline = manifestation_server.pipeline(transaction=False)
+    for manifestation_key in manifestation_keys:
+        works_pipeline.hget(manifestation_key,'rdaWorkManifested')
+        works_pipeline.hget(manifestation_key,'legacy-bib-number')
+    results = works_pipeline.execute()
+    titles = get_title_labels(manifestation_server,manifestation_keys)
+    works = []
+    for i,manifestation_key in enumerate(manifestation_keys):
+        work_key,bib_number = results[i*2:i*2+2]
+        works.append({'manifestation':manifestation_key,
+                      'work':work_key,
+                      'bib_number':bib_number,
+                      'title':(titles[i] or '').decode('utf8','ignore')})
+    return total,works
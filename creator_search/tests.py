@@ -5,7 +5,21 @@ when you run "manage.py test".
 Replace this with more appropriate tests for your application.
 """
 
+import redis
 from django.test import TestCase
+from aristotle.settings import REDIS_TEST_DB
+from redis_helpers import *
+
+test_ds = redis.StrictRedis(db=REDIS_TEST_DB)
+
+
+class NoLexCountRedis(redis.StrictRedis):
+    "Redis client for a server without ZLEXCOUNT, before Redis 2.8.9"
+
+    def execute_command(self,*args,**options):
+        if args[0] == 'ZLEXCOUNT':
+            raise ResponseError("unknown command 'ZLEXCOUNT'")
+        return redis.StrictRedis.execute_command(self,*args,**options)
 
 
 class SimpleTest(TestCase):
@@ -14,3 +28,93 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+class CreatorIndexTest(TestCase):
+
+    def setUp(self):
+        self.twain_key = get_or_add_person(test_ds,'Twain, Mark, 1835-1910.')
+        self.dupont_key = get_or_add_person(test_ds,u'Dupont, Andr\xe9')
+        self.dupuy_key = get_or_add_person(test_ds,'Dupuy, Trevor N.')
+
+    def test_normalize_name(self):
+        self.assertEquals(normalize_name('Twain, Mark, 1835-1910.'),
+                          'twain mark')
+        self.assertEquals(normalize_name('Smith, John, b. 1942-'),
+                          'smith john')
+        self.assertEquals(normalize_name(u'Dupont, Andr\xe9.'),
+                          'dupont andre')
+
+    def test_merged_persons(self):
+        self.assertEquals(get_or_add_person(test_ds,'Twain, Mark'),
+                          self.twain_key)
+        self.assertEquals(get_or_add_person(test_ds,'TWAIN, MARK.'),
+                          self.twain_key)
+        self.assertEquals(test_ds.get('global:rdaCore:Person'),'3')
+
+    def test_empty_name(self):
+        self.assertEquals(get_or_add_person(test_ds,'1835-1910.'),None)
+        self.assertEquals(get_or_add_person(test_ds,', .'),None)
+        self.assertEquals(test_ds.get('global:rdaCore:Person'),'3')
+
+    def test_complete_creator(self):
+        self.assertEquals([row['name'] for row in complete_creator(test_ds,'dup')],
+                          ['dupont andre','dupuy trevor n'])
+        self.assertEquals(complete_creator(test_ds,'mark')[0]['persons'],
+                          [self.twain_key])
+        self.assertEquals(complete_creator(test_ds,'markx'),[])
+
+    def test_search_creators(self):
+        self.assertEquals([row['label'] for row in search_creators(test_ds,'Twane')],
+                          ['Twain, Mark, 1835-1910.'])
+
+    def test_browse_creators(self):
+        self.assertEquals([row['name'] for row in browse_creators(test_ds,'e',before=1,after=2)],
+                          ['dupuy trevor n','twain mark'])
+
+    def test_get_sort_rank(self):
+        sort_set = test_ds.zrange(SORT_KEY,0,-1)
+        no_lex_ds = NoLexCountRedis(db=REDIS_TEST_DB)
+        for value,rank in [('a',0),('dupuy trevor n',1),('e',2),('z',3)]:
+            self.assertEquals(get_sort_rank(test_ds,SORT_KEY,value),rank)
+            self.assertEquals(get_sort_rank(no_lex_ds,SORT_KEY,value),rank)
+        self.assertEquals([row['name'] for row in browse_creators(no_lex_ds,'e',before=1,after=2)],
+                          ['dupuy trevor n','twain mark'])
+        self.assertEquals(test_ds.zrange(SORT_KEY,0,-1),sort_set)
+
+    def tearDown(self):
+        test_ds.flushdb()
+
+class CreatorWorksTest(TestCase):
+
+    def setUp(self):
+        test_ds.hset('rdaCore:Manifestation:1','rdaWorkManifested','rdaCore:Work:1')
+        test_ds.hset('rdaCore:Manifestation:1:rdaTitle','label','Roughing It')
+        test_ds.hset('rdaCore:Manifestation:2','rdaWorkManifested','rdaCore:Work:2')
+        test_ds.hset('rdaCore:Manifestation:2','rdaTitle.label','Life on the Mississippi')
+        add_person_works(test_ds,['rdaCore:Person:1'],'rdaCore:Manifestation:2',1883.0)
+        add_person_works(test_ds,['rdaCore:Person:2'],'rdaCore:Manifestation:1',1872.0)
+
+    def test_get_creator_works(self):
+        total,works = get_creator_works(test_ds,['rdaCore:Person:1'])
+        self.assertEquals(total,1)
+        self.assertEquals(works[0]['title'],'Life on the Mississippi')
+        # Merged Persons' works are in date order
+        total,works = get_creator_works(test_ds,
+                                        ['rdaCore:Person:1','rdaCore:Person:2'],
+                                        limit=1)
+        self.assertEquals(total,2)
+        self.assertEquals(works,[{'manifestation':'rdaCore:Manifestation:1',
+                                  'work':'rdaCore:Work:1',
+                                  'bib_number':None,
+                                  'title':'Roughing It'}])
+
+    def test_remove_work_creators(self):
+        test_ds.sadd('rdaCore:Work:2:rdaCreator','rdaCore:Person:1')
+        test_ds.hset('rdaCore:Work:2','rdaCreator','rdaCore:Work:2:rdaCreator')
+        test_ds.hset('rdaCore:Work:2','rdaManifestationOfWork','rdaCore:Manifestation:2')
+        remove_work_creators(test_ds,'rdaCore:Work:2')
+        self.assertEquals(get_creator_works(test_ds,['rdaCore:Person:1']),
+                          (0,[]))
+
+    def tearDown(self):
+        test_ds.flushdb()
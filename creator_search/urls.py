@@ -0,0 +1,12 @@
+"""
+ mod:`urls` Creator Search App URL routing
+"""
+__author__ = "Jeremy Nelson"
+
+from django.conf.urls.defaults import *
+
+urlpatterns = patterns('creator_search.views',
+    url(r"^$","app",name="creator-search-default"),
+    url(r"^search$","search",name="creator-search-json"),
+    url(r"^works$","works",name="creator-works-json"),
+)
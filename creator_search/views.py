@@ -1 +1,70 @@
-# Create your views here.
+"""
+ mod:`views` Creator Search App Views
+"""
+__author__ = "Jeremy Nelson"
+
+from app_settings import APP,REDIS_SERVER,READ_REDIS_SERVER,WORKS_PAGE_SIZE
+from app_settings import MANIFESTATION_REDIS
+from django.views.generic.simple import direct_to_template
+from django.http import HttpResponse
+import aristotle.settings as settings
+import json
+import redis_helpers
+
+def app(request):
+    """
+    Returns app view for Creator Search App
+
+    :param request: HTTP Request
+    """
+    return direct_to_template(request,
+                              'creator_search/app.html',
+                              {'app':APP,
+                               'aristotle_url':settings.DISCOVERY_RECORD_URL})
+
+def json_response(results):
+    return HttpResponse(json.dumps(results),
+                        mimetype='application/json')
+
+def search(request):
+    """
+    JSON view returns the creators for a query, creators with a name
+    part starting with the query for typeahead or sounding like the
+    query otherwise
+
+    :param request: HTTP Request
+    """
+    user_input = request.REQUEST.get('q','')
+    if request.REQUEST.get('type') == 'typeahead':
+        creators = redis_helpers.complete_creator(READ_REDIS_SERVER,user_input)
+    elif request.REQUEST.get('type') == 'browse':
+        creators = redis_helpers.browse_creators(READ_REDIS_SERVER,user_input)
+    else:
+        creators = redis_helpers.search_creators(READ_REDIS_SERVER,user_input)
+    return json_response({'q':user_input,
+                          'results':creators})
+
+def works(request):
+    """
+    JSON view returns a page of the works of a creator's Persons, i.e.
+    ?person=rdaCore:Person:1&offset=20&limit=20
+
+    :param request: HTTP Request
+    """
+    person_keys = request.GET.getlist('person')
+    try:
+        offset = max(int(request.REQUEST.get('offset',0)),0)
+        limit = min(max(int(request.REQUEST.get('limit',WORKS_PAGE_SIZE)),1),100)
+    except ValueError,e:
+        return json_response({'result':'error',
+                              'text':str(e)})
+    total,works = redis_helpers.get_creator_works(REDIS_SERVER,
+                                                  person_keys,
+                                                  offset,
+                                                  limit,
+                                                  MANIFESTATION_REDIS)
+    return json_response({'persons':person_keys,
+                          'offset':offset,
+                          'limit':limit,
+                          'total':total,
+                          'results':works})
@@ -7,8 +7,9 @@ __author__ = 'Jon Driscoll, Jeremy Nelson'
 
 import datetime,redis,copy
 import aristotle.settings
+from aristotle.lib.datastores import get_datastore
 
-redis_ds = redis.StrictRedis()
+redis_ds = get_datastore('hours')
 library_key_format = 'library-hours:%Y-%m-%d'
 time_format = '%H:%M'
 
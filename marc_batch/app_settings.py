@@ -9,5 +9,7 @@ APP = {'controls': [],
        'icon_url':'MARC_batch.png',
        'productivity':True,
        'url':'marc_batch/'}
-       
-       
+
+# Number of worker processes for the vendor MARC jobs, set greater than 1
+# to run processRecord in parallel for large vendor loads
+LOAD_PROCESSES = 1
@@ -5,7 +5,11 @@ __author__ = "Jeremy Nelson"
 
 from behave import *
 import pymarc,copy
+from marc_batch.marc_index import open_index
 MARC_FILENAME = 'C:\\Users\\jernelson\\Development\\ybp-dda-for-ebl.mrc'
+# Set to a bib number or 001 to run the steps against that record
+# instead of the first record in the MARC file
+MARC_RECORD_KEY = None
  
 
 def before_all(context):
@@ -14,8 +18,13 @@ def before_all(context):
 
     :param context: behave context object
     """
-    marc_reader = pymarc.MARCReader(open(MARC_FILENAME,'rb'))
-    context.original_record = marc_reader.next()
+    if MARC_RECORD_KEY is None:
+        marc_reader = pymarc.MARCReader(open(MARC_FILENAME,'rb'))
+        context.original_record = marc_reader.next()
+    else:
+        marc_index = open_index(MARC_FILENAME)
+        context.original_record = marc_index.get_record(MARC_RECORD_KEY)
+        marc_index.close()
     context.marc_record = copy.deepcopy(context.original_record)
 
 
@@ -1,32 +1,40 @@
 """
- :mod:`__init__` Loads help rst files for use in the marc_batch app
+ :mod:`__init__` Loads help rst files for use in the marc_batch app, the
+ rendered help is cached on disk and only rendered again when the rst
+ file changes
 """
 __author__ = "Jeremy Nelson"
 
-from docutils.core import publish_string
-from bs4 import BeautifulSoup
 import os,sys
-import json
-from aristotle.fixures import get_file
+from aristotle.fixures import FixureLoader,get_cached,get_json
 
 CURRENT_DIR = os.path.abspath(os.path.dirname(__file__))
-help_loader = dict()
-json_loader = dict()
 
-fixures_walker = os.walk(CURRENT_DIR)
-fixures_listing = next(fixures_walker)[2]
+def render_help(raw_contents):
+    """
+    Function renders a help rst file to HTML, returns the main
+    document div
 
-for filename in fixures_listing:
-    root,extension = os.path.splitext(filename)
-    if extension == '.rst':
-        if root.find("help") > -1:
-            raw_contents = get_file(filename,CURRENT_DIR)
-            rst_contents = publish_string(raw_contents,
-                                          writer_name="html")
-            rst_soup = BeautifulSoup(rst_contents)
-            main_contents = rst_soup.find("div",attrs={"class":"document"})
-            help_loader[root] = main_contents.prettify()
-    elif extension == '.json':
-        raw_contents = get_file(filename,CURRENT_DIR)
-        json_loader[root] = json.loads(raw_contents)
+    :param raw_contents: Contents of rst file
+    """
+    from docutils.core import publish_string
+    from bs4 import BeautifulSoup
+    rst_contents = publish_string(raw_contents,
+                                  writer_name="html")
+    rst_soup = BeautifulSoup(rst_contents)
+    main_contents = rst_soup.find("div",attrs={"class":"document"})
+    return main_contents.prettify()
 
+def get_help(filename,fixures_dir=CURRENT_DIR):
+    """
+    Function returns the rendered HTML of a help rst file
+
+    :param filename: Filename
+    """
+    return get_cached(filename,fixures_dir,render_help)
+
+help_loader = FixureLoader(CURRENT_DIR,
+                           '.rst',
+                           get_help,
+                           lambda root: root.find("help") > -1)
+json_loader = FixureLoader(CURRENT_DIR,'.json',get_json)
@@ -50,6 +50,7 @@ class RedisJobLogForm(forms.ModelForm):
 
     class Meta:
         model = RedisJobLog
+        exclude = ('metrics',)
 
 class SolrJobLogForm(forms.ModelForm):
     """`SolrJobLog` is a django model form for adding a new
@@ -8,6 +8,7 @@ __author__ = 'Jeremy Nelson'
 
 
 import pymarc,copy
+from profiles import VendorProfileJob,has_profile
 from springer import SpringerEBookJob
 from ybp_ebl import ybp_ebl
 from ybp_ebrary import ybp_ebrary
@@ -20,6 +21,23 @@ springer = SpringerEBookJob
 ybp_ebl = ybp_ebl
 ybp_ebrary = ybp_ebrary
 
+def get_job_class(python_module):
+    """
+    Function returns the job class for a Job's python_module, falling
+    back to a :class:`VendorProfileJob` for vendors that only have a
+    profile in the vendor-profiles fixure.
+
+    :param python_module: Job python_module name
+    """
+    module_globals = globals()
+    if module_globals.has_key(python_module):
+        return module_globals[python_module]
+    if has_profile(python_module):
+        return type(str(python_module),
+                    (VendorProfileJob,),
+                    {'profile_name':python_module})
+    raise ValueError("Unknown ILS job {0}".format(python_module))
+
 class job(object):
     """
      :class:`ils.job` takes a MARC record and optional job specific
@@ -1,17 +1,225 @@
 """
  :mod:`lc_redis` Module creates or validates Library of Congress Subject
- Headings and stores in 
+ Headings and stores in Redis
 
+ The LCSH authorities are loaded into Redis from the id.loc.gov bulk
+ download of LCSH in N-Triples, as either MADS/RDF or SKOS, so headings are
+ validated locally instead of with a request to id.loc.gov for each
+ heading::
+
+   lcsh-label-hash         hash  normalized label -> authority URI
+   lcsh-uri-hash           hash  authority URI -> authoritative label
+   lcsh-geographic-labels  set   normalized labels of geographic authorities
 """
-import redis,os,urllib2,urllib
-try:
-    import aristotle.settings as settings
-    redis_server = redis.StrictRedis(host=settings.REDIS_ACCESS_HOST,
-                                     port=settings.REDIS_ACCESS_PORT)
-except ImportError:
-    # For local development and outside of Aristotle Library Apps environment
-    redis_server = redis.StrictRedis()
-    
+__author__ = "Jeremy Nelson"
+
+import redis,os,re,gzip,unicodedata
+from collections import OrderedDict
+from aristotle.lib.datastores import get_datastore
+
+redis_server = get_datastore('access')
+
+LCSH_LABEL_HASH = 'lcsh-label-hash'
+LCSH_URI_HASH = 'lcsh-uri-hash'
+LCSH_GEOGRAPHIC_SET = 'lcsh-geographic-labels'
+
+MADS = 'http://www.loc.gov/mads/rdf/v1#'
+SKOS = 'http://www.w3.org/2004/02/skos/core#'
+RDF_TYPE = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#type'
+# Predicates of the authoritative labels and of the variant labels
+AUTHORITATIVE_LABELS = ['{0}authoritativeLabel'.format(MADS),
+                        '{0}prefLabel'.format(SKOS)]
+VARIANT_LABELS = ['{0}variantLabel'.format(MADS),
+                  '{0}altLabel'.format(SKOS)]
+GEOGRAPHIC_TYPE = '{0}Geographic'.format(MADS)
+
+triple_re = re.compile(r'^<([^>]+)>\s+<([^>]+)>\s+(.+?)\s*\.\s*$')
+literal_re = re.compile(r'^"((?:[^"\\]|\\.)*)"(?:@[\w-]+|\^\^<[^>]+>)?$')
+escape_re = re.compile(r'\\(u[0-9A-Fa-f]{4}|U[0-9A-Fa-f]{8}|.)')
+ESCAPES = {'t':u'\t','n':u'\n','r':u'\r','"':u'"',"'":u"'",'\\':u'\\'}
+
+
+def normalize_heading(raw_heading):
+    """
+    Function normalizes a subject heading or authority label for lookups,
+    lower case without diacritics, trailing punctuation, or extra spaces
+    around subdivisions, returned as a utf-8 string
+
+    :param raw_heading: Heading, i.e. United States--History.
+    """
+    if not isinstance(raw_heading,unicode):
+        raw_heading = raw_heading.decode('utf8','ignore')
+    heading = ''.join([char for char in unicodedata.normalize('NFKD',raw_heading)
+                       if not unicodedata.combining(char)])
+    heading = ' '.join(heading.lower().split())
+    heading = re.sub(r'\s*--\s*','--',heading)
+    return heading.rstrip(' .,;:').encode('utf8')
+
+def __unescape__(match):
+    escape = match.group(1)
+    if escape[0] in 'uU':
+        return unichr(int(escape[1:],16))
+    return ESCAPES.get(escape,escape)
+
+def parse_triple(line):
+    """
+    Function parses an N-Triples line, returns a (subject,predicate,object)
+    tuple with literal objects as unicode, or None for a blank, comment,
+    or blank node line
+
+    :param line: N-Triples line
+    """
+    triple = triple_re.search(line.decode('utf8','ignore'))
+    if triple is None:
+        return None
+    subject,predicate,rdf_object = triple.groups()
+    literal = literal_re.search(rdf_object)
+    if literal is not None:
+        rdf_object = escape_re.sub(__unescape__,literal.group(1))
+    elif rdf_object.startswith('<') and rdf_object.endswith('>'):
+        rdf_object = rdf_object[1:-1]
+    return subject,predicate,rdf_object
+
+def load_lcsh(dump_location,redis_server=redis_server,batch_size=1000):
+    """
+    Function loads the LCSH authorities from an N-Triples bulk download,
+    gzipped if the file ends with .gz. An authoritative label replaces a
+    variant label with the same normalized label. The authoritative labels
+    of geographic authorities are added to the geographic set after the
+    whole file is read, as the type can follow the labels in the file.
+
+    :param dump_location: Path to the LCSH N-Triples file
+    :param redis_server: Redis datastore, default is the access datastore
+    :param batch_size: Number of triples for each pipeline
+    :rtype dict: Counts of the authorities, variants, and geographic labels
+    """
+    if dump_location.endswith('.gz'):
+        dump_file = gzip.open(dump_location,'rb')
+    else:
+        dump_file = open(dump_location,'rb')
+    stats = {'authorities':0,'variants':0,'geographic':0}
+    geographic_uris = set()
+    lcsh_pipeline = redis_server.pipeline(transaction=False)
+    pending = 0
+    for line in dump_file:
+        triple = parse_triple(line)
+        if triple is None:
+            continue
+        subject,predicate,rdf_object = triple
+        if predicate in AUTHORITATIVE_LABELS:
+            lcsh_pipeline.hset(LCSH_LABEL_HASH,normalize_heading(rdf_object),subject)
+            lcsh_pipeline.hset(LCSH_URI_HASH,subject,rdf_object.encode('utf8'))
+            stats['authorities'] += 1
+        elif predicate in VARIANT_LABELS:
+            lcsh_pipeline.hsetnx(LCSH_LABEL_HASH,normalize_heading(rdf_object),subject)
+            stats['variants'] += 1
+        elif predicate == RDF_TYPE and rdf_object == GEOGRAPHIC_TYPE:
+            geographic_uris.add(subject)
+            continue
+        else:
+            continue
+        pending += 1
+        if pending >= batch_size:
+            lcsh_pipeline.execute()
+            pending = 0
+    lcsh_pipeline.execute()
+    dump_file.close()
+    geographic_uris = list(geographic_uris)
+    for i in range(0,len(geographic_uris),batch_size):
+        labels = redis_server.hmget(LCSH_URI_HASH,geographic_uris[i:i+batch_size])
+        labels = [normalize_heading(label) for label in labels if label is not None]
+        if len(labels) > 0:
+            redis_server.sadd(LCSH_GEOGRAPHIC_SET,*labels)
+            stats['geographic'] += len(labels)
+    return stats
+
+
+class LRUCache(object):
+    """
+    :class:`LRUCache` is a dict with a maximum size that drops the least
+    recently used key when it is full
+    """
+
+    def __init__(self,size=10000):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def __contains__(self,key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self,key,default=None):
+        if not key in self.entries:
+            return default
+        value = self.entries.pop(key)
+        self.entries[key] = value
+        return value
+
+    def set(self,key,value):
+        if key in self.entries:
+            self.entries.pop(key)
+        elif len(self.entries) >= self.size:
+            self.entries.popitem(last=False)
+        self.entries[key] = value
+
+
+class LCSHAuthority(object):
+    """
+    :class:`LCSHAuthority` looks up the authority URIs of headings in the
+    local LCSH store, with an LRU cache of the recent lookups. The headings
+    missing from the cache are looked up with one round-trip.
+    """
+
+    def __init__(self,redis_server=redis_server,cache_size=10000):
+        """
+        Initializes `LCSHAuthority`
+
+        :param redis_server: Redis datastore with the loaded LCSH
+        :param cache_size: Maximum number of cached lookups
+        """
+        self.redis_server = redis_server
+        self.cache = LRUCache(cache_size)
+
+    def lookup_many(self,headings):
+        """
+        Returns a dict of the authority URI and geographic flag, as a
+        (uri,is_geographic) tuple, for each heading with (None,False) for
+        headings that aren't in LCSH
+
+        :param headings: List of headings
+        """
+        results,missing = {},[]
+        for heading in headings:
+            normalized = normalize_heading(heading)
+            if normalized in self.cache:
+                results[heading] = self.cache.get(normalized)
+            elif not normalized in missing:
+                missing.append(normalized)
+        if len(missing) > 0:
+            lcsh_pipeline = self.redis_server.pipeline(transaction=False)
+            lcsh_pipeline.hmget(LCSH_LABEL_HASH,missing)
+            for normalized in missing:
+                lcsh_pipeline.sismember(LCSH_GEOGRAPHIC_SET,normalized)
+            found = lcsh_pipeline.execute()
+            for normalized,uri,is_geographic in zip(missing,found[0],found[1:]):
+                self.cache.set(normalized,(uri,bool(uri) and bool(is_geographic)))
+            for heading in headings:
+                if not results.has_key(heading):
+                    results[heading] = self.cache.get(normalize_heading(heading))
+        return results
+
+    def lookup(self,heading):
+        """
+        Returns the authority URI of a heading or None
+
+        :param heading: Heading
+        """
+        return self.lookup_many([heading])[heading][0]
+
+authority = LCSHAuthority()
+
 
 class LCSHIngester(object):
     """LCSHIngester class takes a MARC record, extracts and validates 6xx
@@ -24,49 +232,62 @@ class LCSHIngester(object):
             self.redis_server = kwargs.get('redis_server')
         else:
             self.redis_server = redis_server
-        self.topical_base_url = 'http://id.loc.gov/authorities/label/{0}'
-        self.geo_base_url = 'http://id.loc.gov/authorities/geographic/{0}'
+        if kwargs.has_key('authority'):
+            self.authority = kwargs.get('authority')
+        elif kwargs.has_key('redis_server'):
+            self.authority = LCSHAuthority(self.redis_server)
+        else:
+            self.authority = authority
+        self.topical = {}
+        self.geographic = {}
         self.__validate650__()
 ##        self.__validate651__()
 
-    def __process_geographic__(self,subfields):
-        """Method takes a list of subfiel, queries LOC id service,
-        and either adds or checks if term exists in Redis datastore,
-        returns the Redis key for the geographic name
+    def __process_geographic__(self,subfields,lookups):
+        """Method takes a list of subfield z and the authority lookups,
+        returns a dict of the authority URI for each geographic name, None
+        if the name isn't a LCSH geographic authority
 
-        :param subfields: List of 'a' or 'z' subfields
+        :param subfields: List of 'z' subfields
+        :param lookups: Dict of authority lookups by heading
         """
+        geographic = {}
         for subfield in subfields:
-            loc_url = self.geo_base_url.format(urllib.quote(subfield))
-        
-
+            uri,is_geographic = lookups[subfield]
+            if is_geographic:
+                geographic[subfield] = uri
+            else:
+                geographic[subfield] = None
+        return geographic
 
-    def __process_topical__(self,subfields):
-        """Method takes a list of subfield a, queries LOC id service,
-        and either adds or checks if term exists in Redis datastore,
-        returns the Redis key for the topical term
+    def __process_topical__(self,subfields,lookups):
+        """Method takes a list of subfield a and the authority lookups,
+        returns a dict of the authority URI for each topical term, None
+        if the term isn't in LCSH
 
         :param subfields: List of 'a' subfields
+        :param lookups: Dict of authority lookups by heading
         """
+        topical = {}
         for subfield in subfields:
-            pass
+            topical[subfield] = lookups[subfield][0]
+        return topical
 
     def __validate650__(self):
         """Method extracts all 650 fields from MARC record, checks to
-        see if it LCSH, and the calls the id.loc.gov website to extract
-        the URI to associated the LCSH"""
-        all650s = self.marc_record.get_fields('650')
-        for field in all650s:
-            if field.indicators[1] != '0':
-                pass
-            topical_key = self.__process_topical__(field.get_subfields('a'))
-            geo_key = self.__process_geographic__(field.get_subfields('z'))
-
-    
-
-
-    
-            
-        
-        
-        
+        see if it LCSH, and looks up the URI of the LCSH in the local
+        authority store with one round-trip for the record"""
+        lcsh_fields = [field for field in self.marc_record.get_fields('650')
+                       if field.indicators[1] == '0']
+        headings = []
+        for field in lcsh_fields:
+            headings.extend(field.get_subfields('a'))
+            headings.extend(field.get_subfields('z'))
+        if len(headings) < 1:
+            return
+        lookups = self.authority.lookup_many(headings)
+        for field in lcsh_fields:
+            self.topical.update(self.__process_topical__(field.get_subfields('a'),
+                                                         lookups))
+            self.geographic.update(self.__process_geographic__(field.get_subfields('z'),
+                                                               lookups))
@@ -0,0 +1,233 @@
+"""
+ :mod:`profiles` Declarative vendor profiles for the legacy ILS MARC batch
+ jobs. A vendor profile in the vendor-profiles fixure describes the leader,
+ control field, indicator, and subfield edits and the fields to remove and
+ insert for a vendor's MARC records. Each profile is compiled once into
+ template fields that are cloned for every record.
+"""
+__author__ = 'Jeremy Nelson'
+
+from marc_batch.marc_helpers import MARCModifier,RawRecord
+from marc_batch.fixures import json_loader
+from pymarc import Field
+
+compiled_profiles = dict()
+
+
+def build_field(field_info):
+    """
+    Function creates a MARC field from a profile's field dict
+
+    :param field_info: Dict with tag and either data or indicators
+                       and subfields
+    """
+    if field_info.has_key('data'):
+        return Field(tag=field_info['tag'],
+                     data=field_info['data'])
+    return Field(tag=field_info['tag'],
+                 indicators=list(field_info.get('indicators',[' ',' '])),
+                 subfields=list(field_info.get('subfields',[])))
+
+def clone_field(field):
+    """
+    Function returns a copy of a template field for a single record
+
+    :param field: Template MARC field
+    """
+    if field.is_control_field():
+        return Field(tag=field.tag,data=field.data)
+    return Field(tag=field.tag,
+                 indicators=list(field.indicators),
+                 subfields=list(field.subfields))
+
+def subfield_pairs(subfields):
+    """
+    Function returns a list of (code,value) tuples from a flat list of
+    subfield codes and values
+
+    :param subfields: List in the form of ['a','value','b','value']
+    """
+    return zip(subfields[0::2],subfields[1::2])
+
+def edit_control_data(data,edit):
+    """
+    Function returns control field data with a profile's control edit
+    applied
+
+    :param data: Control field data
+    :param edit: Dict with start, lower, replace, or positions
+    """
+    if edit.has_key('start'):
+        data = data[edit['start']:]
+    if edit.get('lower',False):
+        data = data.lower()
+    if edit.has_key('replace'):
+        data = data.replace(edit['replace'][0],edit['replace'][1])
+    if edit.has_key('positions'):
+        data_list = list(data)
+        for position,value in edit['positions'].iteritems():
+            position = int(position)
+            if position < len(data_list):
+                data_list[position] = value
+        data = ''.join(data_list)
+    return data
+
+def get_profile_info(name):
+    """
+    Function returns the profile dict for a vendor, merged with the
+    profile it extends
+
+    :param name: Profile name in the vendor-profiles fixure
+    """
+    profiles = json_loader['vendor-profiles']
+    if not profiles.has_key(name):
+        raise ValueError("Vendor profile {0} not found".format(name))
+    profile_info = dict(profiles[name])
+    if profile_info.has_key('extends'):
+        base_info = get_profile_info(profile_info.pop('extends'))
+        base_info.update(profile_info)
+        profile_info = base_info
+    return profile_info
+
+def get_profile(name):
+    """
+    Function returns the compiled :class:`VendorProfile`, compiling
+    the profile the first time it is requested
+
+    :param name: Profile name in the vendor-profiles fixure
+    """
+    if not compiled_profiles.has_key(name):
+        compiled_profiles[name] = VendorProfile(name,get_profile_info(name))
+    return compiled_profiles[name]
+
+def has_profile(name):
+    """
+    Function checks if a vendor profile exists
+
+    :param name: Profile name
+    """
+    return json_loader.get('vendor-profiles',{}).has_key(name)
+
+
+class VendorProfile(object):
+    """
+    :class:`VendorProfile` is a compiled vendor profile, the edits are
+    parsed and the inserted fields are built once as templates.
+    """
+
+    def __init__(self,name,profile_info):
+        """
+        Initializes `VendorProfile`
+
+        :param name: Profile name
+        :param profile_info: Profile dict from the vendor-profiles fixure
+        """
+        self.name = name
+        self.label = profile_info.get('label',name)
+        self.leader_edits = sorted([(int(position),value)
+                                    for position,value in profile_info.get('leader',{}).iteritems()])
+        self.control_edits = profile_info.get('control',{})
+        self.removed_tags = profile_info.get('remove',[])
+        # Tags where only the first field is removed, as some of the
+        # legacy jobs did
+        self.removed_first_tags = profile_info.get('remove_first',[])
+        self.indicators = profile_info.get('indicators',{})
+        self.added_subfields = dict([(tag,subfield_pairs(subfields))
+                                     for tag,subfields in profile_info.get('add_subfields',{}).iteritems()])
+        self.replaced_subfields = dict([(tag,subfield_pairs(subfields))
+                                        for tag,subfields in profile_info.get('replace_subfields',{}).iteritems()])
+        self.hooks = profile_info.get('hooks',[])
+        # Notes are inserted after the other fields, kept separate so
+        # a profile extending another can replace only its notes
+        self.templates = [build_field(field_info)
+                          for field_info in profile_info.get('insert',[])+profile_info.get('notes',[])]
+        self.missing_templates = [build_field(field_info)
+                                  for field_info in profile_info.get('insert_if_missing',[])]
+
+    def apply(self,marc_record,job=None):
+        """
+        Method applies the profile to a MARC record
+
+        :param marc_record: MARC record or :class:`RawRecord`
+        :param job: Optional job, hooks are methods called on the job
+        """
+        if len(self.leader_edits) > 0:
+            leader_list = list(marc_record.leader)
+            for position,value in self.leader_edits:
+                leader_list[position] = value
+            marc_record.leader = ''.join(leader_list)
+        for tag,edit in self.control_edits.iteritems():
+            if isinstance(marc_record,RawRecord):
+                marc_record.edit_control(tag,
+                                         lambda data: edit_control_data(data,edit))
+            else:
+                for field in marc_record.get_fields(tag):
+                    field.data = edit_control_data(field.data,edit)
+        for tag in self.removed_tags:
+            for field in marc_record.get_fields(tag):
+                marc_record.remove_field(field)
+        for tag in self.removed_first_tags:
+            fields = marc_record.get_fields(tag)
+            if len(fields) > 0:
+                marc_record.remove_field(fields[0])
+        for tag,indicators in self.indicators.iteritems():
+            for field in marc_record.get_fields(tag):
+                field.indicators = list(indicators)
+        for tag,subfields in self.added_subfields.iteritems():
+            for field in marc_record.get_fields(tag):
+                for code,value in subfields:
+                    field.add_subfield(code,value)
+        for tag,subfields in self.replaced_subfields.iteritems():
+            for field in marc_record.get_fields(tag):
+                for code,value in subfields:
+                    field.delete_subfield(code)
+                    field.add_subfield(code,value)
+        for hook in self.hooks:
+            marc_record = getattr(job,hook)(marc_record)
+        for template in self.templates:
+            marc_record.add_field(clone_field(template))
+        for template in self.missing_templates:
+            if marc_record[template.tag] is None:
+                marc_record.add_field(clone_field(template))
+        return marc_record
+
+
+class VendorProfileJob(MARCModifier):
+    """
+    :class:`VendorProfileJob` modifies a vendor's MARC records with the
+    vendor's profile, child classes set profile_name and provide any
+    methods named in the profile's hooks. Profiles are applied to the raw
+    ISO 2709 bytes, so hooks should only use the get_fields, __getitem__,
+    add_field, remove_field, and leader parts of the record interface.
+    """
+    profile_name = None
+
+    def __init__(self,marc_file,profile_name=None):
+        """
+        Initializes `VendorProfileJob`
+
+        :param marc_file: File location of MARC records
+        :param profile_name: Optional profile name, default is the
+                             class profile_name
+        """
+        MARCModifier.__init__(self,marc_file)
+        if profile_name is not None:
+            self.profile_name = profile_name
+        self.profile = get_profile(self.profile_name)
+
+    def processRecord(self,marc_record):
+        """
+        Processes a single MARC record with the vendor profile
+
+        :param marc_record: Single MARC record
+        """
+        return self.profile.apply(marc_record,self)
+
+    def processRawRecord(self,raw_record):
+        """
+        Processes a single raw MARC record with the vendor profile,
+        only the fields the profile edits are parsed
+
+        :param raw_record: :class:`marc_batch.marc_helpers.RawRecord`
+        """
+        return self.profile.apply(raw_record,self)
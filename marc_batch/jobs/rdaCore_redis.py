@@ -6,28 +6,38 @@
 __author__ = 'Jeremy Nelson'
 import pymarc,redis,logging,sys
 import re,datetime,copy,os
+import hashlib
 from marc_batch.fixures import json_loader
-from call_number.redis_helpers import ingest_call_numbers
-from rdaCore.app_settings import WORK_REDIS,EXPRESSION_REDIS,MANIFESTATION_REDIS
-from rdaCore.app_settings import ITEM_REDIS,TITLE_REDIS
+from marc_batch.metrics import IngestMetrics,NULL_METRICS
+from marc_batch.recovery import RecordLoad,FATAL_ERRORS
+from marc_batch.marc_index import open_index
+from call_number.redis_helpers import ingest_call_numbers,remove_call_numbers
+from creator_search.redis_helpers import add_person_works,get_or_add_person
+from creator_search.redis_helpers import remove_work_creators
+from RDACore.entity_storage import get_element,pack_entity
+from RDACore.facet_index import add_facets,get_facet_elements,remove_facets
+from RDACore.date_index import add_date,get_facet_years,get_record_date,remove_date
+from RDACore.subject_index import add_subjects,remove_subjects
+from aristotle.lib.datastores import get_datastore
 
 
-try:
-    import aristotle.settings as settings
-    REDIS_HOST = settings.REDIS_MASTER_HOST
-    REDIS_PORT = settings.REDIS_MASTER_PORT
-                                
-except:
-    REDIS_HOST = '127.0.0.1'
-    REDIS_PORT = 6379
-    REDIS_TEST_DB = 1
-
 # RDA Core should reside on primary DB of 0
-redis_server = redis.StrictRedis(host=REDIS_HOST,
-                                 port=REDIS_PORT)    
+redis_server = get_datastore('master')
+WORK_REDIS = get_datastore('work')
+EXPRESSION_REDIS = get_datastore('expression')
+MANIFESTATION_REDIS = get_datastore('manifestation')
+ITEM_REDIS = get_datastore('item')
+TITLE_REDIS = get_datastore('title')
 
 year_re = re.compile(r"(\d+)")
 
+# Keys used for change-detection of re-ingested MARC records, the
+# legacy bib hash stores the record's digest and its entity keys
+LEGACY_BIB_KEY = "rdaCore:legacy-bib:{0}"
+LEGACY_BIBS_KEY = "rdaCore:legacy-bibs"
+LEGACY_BIBS_SEEN_KEY = "rdaCore:legacy-bibs:seen"
+DELETED_BIBS_KEY = "rdaCore:legacy-bibs:deleted"
+
 
 
 class MARCRules(object):
@@ -187,23 +197,31 @@ class CreateRDACoreEntityFromMARC(object):
 
     This class is meant to be over-ridden by child classes for specific RDACore Entities
     """
+    # Faceted elements that a child class adds to the facet index itself
+    derived_facets = []
 
     def __init__(self,**kwargs):
         self.marc_record = kwargs.get('record')
         self.redis_server = kwargs.get('redis_server')
         self.root_redis_key = kwargs.get('root_redis_key')
+        self.metrics = kwargs.get('metrics',NULL_METRICS)
         entity_name = kwargs.get('entity')
+        self.entity_name = entity_name
         base_entity_key = "rdaCore:{0}".format(entity_name)
-        redis_incr_value = self.redis_server.incr("global:{0}".format(base_entity_key))
         if kwargs.has_key("json_file"):
             self.marc_rules = MARCRules(json_file=kwargs.get('json_file'))
         elif kwargs.has_key("json_rules"):
             self.marc_rules = MARCRules(json_rules=kwargs.get('json_rules'))
         else:
             raise ValueError("CreateRDACoreEntityFromMARC requires json_file or json_rules")
-        # Redis Key for this Entity
-        self.entity_key = "{0}:{1}".format(base_entity_key,
-                                           redis_incr_value)
+        # Redis Key for this Entity, an existing entity key is reused
+        # when a changed MARC record is re-ingested
+        if kwargs.has_key('entity_key'):
+            self.entity_key = kwargs.get('entity_key')
+        else:
+            redis_incr_value = self.redis_server.incr("global:{0}".format(base_entity_key))
+            self.entity_key = "{0}:{1}".format(base_entity_key,
+                                               redis_incr_value)
     
      
     def generate(self):
@@ -213,7 +231,10 @@ class CreateRDACoreEntityFromMARC(object):
         entity. The hash value can either be a text string or a key to
         a Redis set of values for the RDA Core entity instance.
         """
+        self.metrics.start('rules')
         self.marc_rules.load_marc(self.marc_record)
+        self.metrics.stop('rules')
+        self.metrics.start('redis')
         for element,values in self.marc_rules.json_results.iteritems():
             # Checks to see if rdaCore Entity element already exists
             # in Redis Datastore
@@ -266,6 +287,15 @@ class CreateRDACoreEntityFromMARC(object):
                                        set_key)
             else:
                 raise ValueError("{0}:{1} unknown in Redis datastore".format(element,value))            
+        for element in get_facet_elements(self.entity_name):
+            if element in self.derived_facets:
+                continue
+            if self.marc_rules.json_results.has_key(element):
+                add_facets(self.redis_server,
+                           self.entity_key,
+                           element,
+                           self.marc_rules.json_results[element])
+        self.metrics.stop('redis')
 
 class CreateRDACoreExpressionFromMARC(CreateRDACoreEntityFromMARC):
 
@@ -276,7 +306,8 @@ class CreateRDACoreExpressionFromMARC(CreateRDACoreEntityFromMARC):
 
     def generate(self):
         super(CreateRDACoreExpressionFromMARC,self).generate()
-        self.__call_number_app__()
+        with self.metrics.stage('call_number'):
+            self.__call_number_app__()
 
     def __call_number_app__(self):
         """
@@ -298,6 +329,7 @@ class CreateRDACoreItemFromMARC(CreateRDACoreEntityFromMARC):
         super(CreateRDACoreItemFromMARC,self).__init__(**kwargs)
 
 class CreateRDACoreManifestationFromMARC(CreateRDACoreEntityFromMARC):
+    derived_facets = ['rdaCarrierType','rdaCopyrightDate']
 
     def __init__(self,**kwargs):
         kwargs["entity"] = "Manifestation"
@@ -308,8 +340,16 @@ class CreateRDACoreManifestationFromMARC(CreateRDACoreEntityFromMARC):
         # First calls parent generate function
         super(CreateRDACoreManifestationFromMARC,self).generate()
         self.__carrier_type__()
+        process_008_date(self.marc_record,
+                         self.redis_server,
+                         entity_key=self.entity_key)
+        record_date = get_record_date(self.marc_record)
+        if record_date is not None:
+            add_date(self.redis_server,self.entity_key,record_date)
+        add_subjects(self.redis_server,self.entity_key,self.marc_record)
         self.__identifiers__()
-        self.__title__()
+        with self.metrics.stage('title'):
+            self.__title__()
 
     def __call_number_app__(self):
         """
@@ -352,6 +392,17 @@ class CreateRDACoreManifestationFromMARC(CreateRDACoreEntityFromMARC):
                         self.redis_server.hset(self.entity_key,
                                                'rdaCarrierType',
                                                carrier_types_dict[position0][position1])
+        # Facets the human-readable carrier types
+        carrier_types = get_element(self.redis_server,
+                                    self.entity_key,
+                                    'rdaCarrierType')
+        if carrier_types is not None:
+            if type(carrier_types) != list:
+                carrier_types = [carrier_types]
+            add_facets(self.redis_server,
+                       self.entity_key,
+                       'rdaCarrierType',
+                       carrier_types)
     
                     
 
@@ -446,6 +497,7 @@ class CreateRDACorePersonsFromMARC(object):
     def __init__(self,**kwargs):
         self.marc_record = kwargs.get('record')
         self.redis_server = kwargs.get('redis_server')
+        self.metrics = kwargs.get('metrics',NULL_METRICS)
         self.json_rules = copy.deepcopy(json_loader['marc-rda-person'])
         self.person_name_rule = self.json_rules.pop('rdaPreferredNameForThePerson')
         self.entity_ruleset = {}
@@ -466,32 +518,29 @@ class CreateRDACorePersonsFromMARC(object):
                 return None
         else:
             return None
-        if self.redis_server.hexists('person-name-hash',
-                                     raw_name):
-            person_key = self.redis_server.hget('person-name-hash',raw_name)
-        else:
-            person_key = "rdaCore:Person:{0}".format(self.redis_server.incr("global:rdaCore:Person"))
-            self.redis_server.hset(person_key,
-                                   'rdaPreferredNameForThePerson',
-                                   ''.join(raw_name))
-            self.redis_server.hset('person-name-hash',
-                                   ''.join(raw_name),
-                                   person_key)
-        self.people.append(person_key)
+        # Headings that only differ by punctuation or dates are merged
+        # into one Person by the creator index
+        person_key = get_or_add_person(self.redis_server,''.join(raw_name))
+        if person_key is not None:
+            self.people.append(person_key)
         return person_key
     
 
     def generate(self):
+        self.metrics.start('person')
         for tag,rules in self.entity_ruleset.iteritems():
             marc_fields = self.marc_record.get_fields(tag)
             for field in marc_fields:
                 person_key = self.__get_or_add_person__(field)
+                if person_key is None:
+                    continue
                 for name,rule in rules.iteritems():
                     if MARCRules().__test_indicators__(rule,field):
                         raw_value = MARCRules().__get_subfields__(rule,field)
                         self.redis_server.hset(person_key,
                                                name,
                                                ''.join(raw_value))
+        self.metrics.stop('person')
                         
     
                         
@@ -639,94 +688,446 @@ def process_identifier(marc_record,
                                   identifier_key)
             redis_server.sadd(identifiers_set_key,identifier_key)
 
-def process_008_date(marc_record,redis_server,date_sort_key):
+def process_008_date(marc_record,
+                     redis_server,
+                     date_sort_key=None,
+                     entity_key=None):
     """
     Helper function extracts dates from 008 MARC field and
     saves to Redis datastore
 
     :param marc_record: MARC record
     :param redis_server: Redis datastore instance
-    :param date_sort_key: Redis date sort key
+    :param date_sort_key: Optional Redis date sort key
+    :param entity_key: Optional Manifestation key, the years valid for
+                       the 008 date type are added to the entity's
+                       copyright date facet
     """
     field008 = marc_record['008']
     if field008 is not None:
         field_values = list(field008.value())
         date1 = ''.join(field_values[7:11])
         date2 = ''.join(field_values[11:15])
-        if len(date1.strip()) > 0:
-            date_search = year_re.search(date1)
+        for raw_date in [date1,date2]:
+            if len(raw_date.strip()) < 1:
+                continue
+            date_search = year_re.search(raw_date)
             if date_search is not None:
-                redis_server.zadd(date_sort_key,
-                                  int(date_search.groups()[0]),
-                                  date1)
-        if len(date2.strip()) > 0:
-            date_search = year_re.search(date2)
-            if date_search is not None:                
-                redis_server.zadd(date_sort_key,
-                                  int(date_search.groups()[0]),
-                                  date2)
-
-def ingest_record(marc_record,redis_server):
-    work_generator = CreateRDACoreWorkFromMARC(record=marc_record,
-                                               redis_server=WORK_REDIS,
-                                               root_redis_key="rdaCore")
-    work_generator.generate()
-    expression_generator = CreateRDACoreExpressionFromMARC(record=marc_record,
-                                                           redis_server=EXPRESSION_REDIS,
-                                                           root_redis_key="rdaCore")
-    expression_generator.generate()
-    manifestation_generator = CreateRDACoreManifestationFromMARC(record=marc_record,
-                                                                 redis_server=MANIFESTATION_REDIS,
-                                                                 root_redis_key="rdaCore")
-    manifestation_generator.generate()
-    item_generator = CreateRDACoreItemFromMARC(record=marc_record,
-                                               redis_server=ITEM_REDIS,
-                                               root_redis_key="rdaCore")
-    item_generator.generate()
+                year = date_search.groups()[0]
+                if date_sort_key is not None:
+                    redis_server.zadd(date_sort_key,
+                                      int(year),
+                                      raw_date)
+        if entity_key is not None:
+            add_facets(redis_server,
+                       entity_key,
+                       'rdaCopyrightDate',
+                       get_facet_years(marc_record))
+
+def ingest_record(marc_record,
+                  redis_server,
+                  entity_keys=None,
+                  compact=False,
+                  metrics=NULL_METRICS,
+                  datastores=None):
+    """
+    Function takes a MARC record and generates the rdaCore Work,
+    Expression, Manifestation, Item, and Persons in the Redis datastores.
+
+    :param marc_record: MARC record
+    :param redis_server: Redis datastore
+    :param entity_keys: Optional dict of existing entity keys by entity
+                        name, used to update a changed record in place
+    :param compact: Boolean, packs the entities into the compact layout
+                    of the :mod:`RDACore.entity_storage` module
+    :param metrics: Optional :class:`marc_batch.metrics.IngestMetrics`
+    :param datastores: Optional dict of Redis datastores by entity name,
+                       see :func:`entity_datastore`
+    :rtype dict: Entity keys by entity name
+    """
+    if entity_keys is None:
+        entity_keys = {}
+    work_redis = entity_datastore("Work",datastores)
+    expression_redis = entity_datastore("Expression",datastores)
+    manifestation_redis = entity_datastore("Manifestation",datastores)
+    item_redis = entity_datastore("Item",datastores)
+    generators = {}
+    for entity_name,generator_class,datastore in [
+        ("Work",CreateRDACoreWorkFromMARC,work_redis),
+        ("Expression",CreateRDACoreExpressionFromMARC,expression_redis),
+        ("Manifestation",CreateRDACoreManifestationFromMARC,manifestation_redis),
+        ("Item",CreateRDACoreItemFromMARC,item_redis)]:
+        params = {'record':marc_record,
+                  'redis_server':datastore,
+                  'root_redis_key':"rdaCore",
+                  'metrics':metrics}
+        if entity_keys.has_key(entity_name):
+            params['entity_key'] = entity_keys[entity_name]
+        generators[entity_name] = generator_class(**params)
+        generators[entity_name].generate()
+    work_generator = generators["Work"]
+    expression_generator = generators["Expression"]
+    manifestation_generator = generators["Manifestation"]
+    item_generator = generators["Item"]
     persons_generator = CreateRDACorePersonsFromMARC(record=marc_record,
-                                                     redis_server=redis_server)
+                                                     redis_server=redis_server,
+                                                     metrics=metrics)
                                                    
     persons_generator.generate()
     # Set rdaRelationships for entities
-    ITEM_REDIS.hset(item_generator.entity_key,
+    item_redis.hset(item_generator.entity_key,
                     "rdaManifestationExemplified",
                     manifestation_generator.entity_key)
-    MANIFESTATION_REDIS.hset(manifestation_generator.entity_key,
+    manifestation_redis.hset(manifestation_generator.entity_key,
                              "rdaExpressionManifested",
                              expression_generator.entity_key)
-    MANIFESTATION_REDIS.hset(manifestation_generator.entity_key,
+    manifestation_redis.hset(manifestation_generator.entity_key,
                              "rdaWorkManifested",
                              work_generator.entity_key)
-    EXPRESSION_REDIS.hset(expression_generator.entity_key,
+    expression_redis.hset(expression_generator.entity_key,
                           "rdaManifestationOfExpression",
                           manifestation_generator.entity_key)
-    EXPRESSION_REDIS.hset(expression_generator.entity_key,
+    expression_redis.hset(expression_generator.entity_key,
                           "rdaWorkExpressed",
                           work_generator.entity_key)
-    WORK_REDIS.hset(work_generator.entity_key,
+    work_redis.hset(work_generator.entity_key,
                     "rdaExpressionOfWork",
                     expression_generator.entity_key)
-    WORK_REDIS.hset(work_generator.entity_key,
+    work_redis.hset(work_generator.entity_key,
                     "rdaManifestationOfWork",
                     manifestation_generator.entity_key)
-##    if len(persons_generator.people) > 0:
-##        for rda_person_key in persons_generator.people:
-##            PERSON_REDIS.sadd("{0}:rdaCreator".format(work_generator.entity_key),
-##                              rda_person_key)
-##            redis_server.hset(work_generator.entity_key,
-##                              "rdaCreator",
-##                              rda_person_key)
-    
-    
+    # Links the Work to its Persons and adds the Manifestation to the
+    # Persons' works for creator search
+    creator_keys = []
+    for person_key in persons_generator.people:
+        if not person_key in creator_keys:
+            creator_keys.append(person_key)
+    if len(creator_keys) > 0:
+        creator_set_key = "{0}:rdaCreator".format(work_generator.entity_key)
+        work_redis.sadd(creator_set_key,*creator_keys)
+        work_redis.hset(work_generator.entity_key,
+                        "rdaCreator",
+                        creator_set_key)
+        add_person_works(redis_server,
+                         creator_keys,
+                         manifestation_generator.entity_key,
+                         get_record_date(marc_record) or 0)
+    output = {}
+    metrics.start('redis')
+    for entity_name,generator in generators.iteritems():
+        if compact is True:
+            pack_entity(generator.redis_server,generator.entity_key)
+        output[entity_name] = generator.entity_key
+    metrics.stop('redis')
+    return output
 
-def ingest_records(marc_file_location,redis_server=redis_server):
-    marc_reader = pymarc.MARCReader(open(marc_file_location,"rb"))
-    for i,record in enumerate(marc_reader):
-        if not i%1000:
-            sys.stderr.write(".")
-        if not i%10000:
-            sys.stderr.write(str(i))
-        ingest_record(record,redis_server)
+def entity_datastore(entity_name,datastores=None):
+    """
+    Helper function returns the Redis datastore for a rdaCore entity name
+
+    :param entity_name: Work, Expression, Manifestation, or Item
+    :param datastores: Optional dict of Redis datastores by entity name,
+                       i.e. the metered clients of an ingest job
+    """
+    if datastores is not None and datastores.has_key(entity_name):
+        return datastores[entity_name]
+    return {"Work":WORK_REDIS,
+            "Expression":EXPRESSION_REDIS,
+            "Manifestation":MANIFESTATION_REDIS,
+            "Item":ITEM_REDIS}.get(entity_name)
+
+def get_legacy_bib_number(marc_record):
+    """
+    Function extracts the legacy bib number from the 907 subfield a,
+    returns None if the MARC record doesn't have a 907
+
+    :param marc_record: MARC record
+    """
+    field907 = marc_record['907']
+    if field907 is None:
+        return None
+    raw_bib_number = ''.join(field907.get_subfields('a'))
+    if len(raw_bib_number) < 3:
+        return None
+    return raw_bib_number[1:-1]
+
+def get_record_digest(marc_record):
+    """
+    Function returns a SHA1 hex digest of the MARC record's
+    ISO 2709 serialization, used to detect changed records
+
+    :param marc_record: MARC record
+    """
+    return hashlib.sha1(marc_record.as_marc()).hexdigest()
+
+def purge_entity(redis_server,entity_key,persons_server=None):
+    """
+    Function removes a rdaCore entity's hash and all of the entity's
+    element sets, identifiers, and title so that the entity key can be
+    regenerated from a changed MARC record.
+
+    :param redis_server: Redis datastore of the entity
+    :param entity_key: rdaCore entity key
+    :param persons_server: Optional Redis datastore of the Persons and
+                           their works, default is redis_server
+    """
+    entity_prefix = "{0}:".format(entity_key)
+    identifiers_key = "{0}identifiers".format(entity_prefix)
+    title_key = "{0}rdaTitle".format(entity_prefix)
+    remove_call_numbers(redis_server,entity_key)
+    remove_facets(redis_server,entity_key)
+    remove_work_creators(persons_server or redis_server,
+                         entity_key,
+                         redis_server)
+    remove_date(redis_server,entity_key)
+    remove_subjects(redis_server,entity_key)
+    purge_keys = [entity_key,identifiers_key,title_key]
+    for value in redis_server.hvals(entity_key):
+        if value.startswith(entity_prefix):
+            purge_keys.append(value)
+    # The identifiers and title hashes aren't always referenced from the
+    # entity's hash
+    for nested_key in [identifiers_key,title_key]:
+        if redis_server.type(nested_key) != 'hash':
+            continue
+        for value in redis_server.hvals(nested_key):
+            if value.startswith(entity_prefix):
+                purge_keys.append(value)
+    redis_server.delete(*set(purge_keys))
+
+def tombstone_record(bib_number,redis_server=redis_server,datastores=None):
+    """
+    Function marks the rdaCore entities of a deleted legacy bib number
+    as deleted, removing the entities from call number browsing
+    but leaving the entity keys in place.
+
+    :param bib_number: Legacy bib number
+    :param redis_server: Redis datastore for the legacy bib hashes and
+                         the Persons
+    :param datastores: Optional dict of Redis datastores by entity name
+    :rtype boolean: True if the bib number had been ingested
+    """
+    bib_key = LEGACY_BIB_KEY.format(bib_number)
+    bib_info = redis_server.hgetall(bib_key)
+    if len(bib_info) < 1:
+        return False
+    deleted_on = datetime.datetime.today().isoformat()
+    for entity_name in ["Work","Expression","Manifestation","Item"]:
+        if not bib_info.has_key(entity_name):
+            continue
+        datastore = entity_datastore(entity_name,datastores)
+        remove_call_numbers(datastore,bib_info[entity_name])
+        remove_facets(datastore,bib_info[entity_name])
+        remove_date(datastore,bib_info[entity_name])
+        remove_subjects(datastore,bib_info[entity_name])
+        remove_work_creators(redis_server,bib_info[entity_name],datastore)
+        datastore.hset(bib_info[entity_name],'deleted',deleted_on)
+    redis_server.hset(bib_key,'deleted',deleted_on)
+    redis_server.sadd(DELETED_BIBS_KEY,bib_number)
+    return True
+
+def delta_ingest_record(marc_record,
+                        redis_server=redis_server,
+                        compact=False,
+                        metrics=NULL_METRICS,
+                        datastores=None):
+    """
+    Function ingests a MARC record only if it is new or has changed since
+    it was last ingested, checked by the legacy bib number and a digest
+    of the record. Changed records update their existing entity keys in
+    place and records with a deleted status in leader position 5 are
+    tombstoned.
+
+    :param marc_record: MARC record
+    :param redis_server: Redis datastore
+    :param compact: Boolean, packs the entities into the compact layout
+    :param metrics: Optional :class:`marc_batch.metrics.IngestMetrics`
+    :param datastores: Optional dict of Redis datastores by entity name
+    :rtype string: One of added, updated, unchanged, deleted, or skipped
+                   for a deleted record that was never ingested
+    """
+    bib_number = get_legacy_bib_number(marc_record)
+    if bib_number is None:
+        ingest_record(marc_record,
+                      redis_server,
+                      compact=compact,
+                      metrics=metrics,
+                      datastores=datastores)
+        return 'added'
+    if marc_record.leader[5] == 'd':
+        if tombstone_record(bib_number,redis_server,datastores):
+            return 'deleted'
+        return 'skipped'
+    bib_key = LEGACY_BIB_KEY.format(bib_number)
+    bib_info = redis_server.hgetall(bib_key)
+    digest = get_record_digest(marc_record)
+    if bib_info.get('digest') == digest and not bib_info.has_key('deleted'):
+        return 'unchanged'
+    entity_keys = {}
+    for entity_name in ["Work","Expression","Manifestation","Item"]:
+        if bib_info.has_key(entity_name):
+            entity_keys[entity_name] = bib_info[entity_name]
+            purge_entity(entity_datastore(entity_name,datastores),
+                         bib_info[entity_name],
+                         redis_server)
+    if len(entity_keys) > 0:
+        status = 'updated'
+    else:
+        status = 'added'
+    entity_keys = ingest_record(marc_record,
+                                redis_server,
+                                entity_keys,
+                                compact,
+                                metrics,
+                                datastores)
+    bib_pipeline = redis_server.pipeline()
+    bib_info = dict(entity_keys)
+    bib_info['digest'] = digest
+    bib_info['ingested'] = datetime.datetime.today().isoformat()
+    bib_pipeline.hmset(bib_key,bib_info)
+    bib_pipeline.hdel(bib_key,'deleted')
+    bib_pipeline.srem(DELETED_BIBS_KEY,bib_number)
+    bib_pipeline.sadd(LEGACY_BIBS_KEY,bib_number)
+    bib_pipeline.execute()
+    return status
+
+def ingest_records(marc_file_location,
+                   redis_server=redis_server,
+                   incremental=False,
+                   full_export=False,
+                   compact=False,
+                   metrics=None,
+                   job_log=None,
+                   reject_location=None,
+                   checkpoint_location=None):
+    """
+    Function ingests all of the MARC records in a file. An incremental
+    ingest skips unchanged records and updates changed records in place,
+    if the file is also a full export, any previously ingested bib numbers
+    missing from the file are tombstoned. A record that raises an error is
+    rejected and the ingest continues, with a checkpoint a stopped ingest
+    resumes after the last checkpointed record. The records after the
+    checkpoint are read again, so only an incremental ingest can resume.
+
+    :param marc_file_location: Path to MARC file
+    :param redis_server: Redis datastore
+    :param incremental: Boolean, only ingest new and changed records
+    :param full_export: Boolean, MARC file is a full export of the ILS
+    :param compact: Boolean, packs the entities into the compact layout
+    :param metrics: Optional :class:`marc_batch.metrics.IngestMetrics`,
+                    created if job_log is given
+    :param job_log: Optional :class:`marc_batch.models.RedisJobLog`, the
+                    JSON summary of the metrics is saved to the job log
+    :param reject_location: Optional path to the reject MARC file, the
+                            reasons are saved next to it
+    :param checkpoint_location: Optional path to the checkpoint file
+    :rtype dict: Counts of records by ingest status
+    """
+    load = RecordLoad(marc_file_location,
+                      stats={'added':0,'updated':0,'unchanged':0,'deleted':0,
+                             'skipped':0},
+                      reject_location=reject_location,
+                      checkpoint_location=checkpoint_location)
+    stats = load.stats
+    if metrics is None:
+        if job_log is None:
+            metrics = NULL_METRICS
+        else:
+            metrics = IngestMetrics()
+    try:
+        # The ingest's commands go through its own clients on the shared
+        # connection pools so the metrics only count them
+        redis_server = metrics.watch(redis_server)
+        datastores = {}
+        for entity_name in ["Work","Expression","Manifestation","Item"]:
+            datastores[entity_name] = metrics.watch(entity_datastore(entity_name))
+        if incremental and full_export and not load.resumed:
+            redis_server.delete(LEGACY_BIBS_SEEN_KEY)
+        with load:
+            # Records written after the last checkpoint would be added
+            # again, an incremental ingest finds them by bib number and
+            # digest
+            if load.resumed and not incremental:
+                raise ValueError("Resuming {0} from a checkpoint requires an incremental ingest".format(marc_file_location))
+            for raw_record in metrics.iterate(load,'read'):
+                i = load.records
+                if not i%1000:
+                    sys.stderr.write(".")
+                if not i%10000:
+                    sys.stderr.write(str(i))
+                try:
+                    with metrics.stage('parse'):
+                        record = pymarc.Record(raw_record)
+                    if incremental:
+                        status = delta_ingest_record(record,
+                                                     redis_server,
+                                                     compact,
+                                                     metrics,
+                                                     datastores)
+                        if full_export:
+                            bib_number = get_legacy_bib_number(record)
+                            if bib_number is not None:
+                                redis_server.sadd(LEGACY_BIBS_SEEN_KEY,bib_number)
+                    else:
+                        ingest_record(record,
+                                      redis_server,
+                                      compact=compact,
+                                      metrics=metrics,
+                                      datastores=datastores)
+                        status = 'added'
+                except FATAL_ERRORS:
+                    raise
+                except Exception,e:
+                    load.reject(raw_record,e)
+                    continue
+                stats[status] += 1
+                metrics.record_finished()
+            # A rejected record's bib number may be missing from the seen
+            # set, so nothing is tombstoned until the rejects are fixed
+            if incremental and full_export and stats['rejected'] < 1:
+                missing_bibs = redis_server.sdiff(LEGACY_BIBS_KEY,
+                                                  LEGACY_BIBS_SEEN_KEY,
+                                                  DELETED_BIBS_KEY)
+                for bib_number in missing_bibs:
+                    if tombstone_record(bib_number,redis_server,datastores):
+                        stats['deleted'] += 1
+                redis_server.delete(LEGACY_BIBS_SEEN_KEY)
+    finally:
+        metrics.unwatch()
+    metrics.finish()
+    if job_log is not None:
+        metrics.save(job_log)
+    return stats
+
+def reingest_records(marc_file_location,
+                     bib_numbers,
+                     redis_server=redis_server,
+                     compact=False):
+    """
+    Function re-ingests single records from a MARC file by bib number or
+    001 with the file's :class:`marc_batch.marc_index.MARCIndex`, the index
+    is built the first time. Records are only ingested if new or changed.
+
+    :param marc_file_location: Path to MARC file
+    :param bib_numbers: List of legacy bib numbers or 001 values
+    :param redis_server: Redis datastore
+    :param compact: Boolean, packs the entities into the compact layout
+    :rtype dict: Counts of records by ingest status, bib numbers not in
+                 the MARC file are counted as missing
+    """
+    stats = {'added':0,'updated':0,'unchanged':0,'deleted':0,'skipped':0,
+             'missing':0}
+    marc_index = open_index(marc_file_location)
+    try:
+        for bib_number in bib_numbers:
+            record = marc_index.get_record(bib_number)
+            if record is None:
+                stats['missing'] += 1
+                continue
+            stats[delta_ingest_record(record,redis_server,compact)] += 1
+    finally:
+        marc_index.close()
+    return stats
 
 def ingest_directory(marc_directory):
     walker = os.walk(marc_directory)
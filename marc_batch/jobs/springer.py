@@ -3,7 +3,7 @@
 """
 __author__ = 'Jeremy Nelson'
 
-from marc_batch.marc_helpers import MARCModifier
+from marc_batch.jobs.profiles import VendorProfileJob
 import urlparse
 from pymarc import Field
 
@@ -11,10 +11,12 @@ PROXY_LOCATION = 'http://0-www.springerlink.com.tiger.coloradocollege.edu/openur
 
 
 
-class SpringerEBookJob(MARCModifier):
+class SpringerEBookJob(VendorProfileJob):
     ''' Class reads SpringLink eBook MARC file, validates, and
         adds/modifies fields to a new import MARC record for importing
-        into TIGER iii database.'''
+        into TIGER iii database. The leader, 006, and 008 edits are in
+        the springer vendor profile.'''
+    profile_name = 'springer'
 
     def __init__(self,
                  marc_file,
@@ -25,7 +27,7 @@ class SpringerEBookJob(MARCModifier):
         :param public_note: Optional public note, default is 'View online'
         :param note_prefix: Optional note prefix, default is 'Available via Internet'
         '''
-        MARCModifier.__init__(self,marc_file)
+        VendorProfileJob.__init__(self,marc_file)
         self.spr_url = 'http://www.springerlink.com/openurl.asp?genre=book&id=doi:'
         if kwargs.has_key('proxy'):
             self.spr_proxy = kwargs.get('proxy')
@@ -40,34 +42,6 @@ class SpringerEBookJob(MARCModifier):
         else:
             self.note_prefix='Available via Internet'
 
-    def processLeader(self,marc_leader):
-        ''' 
-        Method validates/sets leader positions for Spring MARC record.
-
-        :param marc_leader: MARC file leader
-        '''
-        # Checks/sets record type in position 6
-        if marc_leader[6-1] != 'a':
-            marc_leader = marc_leader[0:5] + 'a' + marc_leader[6:]
-        # Checks/sets Encoding level in position 17
-        if marc_leader[17-1] != 'u':
-            marc_leader = marc_leader[0:16] + 'u' + marc_leader[17:]
-        return marc_leader
-
-    def processRecord(self,marc_record): 
-        ''' 
-        Callback method called by base class load method, Springer 
-        eBook specific validation. 
- 
-        :param marc_record: MARC record 
-        ''' 
-        marc_record.leader = self.processLeader(marc_record.leader) 
-        marc_record = self.validate001(marc_record) 
-        marc_record = self.validate006(marc_record) 
-        marc_record = self.validate008(marc_record)         
-        marc_record = self.processSpringerURLs(marc_record)         
-        return marc_record 
- 
     def validate001(self,marc_record): 
         ''' Method sets 001 Control Number of CC's format. 
  
@@ -87,43 +61,6 @@ class SpringerEBookJob(MARCModifier):
         return marc_record
 
 
-    def validate006(self,marc_record):
-        ''' 
-        Method checks/sets 006 fixed length data elements in MARC
-        record.
-
-        :param marc_record: MARC record 
-        '''
-        existing_fields = marc_record.get_fields('006')
-        if existing_fields:
-            field006 = existing_fields[0]
-            marc_record.remove_field(field006)
-        else:
-            field006 = Field(tag='006',indicators=None)
-        field006.data = r'm        d        '
-        marc_record.add_field(field006)
-        return marc_record
-
-
-    def validate008(self,marc_record):
-        ''' 
-        Method checks/sets 008 fixed length data elements in MARC
-        record.
-
-        :param marc_record: MARC record 
-        '''
-        field008 = marc_record.get_fields('008')[0]
-        marc_record.remove_field(field008)
-        # Form of item
-        if field008.data[24-1] != 's':
-            field008.data = field008.data[0:23] + 's' + field008.data[24:]
-        # Nature of content, set to None
-        if field008.data[27-1]:
-            field008.data = field008.data[0:26] +  r' ' + field008.data[27:]
-        marc_record.add_field(field008)
-        return marc_record
-
-
     def processSpringerURLs(self,marc_record):
         '''
         Method overrides parent processURLS for Springer specific
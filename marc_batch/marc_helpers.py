@@ -6,8 +6,303 @@ import sys,datetime,logging
 import urlparse,urllib2,re
 import os,codecs
 import cStringIO
+import multiprocessing
 from pymarc import Field
 import pymarc
+from marc_batch.recovery import iter_raw_records,error_reason,FATAL_ERRORS
+
+# Number of records sent to a worker process at a time by a
+# multi-process MARCModifier.load
+LOAD_BATCH_SIZE = 100
+
+class IndexedRecord(pymarc.Record):
+    """
+    :class:`IndexedRecord` is a MARC record that keeps an index of its
+    fields by tag so get_fields, add_field, and remove_field don't scan
+    the whole field list. Used by :class:`MARCModifier` to apply all of a
+    vendor's field edits before materializing the sorted fields once.
+    """
+
+    def __init__(self,marc_record=None):
+        """
+        Initializes `IndexedRecord`
+
+        :param marc_record: Optional MARC record to index
+        """
+        self.tag_index = {}
+        self.sequence = {}
+        self.next_sequence = 0
+        pymarc.Record.__init__(self)
+        if marc_record is not None:
+            self.leader = marc_record.leader
+            self.force_utf8 = marc_record.force_utf8
+            self.add_field(*marc_record.fields)
+
+    def __getitem__(self,tag):
+        tag_fields = self.tag_index.get(tag)
+        if tag_fields:
+            return tag_fields[0]
+        return None
+
+    def __get_fields__(self):
+        return self.get_fields()
+
+    def __set_fields__(self,fields):
+        self.tag_index = {}
+        self.sequence = {}
+        self.add_field(*fields)
+
+    fields = property(__get_fields__,__set_fields__)
+
+    def add_field(self,*fields):
+        for field in fields:
+            self.sequence[id(field)] = self.next_sequence
+            self.next_sequence += 1
+            if self.tag_index.has_key(field.tag):
+                self.tag_index[field.tag].append(field)
+            else:
+                self.tag_index[field.tag] = [field,]
+
+    def get_fields(self,*args):
+        if len(args) == 1:
+            return list(self.tag_index.get(args[0],[]))
+        if len(args) < 1:
+            args = self.tag_index.keys()
+        fields = []
+        for tag in args:
+            fields.extend(self.tag_index.get(tag,[]))
+        # Keeps record order when fields of more than one tag are requested
+        fields.sort(key=lambda field: self.sequence[id(field)])
+        return fields
+
+    def remove_field(self,*fields):
+        for field in fields:
+            try:
+                self.tag_index.get(field.tag,[]).remove(field)
+            except ValueError:
+                raise pymarc.FieldNotFound
+            self.sequence.pop(id(field),None)
+            if len(self.tag_index[field.tag]) < 1:
+                self.tag_index.pop(field.tag)
+
+    def remove_tags(self,*tags):
+        """
+        Method removes all fields for each tag
+
+        :param tags: MARC tags
+        """
+        for tag in tags:
+            for field in self.tag_index.pop(tag,[]):
+                self.sequence.pop(id(field),None)
+
+    def sorted_record(self):
+        """
+        Method returns a pymarc.Record with the fields sorted by tag,
+        fields with the same tag stay in the order they were added
+        """
+        marc_record = pymarc.Record()
+        marc_record.leader = self.leader
+        marc_record.force_utf8 = self.force_utf8
+        for tag in sorted(self.tag_index.keys()):
+            marc_record.fields.extend(self.tag_index[tag])
+        return marc_record
+
+class RawRecord(object):
+    """
+    :class:`RawRecord` holds the raw ISO 2709 bytes of a MARC record in a
+    bytearray. Leader and control field edits are patched in place and
+    variable fields are only parsed into pymarc Fields when an edit asks
+    for them, every other field is written back byte for byte. Supports
+    the get_fields, __getitem__, add_field, remove_field, and leader parts
+    of the pymarc.Record interface used by the vendor jobs.
+    """
+
+    def __init__(self,raw_record,reader_settings=None):
+        """
+        Initializes `RawRecord`
+
+        :param raw_record: Raw ISO 2709 bytes of a MARC record
+        :param reader_settings: Optional dict of the MARC reader's
+                                to_unicode, force_utf8, hide_utf8_warnings,
+                                and utf8_handling settings
+        """
+        self.reader_settings = reader_settings or {}
+        self.force_utf8 = self.reader_settings.get('force_utf8',False)
+        self.data = bytearray(raw_record)
+        record_view = memoryview(self.data)
+        self.leader_view = record_view[0:24]
+        base_address = int(raw_record[12:17])
+        if base_address <= 24 or base_address >= len(raw_record):
+            raise pymarc.BaseAddressInvalid
+        # Each entry is a tag and either a memoryview of the field's
+        # bytes, including the field terminator, or a parsed Field
+        self.entries = []
+        for entry_start in xrange(24,base_address-1,12):
+            tag = raw_record[entry_start:entry_start+3]
+            length = int(raw_record[entry_start+3:entry_start+7])
+            offset = base_address + int(raw_record[entry_start+7:entry_start+12])
+            self.entries.append([tag,record_view[offset:offset+length]])
+
+    def __getstate__(self):
+        return {'raw_record':self.as_marc(),
+                'reader_settings':self.reader_settings}
+
+    def __setstate__(self,state):
+        self.__init__(state['raw_record'],state['reader_settings'])
+
+    def __get_leader__(self):
+        return self.leader_view.tobytes()
+
+    def __set_leader__(self,leader):
+        if isinstance(leader,unicode):
+            leader = leader.encode('utf-8')
+        self.leader_view[0:24] = leader[0:24]
+
+    leader = property(__get_leader__,__set_leader__)
+
+    def __parse_entry__(self,entry):
+        """
+        Helper method parses an entry's raw bytes into a pymarc Field
+        the same way as pymarc.Record.decode_marc, the entry keeps the
+        Field so later edits are written back
+
+        :param entry: Entry list of tag and memoryview or Field
+        """
+        if isinstance(entry[1],Field):
+            return entry[1]
+        tag,entry_data = entry[0],entry[1][:-1].tobytes()
+        if tag < '010' and tag.isdigit():
+            field = Field(tag=tag,data=entry_data)
+        else:
+            subfields = list()
+            subs = entry_data.split(pymarc.constants.SUBFIELD_INDICATOR)
+            for subfield in subs[1:]:
+                if len(subfield) == 0:
+                    continue
+                code,data = subfield[0],subfield[1:]
+                if self.reader_settings.get('to_unicode',False):
+                    if self.leader[9] == 'a' or self.force_utf8:
+                        data = data.decode('utf-8',
+                                           self.reader_settings.get('utf8_handling','strict'))
+                    else:
+                        data = pymarc.marc8_to_unicode(data,
+                                                       self.reader_settings.get('hide_utf8_warnings',False))
+                subfields.extend([code,data])
+            field = Field(tag=tag,
+                          indicators=[subs[0][0],subs[0][1]],
+                          subfields=subfields)
+        entry[1] = field
+        return field
+
+    def __getitem__(self,tag):
+        for entry in self.entries:
+            if entry[0] == tag:
+                return self.__parse_entry__(entry)
+        return None
+
+    def get_fields(self,*args):
+        if len(args) < 1:
+            return [self.__parse_entry__(entry) for entry in self.entries]
+        return [self.__parse_entry__(entry) for entry in self.entries if entry[0] in args]
+
+    def add_field(self,*fields):
+        for field in fields:
+            self.entries.append([field.tag,field])
+
+    def remove_field(self,*fields):
+        for field in fields:
+            for i,entry in enumerate(self.entries):
+                if entry[1] is field:
+                    self.entries.pop(i)
+                    break
+            else:
+                raise pymarc.FieldNotFound
+
+    def remove_tags(self,*tags):
+        """
+        Method removes all fields for each tag without parsing them
+
+        :param tags: MARC tags
+        """
+        self.entries = [entry for entry in self.entries if not entry[0] in tags]
+
+    def edit_control(self,tag,edit_function):
+        """
+        Method edits the data of a control field without parsing, the
+        bytes are patched in place when the length doesn't change
+
+        :param tag: Control field tag
+        :param edit_function: Function takes and returns the field data
+        """
+        for entry in self.entries:
+            if entry[0] != tag:
+                continue
+            if isinstance(entry[1],Field):
+                entry[1].data = edit_function(entry[1].data)
+                continue
+            old_data = entry[1][:-1].tobytes()
+            new_data = edit_function(old_data)
+            if isinstance(new_data,unicode):
+                new_data = new_data.encode('utf-8')
+            if new_data == old_data:
+                continue
+            if len(new_data) == len(old_data):
+                entry[1][:-1] = new_data
+            else:
+                entry[1] = memoryview(bytearray(new_data+pymarc.constants.END_OF_FIELD))
+
+    def sort_fields(self):
+        """
+        Method sorts the fields by tag, fields with the same tag stay
+        in record order
+        """
+        self.entries.sort(key=lambda entry: entry[0])
+
+    def as_marc(self):
+        """
+        Method returns the record serialized as ISO 2709 bytes, unparsed
+        fields are copied from the original bytes
+        """
+        leader = self.leader
+        encode_fields = leader[9] == 'a' or self.force_utf8
+        directory = bytearray()
+        fields = bytearray()
+        for tag,entry_data in self.entries:
+            if isinstance(entry_data,Field):
+                entry_data = entry_data.as_marc()
+                if encode_fields:
+                    entry_data = entry_data.encode('utf-8')
+            if tag.isdigit():
+                directory += '%03d' % int(tag)
+            else:
+                directory += '%03s' % tag
+            directory += '%04d%05d' % (len(entry_data),len(fields))
+            fields += entry_data
+        directory += pymarc.constants.END_OF_FIELD
+        fields += pymarc.constants.END_OF_RECORD
+        base_address = 24 + len(directory)
+        leader = '%05d%s%05d%s' % (base_address + len(fields),
+                                   leader[5:12],
+                                   base_address,
+                                   leader[17:])
+        return str(leader + directory + fields)
+
+    def as_record(self):
+        """
+        Method returns the record as a pymarc.Record
+        """
+        return pymarc.Record(self.as_marc(),**self.reader_settings)
+
+# Each worker process of a multi-process load holds its own copy
+# of the MARCModifier
+worker_modifier = None
+
+def __init_load_worker__(modifier):
+    global worker_modifier
+    worker_modifier = modifier
+
+def __transform_raw_record__(raw_record):
+    return worker_modifier.tryTransformRaw(raw_record)
 
 
 class MARCModifier(object):
@@ -16,6 +311,10 @@ class MARCModifier(object):
     classes provide validation methods and methods for adding/
     modifying MARC fields and indicators for import
     """
+    removed_tags = ['009','509','648']
+    # Child classes set processRawRecord to a method taking a RawRecord
+    # to skip the full pymarc parse, see transformRaw
+    processRawRecord = None
 
     def __init__(self,
                  *args):
@@ -28,26 +327,146 @@ class MARCModifier(object):
                                                      utf8_handling='ignore')
         if len(args) == 2:
             self.marcfile_output = args[1]
+        if hasattr(self,'marc_reader'):
+            self.reader_settings = {'to_unicode':self.marc_reader.to_unicode,
+                                    'force_utf8':self.marc_reader.force_utf8,
+                                    'hide_utf8_warnings':self.marc_reader.hide_utf8_warnings,
+                                    'utf8_handling':self.marc_reader.utf8_handling}
         self.records = []
-        self.stats = {'records':0}
+        self.rejects = []
+        self.stats = {'records':0,'rejected':0}
+
+    def __getstate__(self):
+        """
+        Worker processes of a multi-process load get a copy of the
+        modifier without the MARC reader's file handle or loaded records
+        """
+        state = self.__dict__.copy()
+        state.pop('marc_reader',None)
+        state['records'] = []
+        return state
 
-    def load(self):
+    def load(self,processes=1,batch_size=LOAD_BATCH_SIZE,reject_file=None):
         ''' Method iterates through MARC reader, loads specific MARC records
-            from reader.
+            from reader. With more than one process, the raw records are
+            sent in batches to worker processes and reassembled in the same
+            order as the MARC file. A record that raises an error is
+            skipped and its reason added to rejects.
+
+        :param processes: Number of worker processes, default is 1
+        :param batch_size: Records per worker batch, default is LOAD_BATCH_SIZE
+        :param reject_file: Optional :class:`marc_batch.recovery.RejectFile`
+                            for the rejected records
         '''
-        for record in self.marc_reader:
-            if record is None:
-                break
-            raw_record = self.processRecord(record)
-            # Removes 009, 509, and 648 fields if they exist
-            raw_record = self.remove009(raw_record)
-            raw_record = self.remove509(raw_record)
-            raw_record = self.remove648(raw_record)
-            raw_record.fields = sorted(raw_record.fields,key=lambda x: x.tag)
-            self.records.append(raw_record)
+        raw_records = iter_raw_records(self.marc_reader.file_handle)
+        if processes < 2:
+            self.__add_results__((self.tryTransformRaw(raw_record)
+                                  for raw_record in raw_records),
+                                 reject_file)
+            return
+        pool = multiprocessing.Pool(processes,
+                                    __init_load_worker__,
+                                    (self,))
+        try:
+            self.__add_results__(pool.imap(__transform_raw_record__,
+                                           raw_records,
+                                           batch_size),
+                                 reject_file)
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def __add_results__(self,results,reject_file=None):
+        '''
+        Helper method adds transformed records to records and rejected
+        records to rejects
+
+        :param results: Iterator of tryTransformRaw results
+        :param reject_file: Optional RejectFile
+        '''
+        offset = 0
+        for record,reason,raw_record,length in results:
             self.stats['records'] += 1
-        
-        
+            if reason is None:
+                self.records.append(record)
+            else:
+                self.stats['rejected'] += 1
+                self.rejects.append((self.stats['records'],reason))
+                if reject_file is not None:
+                    reject_file.reject(raw_record,
+                                       reason,
+                                       self.stats['records'],
+                                       offset)
+            offset += length
+
+    def tryTransformRaw(self,raw_record):
+        '''
+        Method transforms a raw MARC record, returns a tuple of the
+        transformed record, the reason if the record was rejected, the
+        raw record if rejected, and the raw record's length. Only rejected
+        raw records are sent back from the worker processes.
+
+        :param raw_record: Raw MARC record
+        '''
+        try:
+            return self.transformRaw(raw_record),None,None,len(raw_record)
+        except FATAL_ERRORS:
+            raise
+        except Exception,e:
+            return None,error_reason(e),raw_record,len(raw_record)
+
+    def parseRecord(self,raw_record):
+        '''
+        Method parses raw ISO 2709 bytes into a MARC record with the same
+        settings as the MARC reader
+
+        :param raw_record: Raw MARC record
+        '''
+        return pymarc.Record(raw_record,
+                             to_unicode=self.reader_settings['to_unicode'],
+                             force_utf8=self.reader_settings['force_utf8'],
+                             hide_utf8_warnings=self.reader_settings['hide_utf8_warnings'],
+                             utf8_handling=self.reader_settings['utf8_handling'])
+
+    def transformRaw(self,raw_record):
+        '''
+        Method transforms the raw ISO 2709 bytes of a MARC record. If the
+        job has a processRawRecord method, the raw record is edited in
+        place, a full parse with transformRecord is only done when
+        processRawRecord returns None.
+
+        :param raw_record: Raw MARC record
+        '''
+        if self.processRawRecord is not None:
+            try:
+                marc_record = self.processRawRecord(RawRecord(raw_record,
+                                                              self.reader_settings))
+            except pymarc.PymarcException:
+                marc_record = None
+            if marc_record is not None:
+                marc_record.remove_tags(*self.removed_tags)
+                marc_record.sort_fields()
+                return marc_record
+        return self.transformRecord(self.parseRecord(raw_record))
+
+    def transformRecord(self,marc_record):
+        '''
+        Method applies the vendor processRecord and the common removals
+        to a tag indexed copy of a MARC record, returns the record with
+        sorted fields
+
+        :param marc_record: MARC record
+        '''
+        raw_record = self.processRecord(IndexedRecord(marc_record))
+        if not isinstance(raw_record,IndexedRecord):
+            raw_record = IndexedRecord(raw_record)
+        # Removes 009, 509, and 648 fields if they exist
+        raw_record.remove_tags(*self.removed_tags)
+        return raw_record.sorted_record()
+
 
     def processRecord(self,marc_record):
         ''' Method should be overriddden by derived classes.'''
@@ -119,7 +538,10 @@ class MARCModifier(object):
         output_string = cStringIO.StringIO()
         marc_writer = pymarc.MARCWriter(output_string)
         for record in self.records:
-            marc_writer.write(record)
+            if isinstance(record,RawRecord):
+                output_string.write(record.as_marc())
+            else:
+                marc_writer.write(record)
         return output_string.getvalue()
 
   
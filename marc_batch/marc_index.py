@@ -0,0 +1,225 @@
+"""
+ :mod:`marc_index` Byte offset index of a MARC file by bib number and 001
+ for random access to single records. The index is saved next to the MARC
+ file with an .idx extension as fixed width entries sorted by key, both
+ files are read with mmap so a lookup is a binary search without reading
+ or parsing the rest of the MARC file.
+"""
+__author__ = "Jeremy Nelson"
+
+import os,mmap,struct
+import pymarc
+from marc_batch.marc_helpers import RawRecord
+from marc_batch.recovery import iter_raw_records
+
+INDEX_EXTENSION = '.idx'
+INDEX_MAGIC = 'MARCIDX1'
+# Header is the magic, the MARC file's size and modified time, and the
+# number of entries
+HEADER = struct.Struct('<8sQQI')
+# Each entry is a key padded with nulls, byte offset, and record length
+KEY_WIDTH = 32
+ENTRY = struct.Struct('<{0}sQI'.format(KEY_WIDTH))
+
+
+def index_location(marc_location):
+    """
+    Function returns the default index location for a MARC file
+
+    :param marc_location: Path to MARC file
+    """
+    return "{0}{1}".format(marc_location,INDEX_EXTENSION)
+
+def record_keys(raw_record):
+    """
+    Function returns the index keys for a raw MARC record, the legacy bib
+    number from the 907 subfield a and the 001, only the 001 and 907
+    fields are parsed
+
+    :param raw_record: Raw MARC record
+    """
+    keys = []
+    marc_record = RawRecord(raw_record)
+    field907 = marc_record['907']
+    if field907 is not None:
+        raw_bib_number = ''.join(field907.get_subfields('a'))
+        if len(raw_bib_number) > 2:
+            keys.append(raw_bib_number[1:-1])
+    field001 = marc_record['001']
+    if field001 is not None:
+        control_number = field001.data.strip()
+        if len(control_number) > 0 and not control_number in keys:
+            keys.append(control_number)
+    return [key for key in keys if len(key) <= KEY_WIDTH]
+
+def file_signature(marc_location):
+    """
+    Function returns the size and modified time of a MARC file, saved in
+    the index header to detect a changed MARC file
+
+    :param marc_location: Path to MARC file
+    """
+    marc_stat = os.stat(marc_location)
+    return marc_stat.st_size,int(marc_stat.st_mtime)
+
+def build_index(marc_location,location=None):
+    """
+    Function builds the index for a MARC file, records that can't be
+    read for keys are left out of the index
+
+    :param marc_location: Path to MARC file
+    :param location: Optional index location, default is the MARC
+                     location with an .idx extension
+    :rtype int: Number of index entries
+    """
+    if location is None:
+        location = index_location(marc_location)
+    entries = []
+    offset = 0
+    marc_file = open(marc_location,'rb')
+    for raw_record in iter_raw_records(marc_file):
+        try:
+            keys = record_keys(raw_record)
+        except (pymarc.PymarcException,ValueError):
+            keys = []
+        for key in keys:
+            entries.append((key,offset,len(raw_record)))
+        offset += len(raw_record)
+    marc_file.close()
+    # Stable sort keeps records with the same key in file order
+    entries.sort(key=lambda entry: entry[0])
+    size,modified = file_signature(marc_location)
+    temp_location = "{0}.tmp".format(location)
+    index_file = open(temp_location,'wb')
+    index_file.write(HEADER.pack(INDEX_MAGIC,size,modified,len(entries)))
+    for key,offset,length in entries:
+        index_file.write(ENTRY.pack(key,offset,length))
+    index_file.close()
+    if os.path.exists(location):
+        os.remove(location)
+    os.rename(temp_location,location)
+    return len(entries)
+
+def open_index(marc_location,location=None):
+    """
+    Function returns the :class:`MARCIndex` for a MARC file, building
+    the index if it doesn't exist or the MARC file has changed
+
+    :param marc_location: Path to MARC file
+    :param location: Optional index location
+    """
+    if location is None:
+        location = index_location(marc_location)
+    if os.path.exists(location):
+        marc_index = MARCIndex(marc_location,location)
+        if not marc_index.is_stale():
+            return marc_index
+        marc_index.close()
+    build_index(marc_location,location)
+    return MARCIndex(marc_location,location)
+
+
+class MARCIndex(object):
+    """
+    :class:`MARCIndex` looks up and reads single records from a MARC file
+    with its memory mapped index
+    """
+
+    def __init__(self,marc_location,location=None):
+        """
+        Initializes `MARCIndex`
+
+        :param marc_location: Path to MARC file
+        :param location: Optional index location
+        """
+        if location is None:
+            location = index_location(marc_location)
+        self.marc_location = marc_location
+        self.location = location
+        self.index_file = open(location,'rb')
+        self.index_map = mmap.mmap(self.index_file.fileno(),
+                                   0,
+                                   access=mmap.ACCESS_READ)
+        magic,self.size,self.modified,self.count = HEADER.unpack_from(self.index_map,0)
+        if magic != INDEX_MAGIC:
+            self.close()
+            raise ValueError("{0} is not a MARC index".format(location))
+        self.marc_file = open(marc_location,'rb')
+        self.marc_map = None
+        if os.path.getsize(marc_location) > 0:
+            self.marc_map = mmap.mmap(self.marc_file.fileno(),
+                                      0,
+                                      access=mmap.ACCESS_READ)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self,key):
+        return len(self.lookup(key)) > 0
+
+    def __entry__(self,position):
+        return ENTRY.unpack_from(self.index_map,
+                                 HEADER.size+position*ENTRY.size)
+
+    def is_stale(self):
+        """
+        Checks if the MARC file changed after the index was built
+        """
+        return (self.size,self.modified) != file_signature(self.marc_location)
+
+    def lookup(self,key):
+        """
+        Returns a list of (offset,length) tuples for the records with a
+        key, in MARC file order
+
+        :param key: Bib number or 001
+        """
+        if len(key) > KEY_WIDTH:
+            return []
+        padded_key = key.ljust(KEY_WIDTH,'\x00')
+        low,high = 0,self.count
+        while low < high:
+            middle = (low+high)//2
+            if self.__entry__(middle)[0] < padded_key:
+                low = middle+1
+            else:
+                high = middle
+        locations = []
+        while low < self.count:
+            entry_key,offset,length = self.__entry__(low)
+            if entry_key != padded_key:
+                break
+            locations.append((offset,length))
+            low += 1
+        return locations
+
+    def get_raw_records(self,key):
+        """
+        Returns the raw ISO 2709 bytes of each record with a key
+
+        :param key: Bib number or 001
+        """
+        return [self.marc_map[offset:offset+length]
+                for offset,length in self.lookup(key)]
+
+    def get_record(self,key,**reader_settings):
+        """
+        Returns the first MARC record with a key, or None
+
+        :param key: Bib number or 001
+        :param reader_settings: Optional pymarc.Record keyword arguments,
+                                i.e. to_unicode or utf8_handling
+        """
+        raw_records = self.get_raw_records(key)
+        if len(raw_records) < 1:
+            return None
+        return pymarc.Record(raw_records[0],**reader_settings)
+
+    def close(self):
+        if self.marc_map is not None:
+            self.marc_map.close()
+            self.marc_map = None
+        if hasattr(self,'marc_file'):
+            self.marc_file.close()
+        self.index_map.close()
+        self.index_file.close()
@@ -0,0 +1,292 @@
+"""
+ :mod:`metrics` Throughput and latency instrumentation for the MARC
+ ingest pipelines, used by :mod:`marc_batch.jobs.rdaCore_redis` and
+ :mod:`orders.redis_helpers`
+"""
+__author__ = "Jeremy Nelson"
+
+import time,math,json
+import redis
+
+# Latencies are counted in logarithmic buckets of 10% width so the
+# histogram stays small for million record loads
+BUCKET_BASE = 1.1
+
+
+class NullMetrics(object):
+    """
+    :class:`NullMetrics` has the same stage interface as
+    :class:`IngestMetrics` but does nothing, used as the default when a
+    pipeline isn't instrumented.
+    """
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,*args):
+        return False
+
+    def start(self,name):
+        pass
+
+    def stop(self,name):
+        pass
+
+    def stage(self,name):
+        return self
+
+    def iterate(self,marc_reader,name='parse'):
+        return marc_reader
+
+    def record_finished(self):
+        pass
+
+    def watch(self,redis_server):
+        return redis_server
+
+    def unwatch(self):
+        pass
+
+    def finish(self):
+        pass
+
+NULL_METRICS = NullMetrics()
+
+
+class StageTimer(object):
+    """
+    :class:`StageTimer` is a context manager for timing a stage of
+    an ingest pipeline
+    """
+
+    def __init__(self,metrics,name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.metrics.start(self.name)
+        return self
+
+    def __exit__(self,*args):
+        self.metrics.stop(self.name)
+        return False
+
+
+class MeteredRedis(redis.StrictRedis):
+    """
+    :class:`MeteredRedis` is a Redis client that counts its round-trips
+    in an :class:`IngestMetrics`, each command and each pipeline execute
+    is one round-trip. A job gets its own client on the connection pool
+    of a shared datastore so the commands of other requests aren't
+    counted.
+    """
+
+    def __init__(self,metrics,**kwargs):
+        """
+        Initializes `MeteredRedis`
+
+        :param metrics: :class:`IngestMetrics`
+        """
+        redis.StrictRedis.__init__(self,**kwargs)
+        self.metrics = metrics
+
+    def count_round_trip(self):
+        """
+        Adds a round-trip to the metrics until they are unwatched
+        """
+        if self.metrics is not None:
+            self.metrics.round_trips += 1
+
+    def execute_command(self,*args,**options):
+        self.count_round_trip()
+        return redis.StrictRedis.execute_command(self,*args,**options)
+
+    def pipeline(self,*args,**kwargs):
+        redis_pipeline = redis.StrictRedis.pipeline(self,*args,**kwargs)
+        pipeline_execute = redis_pipeline.execute
+        def counted_execute(*execute_args,**execute_kwargs):
+            self.count_round_trip()
+            return pipeline_execute(*execute_args,**execute_kwargs)
+        redis_pipeline.execute = counted_execute
+        return redis_pipeline
+
+
+class IngestMetrics(object):
+    """
+    :class:`IngestMetrics` collects per-stage timers, Redis round-trip
+    counts, records per second, and a per-record latency histogram for
+    an ingest pipeline.
+    """
+
+    def __init__(self,callback=None,callback_every=1000):
+        """
+        Initializes `IngestMetrics`
+
+        :param callback: Optional function called with this object
+                         every callback_every records and when finished
+        :param callback_every: Number of records between callbacks,
+                               default is 1000
+        """
+        self.callback = callback
+        self.callback_every = callback_every
+        self.histogram = {}
+        self.max_latency = 0.0
+        self.records = 0
+        self.round_trips = 0
+        self.stages = {}
+        self.started = time.time()
+        self.finished = None
+        self.__record_start__ = None
+        self.__stage_starts__ = {}
+        self.__watched__ = []
+
+    def start(self,name):
+        """
+        Starts the timer for a stage
+
+        :param name: Stage name, i.e. parse, rules, redis
+        """
+        self.__stage_starts__[name] = time.time()
+
+    def stop(self,name):
+        """
+        Stops the timer for a stage and adds the elapsed time to the
+        stage's totals
+
+        :param name: Stage name
+        """
+        started = self.__stage_starts__.pop(name,None)
+        if started is None:
+            return
+        if not self.stages.has_key(name):
+            self.stages[name] = {'count':0,'seconds':0.0}
+        self.stages[name]['count'] += 1
+        self.stages[name]['seconds'] += time.time() - started
+
+    def stage(self,name):
+        """
+        Returns a context manager for timing a stage
+
+        :param name: Stage name
+        """
+        return StageTimer(self,name)
+
+    def iterate(self,marc_reader,name='parse'):
+        """
+        Generator wraps a MARC reader, timing the parse of each record
+        as a stage and starting the record's latency timer
+
+        :param marc_reader: Iterator of MARC records
+        :param name: Stage name, default is parse
+        """
+        marc_iterator = iter(marc_reader)
+        while True:
+            self.__record_start__ = time.time()
+            self.start(name)
+            try:
+                record = marc_iterator.next()
+            except StopIteration:
+                self.__stage_starts__.pop(name,None)
+                self.__record_start__ = None
+                return
+            self.stop(name)
+            yield record
+
+    def record_finished(self):
+        """
+        Adds the latency of the current record to the histogram, calls
+        the callback every callback_every records
+        """
+        if self.__record_start__ is None:
+            return
+        latency = time.time() - self.__record_start__
+        self.__record_start__ = None
+        self.records += 1
+        if latency > self.max_latency:
+            self.max_latency = latency
+        bucket = int(math.log(max(latency*1000000.0,1.0),BUCKET_BASE))
+        self.histogram[bucket] = self.histogram.get(bucket,0) + 1
+        if self.callback is not None and not self.records%self.callback_every:
+            self.callback(self)
+
+    def percentile(self,percent):
+        """
+        Returns the per-record latency in milliseconds at a percentile,
+        accurate to the histogram's bucket width
+
+        :param percent: Percentile, i.e. 50 or 99
+        """
+        if self.records < 1:
+            return None
+        threshold = self.records*(percent/100.0)
+        running_total = 0
+        for bucket in sorted(self.histogram.keys()):
+            running_total += self.histogram[bucket]
+            if running_total >= threshold:
+                return round(min(BUCKET_BASE**(bucket+1)/1000.0,
+                                 self.max_latency*1000.0),4)
+        return round(self.max_latency*1000.0,4)
+
+    def watch(self,redis_server):
+        """
+        Returns a :class:`MeteredRedis` client on the connection pool of
+        a Redis client that counts its round-trips until :meth:`unwatch`.
+        The job uses the returned client, the shared client isn't changed.
+
+        :param redis_server: Redis client
+        :rtype: :class:`MeteredRedis`
+        """
+        metered_server = MeteredRedis(self,
+                                      connection_pool=redis_server.connection_pool)
+        self.__watched__.append(metered_server)
+        return metered_server
+
+    def unwatch(self):
+        """
+        Stops counting the round-trips of all watched Redis clients
+        """
+        for metered_server in self.__watched__:
+            metered_server.metrics = None
+        self.__watched__ = []
+
+    def finish(self):
+        """
+        Stops the metrics, unwatches Redis clients and calls the callback
+        a final time
+        """
+        self.finished = time.time()
+        self.unwatch()
+        if self.callback is not None:
+            self.callback(self)
+
+    def summary(self):
+        """
+        Returns a dict summary of the metrics suitable for JSON
+        serialization
+        """
+        elapsed = (self.finished or time.time()) - self.started
+        stages = {}
+        for name,info in self.stages.iteritems():
+            stages[name] = {'count':info['count'],
+                            'seconds':round(info['seconds'],4),
+                            'mean_ms':round(info['seconds']*1000.0/max(info['count'],1),4)}
+        output = {'records':self.records,
+                  'elapsed_seconds':round(elapsed,4),
+                  'records_per_second':round(self.records/max(elapsed,0.000001),2),
+                  'round_trips':self.round_trips,
+                  'round_trips_per_record':round(self.round_trips/float(max(self.records,1)),2),
+                  'latency_ms':{'p50':self.percentile(50),
+                                'p99':self.percentile(99),
+                                'max':round(self.max_latency*1000.0,4)},
+                  'stages':stages}
+        return output
+
+    def save(self,job_log):
+        """
+        Saves the JSON summary to a job log's metrics field
+
+        :param job_log: :class:`marc_batch.models.JobLog` with a metrics
+                        field, i.e. :class:`RedisJobLog`
+        """
+        job_log.metrics = json.dumps(self.summary())
+        job_log.save()
@@ -55,6 +55,10 @@ class RedisJobLog(JobLog):
     expressions = models.IntegerField(blank=True,null=True)
     items = models.IntegerField(blank=True,null=True)
     manifestations = models.IntegerField(blank=True,null=True)
+    # JSON summary of the ingest metrics, syncdb doesn't add the column
+    # to an existing table so existing databases need:
+    #   ALTER TABLE marc_batch_redisjoblog ADD COLUMN metrics text NULL;
+    metrics = models.TextField(blank=True,null=True)
     works = models.IntegerField(blank=True,null=True)
 
 class SolrJobLog(JobLog):
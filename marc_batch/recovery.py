@@ -0,0 +1,250 @@
+"""
+ :mod:`recovery` Record-level error isolation and resumable checkpoints
+ for long MARC loads. A record that raises an error is written with the
+ reason to a reject file and the load continues, the byte offset of the
+ last finished record is checkpointed so a stopped load resumes where it
+ stopped instead of restarting.
+"""
+__author__ = "Jeremy Nelson"
+
+import os,json
+import redis,pymarc
+
+# Number of records between saved checkpoints
+CHECKPOINT_EVERY = 1000
+# Errors that stop a load instead of rejecting the record, a lost Redis
+# connection would otherwise reject every remaining record
+FATAL_ERRORS = (redis.RedisError,MemoryError)
+
+
+def iter_raw_records(file_handle):
+    """
+    Generator yields the raw ISO 2709 bytes of each MARC record in a file
+    without parsing, using the record length in the first five bytes
+    of the leader
+
+    :param file_handle: MARC file handle
+    """
+    while True:
+        first5 = file_handle.read(5)
+        if not first5:
+            return
+        if len(first5) < 5:
+            raise pymarc.RecordLengthInvalid
+        length = int(first5)
+        yield first5 + file_handle.read(length - 5)
+
+def error_reason(error):
+    """
+    Function returns a single line reason for a rejected record
+
+    :param error: Exception raised by the record
+    """
+    try:
+        message = str(error)
+    except UnicodeError:
+        message = repr(error.args)
+    reason = "{0}: {1}".format(error.__class__.__name__,message)
+    return " ".join(reason.split())
+
+
+class RejectFile(object):
+    """
+    :class:`RejectFile` writes rejected raw MARC records to a MARC file,
+    so they can be corrected and loaded again, and the reasons to a tab
+    delimited text file with the same name. Both files are only created
+    when the first record is rejected.
+    """
+
+    def __init__(self,location,append=False):
+        """
+        Initializes `RejectFile`
+
+        :param location: Path to the reject MARC file
+        :param append: Boolean, append to existing reject files, used
+                       when a load resumes from a checkpoint
+        """
+        self.location = location
+        self.reasons_location = "{0}.txt".format(os.path.splitext(location)[0])
+        self.mode = append and 'ab' or 'wb'
+        self.marc_file = None
+        self.reasons_file = None
+        self.count = 0
+
+    def reject(self,raw_record,reason,number=None,offset=None):
+        """
+        Writes a rejected record and its reason
+
+        :param raw_record: Raw MARC record
+        :param reason: Reason the record was rejected
+        :param number: Optional position of the record in the MARC file
+        :param offset: Optional byte offset of the record in the MARC file
+        """
+        if self.marc_file is None:
+            self.marc_file = open(self.location,self.mode)
+            self.reasons_file = open(self.reasons_location,self.mode)
+        self.marc_file.write(raw_record)
+        self.reasons_file.write("{0}\t{1}\t{2}\n".format(number,offset,reason))
+        self.count += 1
+
+    def close(self):
+        if self.marc_file is not None:
+            self.marc_file.close()
+            self.reasons_file.close()
+            self.marc_file,self.reasons_file = None,None
+
+
+class Checkpoint(object):
+    """
+    :class:`Checkpoint` is a JSON file with the byte offset and the
+    stats of the last finished record of a load
+    """
+
+    def __init__(self,location,every=CHECKPOINT_EVERY):
+        """
+        Initializes `Checkpoint`, reads the saved checkpoint if it exists
+
+        :param location: Path to the checkpoint file
+        :param every: Number of records between saves, default is
+                      CHECKPOINT_EVERY
+        """
+        self.location = location
+        self.every = every
+        self.offset = 0
+        self.records = 0
+        self.stats = {}
+        if os.path.exists(location):
+            saved = json.load(open(location,'rb'))
+            self.offset = saved['offset']
+            self.records = saved['records']
+            self.stats = saved['stats']
+
+    def save(self,offset,records,stats):
+        """
+        Saves the checkpoint, written to a temporary file first so a
+        load stopped during the save keeps the previous checkpoint
+
+        :param offset: Byte offset after the last finished record
+        :param records: Number of finished records
+        :param stats: Dict of the load's counts
+        """
+        self.offset,self.records,self.stats = offset,records,stats
+        temp_location = "{0}.tmp".format(self.location)
+        temp_file = open(temp_location,'wb')
+        json.dump({'offset':offset,
+                   'records':records,
+                   'stats':stats},
+                  temp_file)
+        temp_file.close()
+        os.rename(temp_location,self.location)
+
+    def clear(self):
+        """
+        Removes the checkpoint when the load finishes
+        """
+        if os.path.exists(self.location):
+            os.remove(self.location)
+
+
+class RecordLoad(object):
+    """
+    :class:`RecordLoad` iterates the raw records of a MARC file from the
+    last checkpoint. The checkpoint is saved every checkpoint_every
+    records and when the load stops on an error, and removed when the
+    load finishes. Used as a context manager::
+
+        with RecordLoad(marc_file_location,...) as load:
+            for raw_record in load:
+                try:
+                    ...
+                except FATAL_ERRORS:
+                    raise
+                except Exception,e:
+                    load.reject(raw_record,e)
+    """
+
+    def __init__(self,
+                 marc_file_location,
+                 stats=None,
+                 reject_location=None,
+                 checkpoint_location=None,
+                 checkpoint_every=CHECKPOINT_EVERY):
+        """
+        Initializes `RecordLoad`
+
+        :param marc_file_location: Path to MARC file
+        :param stats: Optional dict of the load's starting counts, restored
+                      from the checkpoint when resuming
+        :param reject_location: Optional path to the reject MARC file
+        :param checkpoint_location: Optional path to the checkpoint file
+        :param checkpoint_every: Number of records between checkpoints
+        """
+        self.marc_file_location = marc_file_location
+        self.stats = dict(stats or {})
+        self.stats.setdefault('rejected',0)
+        self.offset = 0
+        self.records = 0
+        self.record_offset = None
+        self.checkpoint = None
+        if checkpoint_location is not None:
+            self.checkpoint = Checkpoint(checkpoint_location,checkpoint_every)
+            self.offset = self.checkpoint.offset
+            self.records = self.checkpoint.records
+            self.stats.update(self.checkpoint.stats)
+        self.rejects = None
+        if reject_location is not None:
+            self.rejects = RejectFile(reject_location,
+                                      append=self.offset > 0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self,exc_type,exc_value,traceback):
+        if self.rejects is not None:
+            self.rejects.close()
+        if self.checkpoint is not None:
+            if exc_type is None:
+                self.checkpoint.clear()
+            else:
+                self.save_checkpoint()
+        return False
+
+    def __iter__(self):
+        marc_file = open(self.marc_file_location,'rb')
+        try:
+            marc_file.seek(self.offset)
+            for raw_record in iter_raw_records(marc_file):
+                self.record_offset = self.offset
+                yield raw_record
+                # Only reached after the record is finished or rejected
+                self.offset += len(raw_record)
+                self.records += 1
+                if self.checkpoint is not None and\
+                   not self.records%self.checkpoint.every:
+                    self.save_checkpoint()
+        finally:
+            marc_file.close()
+
+    @property
+    def resumed(self):
+        """
+        True when the load started from a saved checkpoint
+        """
+        return self.checkpoint is not None and self.checkpoint.records > 0
+
+    def reject(self,raw_record,error):
+        """
+        Counts a rejected record and writes it to the reject file
+
+        :param raw_record: Raw MARC record
+        :param error: Exception raised by the record
+        """
+        self.stats['rejected'] += 1
+        if self.rejects is not None:
+            self.rejects.reject(raw_record,
+                                error_reason(error),
+                                self.records+1,
+                                self.record_offset)
+
+    def save_checkpoint(self):
+        self.checkpoint.save(self.offset,self.records,self.stats)
@@ -7,6 +7,14 @@ import json
 from django.test import TestCase
 from aristotle.settings import REDIS_TEST_DB
 from jobs.rdaCore_redis import *
+from metrics import IngestMetrics
+from marc_helpers import MARCModifier,IndexedRecord,RawRecord,iter_raw_records
+import cStringIO,tempfile,shutil,os
+from jobs.profiles import VendorProfile,get_profile,get_profile_info
+from recovery import RecordLoad,RejectFile,FATAL_ERRORS
+from marc_index import MARCIndex,build_index,open_index
+from jobs.lc_redis import LCSHAuthority,LCSHIngester,LRUCache,load_lcsh
+from aristotle.fixures import FixureLoader,get_cached
 
 
 test_ds = redis.StrictRedis(db=REDIS_TEST_DB)
@@ -75,6 +83,13 @@ class CreateRDACoreExpressionFromMARCTest(TestCase):
         # Test Expression.contentType in Redis to value in the 700 field
         self.assert_(test_ds.sismember(content_type_key,"Computer Program"))
 
+    def test_content_type_facet(self):
+        self.assertEquals(test_ds.zscore('facet:rdaCore:Expression:rdaContentType',
+                                         'Sound recording'),
+                          1.0)
+        self.assertEquals(test_ds.smembers('facet:rdaCore:Expression:rdaContentType:text'),
+                          set(['rdaCore:Expression:1']))
+
     def test__call_number_app__(self):
         pass
         
@@ -190,6 +205,25 @@ class CreateRDACoreManifestationFromMARCTest(TestCase):
                                        "rdaCarrierType"),
                           "videodisc")  
         
+    def test_facets(self):
+        self.assertEquals(test_ds.zrevrange('facet:rdaCore:Manifestation:rdaCarrierType',
+                                            0,
+                                            -1,
+                                            withscores=True),
+                          [('videodisc',1.0)])
+        self.assertEquals(sorted(test_ds.zrange('facet:rdaCore:Manifestation:rdaCopyrightDate',
+                                                0,
+                                                -1)),
+                          ['2010'])
+        self.assertEquals(test_ds.zscore('date-index:rdaCore:Manifestation',
+                                         self.manifestation_generator.entity_key),
+                          2010.0)
+        purge_entity(test_ds,self.manifestation_generator.entity_key)
+        self.assertEquals(test_ds.zcard('facet:rdaCore:Manifestation:rdaCarrierType'),
+                          0)
+        self.assertEquals(test_ds.zcard('date-index:rdaCore:Manifestation'),
+                          0)
+        self.assert_(not test_ds.exists('facet:rdaCore:Manifestation:rdaCarrierType:videodisc'))
         
 
     def test_copyright_date(self):
@@ -380,6 +414,482 @@ class CreateRDACoreWorkFromMARCTest(TestCase):
         test_ds.flushdb()
         
 
+class DeltaIngestTest(TestCase):
+
+    def setUp(self):
+        self.test_rec = pymarc.Record()
+        self.test_rec.add_field(pymarc.Field(tag='245',
+                                             indicators=["",""],
+                                             subfields=["a","Test Record Title"]))
+        self.test_rec.add_field(pymarc.Field(tag='907',
+                                             indicators=["",""],
+                                             subfields=["a",".b1234567x"]))
+        json_rule = json.loads('''{"rdaTestRule":{"245":{"subfields":["a"]}}}''')
+        self.entity_generator = CreateRDACoreEntityFromMARC(record=self.test_rec,
+                                                            redis_server=test_ds,
+                                                            root_redis_key="rdaCore",
+                                                            entity='Generic',
+                                                            entity_key='rdaCore:Generic:5',
+                                                            json_rules=json_rule)
+        self.entity_generator.generate()
+
+    def test_legacy_bib_number(self):
+        self.assertEquals(get_legacy_bib_number(self.test_rec),
+                          "b1234567")
+        self.assertEquals(get_legacy_bib_number(pymarc.Record()),
+                          None)
+
+    def test_record_digest(self):
+        digest = get_record_digest(self.test_rec)
+        self.assertEquals(digest,
+                          get_record_digest(self.test_rec))
+        self.test_rec.add_field(pymarc.Field(tag='500',
+                                             indicators=["",""],
+                                             subfields=["a","Changed note"]))
+        self.assertNotEquals(digest,
+                             get_record_digest(self.test_rec))
+
+    def test_existing_entity_key(self):
+        self.assertEquals(self.entity_generator.entity_key,
+                          "rdaCore:Generic:5")
+        self.assertEquals(test_ds.get("global:rdaCore:Generic"),
+                          None)
+        self.assertEquals(test_ds.hget("rdaCore:Generic:5","rdaTestRule"),
+                          "Test Record Title")
+
+    def test_purge_entity(self):
+        test_ds.sadd("rdaCore:Generic:5:rdaNote","First note")
+        test_ds.hset("rdaCore:Generic:5","rdaNote","rdaCore:Generic:5:rdaNote")
+        test_ds.hset("rdaCore:Generic:5:rdaTitle","label","Test Record Title")
+        purge_entity(test_ds,"rdaCore:Generic:5")
+        self.assertFalse(test_ds.exists("rdaCore:Generic:5"))
+        self.assertFalse(test_ds.exists("rdaCore:Generic:5:rdaNote"))
+        self.assertFalse(test_ds.exists("rdaCore:Generic:5:rdaTitle"))
+
+    def test_deleted_not_ingested(self):
+        self.test_rec.leader = self.test_rec.leader[:5]+'d'+self.test_rec.leader[6:]
+        self.assertEquals(delta_ingest_record(self.test_rec,test_ds),
+                          'skipped')
+        self.assertFalse(test_ds.sismember(DELETED_BIBS_KEY,'b1234567'))
+
+    def tearDown(self):
+        test_ds.flushdb()
+        
+
+class IngestMetricsTest(TestCase):
+
+    def setUp(self):
+        self.callbacks = []
+        self.metrics = IngestMetrics(callback=self.callbacks.append,
+                                     callback_every=2)
+        self.test_rec = pymarc.Record()
+        self.test_rec.add_field(pymarc.Field(tag='245',
+                                             indicators=["",""],
+                                             subfields=["a","Test Record Title"]))
+        json_rule = json.loads('''{"rdaTestRule":{"245":{"subfields":["a"]}}}''')
+        self.entity_generator = CreateRDACoreEntityFromMARC(record=self.test_rec,
+                                                            redis_server=test_ds,
+                                                            root_redis_key="rdaCore",
+                                                            entity='Generic',
+                                                            entity_key='rdaCore:Generic:5',
+                                                            json_rules=json_rule,
+                                                            metrics=self.metrics)
+
+    def test_stages(self):
+        self.entity_generator.generate()
+        self.assertEquals(self.metrics.stages['rules']['count'],1)
+        self.assertEquals(self.metrics.stages['redis']['count'],1)
+
+    def test_round_trips(self):
+        metered_ds = self.metrics.watch(test_ds)
+        metered_ds.set("metrics:test","1")
+        test_pipeline = metered_ds.pipeline()
+        test_pipeline.get("metrics:test")
+        test_pipeline.get("metrics:test")
+        test_pipeline.execute()
+        self.metrics.unwatch()
+        metered_ds.get("metrics:test")
+        self.assertEquals(self.metrics.round_trips,2)
+
+    def test_shared_client(self):
+        metered_ds = self.metrics.watch(test_ds)
+        other_metrics = IngestMetrics()
+        other_ds = other_metrics.watch(test_ds)
+        self.assertTrue(metered_ds.connection_pool is test_ds.connection_pool)
+        test_ds.set("metrics:test","1")
+        other_ds.get("metrics:test")
+        self.assertEquals(metered_ds.get("metrics:test"),"1")
+        other_metrics.unwatch()
+        self.assertFalse('execute_command' in vars(test_ds))
+        self.assertEquals(other_metrics.round_trips,1)
+        self.assertEquals(self.metrics.round_trips,1)
+
+    def test_summary(self):
+        for record in self.metrics.iterate([self.test_rec,self.test_rec]):
+            self.metrics.record_finished()
+        self.metrics.finish()
+        summary = json.loads(json.dumps(self.metrics.summary()))
+        self.assertEquals(summary['records'],2)
+        self.assertEquals(summary['stages']['parse']['count'],2)
+        self.assertTrue(summary['latency_ms']['p50'] <= summary['latency_ms']['p99'])
+        self.assertEquals(len(self.callbacks),2)
+
+    def tearDown(self):
+        self.metrics.unwatch()
+        test_ds.flushdb()
+
+
+class NoteModifier(MARCModifier):
+
+    def processRecord(self,marc_record):
+        marc_record.add_field(pymarc.Field(tag='500',
+                                           indicators=[' ',' '],
+                                           subfields=['a','Test note']))
+        return marc_record
+
+class ControlNumberModifier(MARCModifier):
+
+    def processRecord(self,marc_record):
+        marc_record['001'].data = marc_record['001'].value().upper()
+        return marc_record
+
+
+class IndexedRecordTest(TestCase):
+
+    def setUp(self):
+        marc_record = pymarc.Record()
+        for tag,value in [('245','Title'),('100','Author'),('650','Rivers'),
+                          ('110','Company'),('650','Mountains')]:
+            marc_record.add_field(pymarc.Field(tag=tag,
+                                               indicators=[' ',' '],
+                                               subfields=['a',value]))
+        self.indexed_record = IndexedRecord(marc_record)
+
+    def test_get_fields(self):
+        self.assertEquals([field['a'] for field in self.indexed_record.get_fields('650')],
+                          ['Rivers','Mountains'])
+        self.assertEquals([field['a'] for field in self.indexed_record.get_fields('110','100')],
+                          ['Author','Company'])
+        self.assertEquals(self.indexed_record['245']['a'],'Title')
+        self.assertEquals(self.indexed_record['500'],None)
+
+    def test_remove_field(self):
+        self.indexed_record.remove_field(self.indexed_record['650'])
+        self.assertEquals([field['a'] for field in self.indexed_record.fields],
+                          ['Title','Author','Company','Mountains'])
+        self.assertRaises(pymarc.FieldNotFound,
+                          self.indexed_record.remove_field,
+                          pymarc.Field(tag='500',indicators=[' ',' '],subfields=['a','Note']))
+        self.indexed_record.remove_tags('650','245')
+        self.assertEquals(self.indexed_record.get_fields('650'),[])
+
+    def test_sorted_record(self):
+        marc_record = self.indexed_record.sorted_record()
+        self.assertEquals([field['a'] for field in marc_record.fields],
+                          ['Author','Company','Title','Rivers','Mountains'])
+
+
+class RawRecordTest(TestCase):
+
+    def setUp(self):
+        marc_record = pymarc.Record()
+        marc_record.add_field(pymarc.Field(tag='001',data='ocm12345'))
+        for tag,value in [('245','Title'),('100','Author'),('650','Rivers')]:
+            marc_record.add_field(pymarc.Field(tag=tag,
+                                               indicators=[' ',' '],
+                                               subfields=['a',value]))
+        self.marc_record = marc_record
+        self.raw_record = RawRecord(marc_record.as_marc())
+
+    def test_as_marc(self):
+        self.assertEquals(self.raw_record.as_marc(),
+                          self.marc_record.as_marc())
+
+    def test_edit_control(self):
+        self.raw_record.leader = self.raw_record.leader[:5]+'c'+self.raw_record.leader[6:]
+        self.raw_record.edit_control('001',lambda data: data.upper())
+        self.assertEquals(self.raw_record.leader[5],'c')
+        self.assertEquals(self.raw_record['001'].data,'OCM12345')
+        self.raw_record.edit_control('001',lambda data: data[3:])
+        marc_record = self.raw_record.as_record()
+        self.assertEquals(marc_record['001'].data,'12345')
+        self.assertEquals(marc_record.leader[5],'c')
+
+    def test_fields(self):
+        self.raw_record['245'].add_subfield('h','[electronic resource]')
+        self.raw_record.remove_tags('650')
+        self.raw_record.add_field(pymarc.Field(tag='500',
+                                               indicators=[' ',' '],
+                                               subfields=['a','Note']))
+        self.raw_record.sort_fields()
+        marc_record = self.raw_record.as_record()
+        self.assertEquals([field.tag for field in marc_record.fields],
+                          ['001','100','245','500'])
+        self.assertEquals(marc_record['245']['h'],'[electronic resource]')
+
+
+class MARCModifierLoadTest(TestCase):
+
+    def setUp(self):
+        marc_file = cStringIO.StringIO()
+        for number in range(25):
+            record = pymarc.Record()
+            record.add_field(pymarc.Field(tag='245',
+                                          indicators=['0','0'],
+                                          subfields=['a','Title {0}'.format(number)]))
+            record.add_field(pymarc.Field(tag='009',data='local'))
+            record.add_field(pymarc.Field(tag='001',data='test{0}'.format(number)))
+            marc_file.write(record.as_marc())
+        self.marc_data = marc_file.getvalue()
+
+    def test_iter_raw_records(self):
+        raw_records = list(iter_raw_records(cStringIO.StringIO(self.marc_data)))
+        self.assertEquals(len(raw_records),25)
+        self.assertEquals(''.join(raw_records),self.marc_data)
+
+    def test_serial_load(self):
+        modifier = NoteModifier(cStringIO.StringIO(self.marc_data))
+        modifier.load()
+        self.assertEquals(modifier.stats['records'],25)
+        self.assertEquals([field.tag for field in modifier.records[0].fields],
+                          ['001','245','500'])
+
+    def test_parallel_load(self):
+        serial_modifier = NoteModifier(cStringIO.StringIO(self.marc_data))
+        serial_modifier.load()
+        parallel_modifier = NoteModifier(cStringIO.StringIO(self.marc_data))
+        parallel_modifier.load(processes=2,batch_size=4)
+        self.assertEquals(parallel_modifier.stats['records'],25)
+        self.assertEquals([record['001'].value() for record in parallel_modifier.records],
+                          ['test{0}'.format(number) for number in range(25)])
+        self.assertEquals(parallel_modifier.output(),
+                          serial_modifier.output())
+
+    def test_rejected_records(self):
+        record = pymarc.Record()
+        record.add_field(pymarc.Field(tag='245',
+                                      indicators=['0','0'],
+                                      subfields=['a','No control number']))
+        marc_data = self.marc_data+record.as_marc()+self.marc_data
+        reject_location = os.path.join(tempfile.mkdtemp(),'rejects.mrc')
+        for processes in [1,2]:
+            modifier = ControlNumberModifier(cStringIO.StringIO(marc_data))
+            reject_file = RejectFile(reject_location)
+            modifier.load(processes=processes,reject_file=reject_file)
+            reject_file.close()
+            self.assertEquals(modifier.stats,{'records':51,'rejected':1})
+            self.assertEquals(len(modifier.records),50)
+            self.assertEquals(modifier.rejects,
+                              [(26,"AttributeError: 'NoneType' object has no attribute 'value'")])
+            self.assertEquals(open(reject_location,'rb').read(),
+                              record.as_marc())
+            self.assertEquals(open(reject_file.reasons_location,'rb').read(),
+                              "26\t{0}\t{1}\n".format(len(self.marc_data),
+                                                      modifier.rejects[0][1]))
+        shutil.rmtree(os.path.dirname(reject_location))
+
+
+class RecordLoadTest(TestCase):
+
+    def setUp(self):
+        self.work_directory = tempfile.mkdtemp()
+        self.marc_location = os.path.join(self.work_directory,'load.mrc')
+        self.checkpoint_location = os.path.join(self.work_directory,'load.json')
+        self.reject_location = os.path.join(self.work_directory,'rejects.mrc')
+        marc_file = open(self.marc_location,'wb')
+        for number in range(10):
+            record = pymarc.Record()
+            record.add_field(pymarc.Field(tag='001',data='test{0}'.format(number)))
+            marc_file.write(record.as_marc())
+        marc_file.close()
+
+    def load(self,stop_at=None):
+        load = RecordLoad(self.marc_location,
+                          stats={'loaded':0},
+                          reject_location=self.reject_location,
+                          checkpoint_location=self.checkpoint_location,
+                          checkpoint_every=2)
+        control_numbers = []
+        with load:
+            for raw_record in load:
+                try:
+                    control_number = pymarc.Record(raw_record)['001'].value()
+                    if control_number == stop_at:
+                        raise redis.ConnectionError('Lost connection')
+                    if control_number == 'test3':
+                        raise ValueError('Bad record')
+                except FATAL_ERRORS:
+                    raise
+                except Exception,e:
+                    load.reject(raw_record,e)
+                    continue
+                control_numbers.append(control_number)
+                load.stats['loaded'] += 1
+        return load,control_numbers
+
+    def test_load(self):
+        load,control_numbers = self.load()
+        self.assertEquals(load.stats,{'loaded':9,'rejected':1})
+        self.assertEquals(len(control_numbers),9)
+        self.assertFalse(os.path.exists(self.checkpoint_location))
+        reason = open(load.rejects.reasons_location,'rb').read().split("\t")
+        self.assertEquals(reason[0],'4')
+        self.assertEquals(reason[2],'ValueError: Bad record\n')
+
+    def test_resume(self):
+        self.assertRaises(redis.ConnectionError,self.load,'test6')
+        self.assertTrue(os.path.exists(self.checkpoint_location))
+        load,control_numbers = self.load()
+        self.assertTrue(load.resumed)
+        self.assertEquals(control_numbers,
+                          ['test{0}'.format(number) for number in range(6,10)])
+        self.assertEquals(load.stats,{'loaded':9,'rejected':1})
+        self.assertEquals(load.records,10)
+
+    def test_resume_requires_incremental(self):
+        self.assertRaises(redis.ConnectionError,self.load,'test6')
+        self.assertRaises(ValueError,
+                          ingest_records,
+                          self.marc_location,
+                          test_ds,
+                          checkpoint_location=self.checkpoint_location)
+        self.assertTrue(os.path.exists(self.checkpoint_location))
+        self.assertEquals(test_ds.dbsize(),0)
+
+    def tearDown(self):
+        shutil.rmtree(self.work_directory)
+
+
+class MARCIndexTest(TestCase):
+
+    def setUp(self):
+        self.work_directory = tempfile.mkdtemp()
+        self.marc_location = os.path.join(self.work_directory,'export.mrc')
+        marc_file = open(self.marc_location,'wb')
+        for number in range(20):
+            record = pymarc.Record()
+            record.add_field(pymarc.Field(tag='001',data='ocm{0}'.format(number)))
+            record.add_field(pymarc.Field(tag='245',
+                                          indicators=['0','0'],
+                                          subfields=['a','Title {0}'.format(number)]))
+            record.add_field(pymarc.Field(tag='907',
+                                          indicators=[' ',' '],
+                                          subfields=['a','.b{0}x'.format(1000+number)]))
+            marc_file.write(record.as_marc())
+        marc_file.close()
+
+    def test_lookup(self):
+        marc_index = open_index(self.marc_location)
+        self.assertEquals(len(marc_index),40)
+        self.assertTrue('b1005' in marc_index)
+        self.assertFalse('b2000' in marc_index)
+        self.assertEquals(marc_index.get_record('b1013')['245']['a'],
+                          'Title 13')
+        self.assertEquals(marc_index.get_record('ocm7')['907']['a'],
+                          '.b1007x')
+        self.assertEquals(marc_index.get_record('ocm99'),None)
+        marc_index.close()
+
+    def test_stale_index(self):
+        build_index(self.marc_location)
+        marc_file = open(self.marc_location,'ab')
+        record = pymarc.Record()
+        record.add_field(pymarc.Field(tag='001',data='ocm20'))
+        marc_file.write(record.as_marc())
+        marc_file.close()
+        marc_index = MARCIndex(self.marc_location)
+        self.assertTrue(marc_index.is_stale())
+        marc_index.close()
+        marc_index = open_index(self.marc_location)
+        self.assertEquals(marc_index.get_record('ocm20')['001'].data,'ocm20')
+        marc_index.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.work_directory)
+
+
+class PassThroughHooks(object):
+
+    def validate001(self,marc_record):
+        return marc_record
+
+    def validate050s(self,marc_record):
+        return marc_record
+
+    def processSpringerURLs(self,marc_record):
+        return marc_record
+
+class VendorProfileTest(TestCase):
+
+    def setUp(self):
+        self.profile = VendorProfile('test',
+                                     {'leader':{'17':'3'},
+                                      'control':{'001':{'start':3,'lower':True}},
+                                      'remove':['007'],
+                                      'indicators':{'082':['0','4']},
+                                      'replace_subfields':{'856':['z','View electronic book']},
+                                      'insert':[{'tag':'007','data':'cr  n        a'},
+                                                {'tag':'506',
+                                                 'subfields':['a','Access restricted']}],
+                                      'insert_if_missing':[{'tag':'710',
+                                                            'indicators':['2',' '],
+                                                            'subfields':['a','Ebooks Corporation']}]})
+        self.marc_record = IndexedRecord()
+        self.marc_record.add_field(pymarc.Field(tag='001',data='EBL12345'))
+        self.marc_record.add_field(pymarc.Field(tag='007',data='cr cn'))
+        self.marc_record.add_field(pymarc.Field(tag='082',
+                                                indicators=['1','0'],
+                                                subfields=['a','813.54']))
+        self.marc_record.add_field(pymarc.Field(tag='856',
+                                                indicators=['4','0'],
+                                                subfields=['z','Click here','u','http://example.com']))
+
+    def test_apply(self):
+        marc_record = self.profile.apply(self.marc_record)
+        self.assertEquals(marc_record.leader[17],'3')
+        self.assertEquals(marc_record['001'].data,'12345')
+        self.assertEquals([field.data for field in marc_record.get_fields('007')],
+                          ['cr  n        a'])
+        self.assertEquals(marc_record['082'].indicators,['0','4'])
+        self.assertEquals(marc_record['856'].subfields,
+                          ['u','http://example.com','z','View electronic book'])
+        self.assertEquals(marc_record['710']['a'],'Ebooks Corporation')
+
+    def test_templates_cloned(self):
+        first_record = self.profile.apply(IndexedRecord())
+        second_record = self.profile.apply(IndexedRecord())
+        self.assertNotEquals(id(first_record['506']),id(second_record['506']))
+        first_record['506'].add_subfield('b','Changed')
+        self.assertEquals(second_record['506'].subfields,['a','Access restricted'])
+
+    def test_extends(self):
+        profile_info = get_profile_info('ybp_ebrary')
+        self.assertEquals(profile_info['leader'],
+                          get_profile_info('ybp_ebl')['leader'])
+        self.assertEquals(len(profile_info['notes']),6)
+        self.assertEquals(get_profile('ybp_ebrary'),get_profile('ybp_ebrary'))
+
+    def test_ybp_control_fields_unchanged(self):
+        field008 = '120101s2012    nyuo    o     000 0 eng d'
+        for name in ['ybp_ebl','ybp_ebrary']:
+            marc_record = IndexedRecord()
+            marc_record.add_field(pymarc.Field(tag='001',data='EBL12345'))
+            marc_record.add_field(pymarc.Field(tag='008',data=field008))
+            marc_record = get_profile(name).apply(marc_record,
+                                                  PassThroughHooks())
+            self.assertEquals(marc_record['001'].data,'EBL12345')
+            self.assertEquals(marc_record['008'].data,field008)
+
+    def test_springer_first_006(self):
+        marc_record = IndexedRecord()
+        marc_record.add_field(pymarc.Field(tag='006',data='a'))
+        marc_record.add_field(pymarc.Field(tag='006',data='b'))
+        marc_record = get_profile('springer').apply(marc_record,
+                                                    PassThroughHooks())
+        self.assertEquals([field.data for field in marc_record.get_fields('006')],
+                          ['b','m        d        '])
+
+
 class MARCRulesTest(TestCase):
 
     def setUp(self):
@@ -462,3 +972,127 @@ class MARCRulesTest(TestCase):
         
     def tearDown(self):
         test_ds.flushdb()
+
+
+class LCSHAuthorityTest(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        dump_location = os.path.join(self.temp_dir,'lcsh.nt')
+        dump_file = open(dump_location,'wb')
+        dump_file.write('''<http://id.loc.gov/authorities/subjects/sh85061212> <http://www.loc.gov/mads/rdf/v1#authoritativeLabel> "Indians of North America--History"@en .
+<http://id.loc.gov/authorities/subjects/sh85061212> <http://www.loc.gov/mads/rdf/v1#variantLabel> "American Indians--History"@en .
+<http://id.loc.gov/authorities/subjects/sh85039342> <http://www.w3.org/2004/02/skos/core#prefLabel> "Colorado" .
+<http://id.loc.gov/authorities/subjects/sh85039342> <http://www.w3.org/1999/02/22-rdf-syntax-ns#type> <http://www.loc.gov/mads/rdf/v1#Geographic> .
+<http://id.loc.gov/authorities/subjects/sh85010004> <http://www.loc.gov/mads/rdf/v1#authoritativeLabel> "B\\u00E9la Bart\\u00F3k" .
+''')
+        dump_file.close()
+        self.stats = load_lcsh(dump_location,redis_server=test_ds,batch_size=2)
+        self.authority = LCSHAuthority(redis_server=test_ds,cache_size=2)
+
+    def test_load_lcsh(self):
+        self.assertEquals(self.stats,
+                          {'authorities':3,'variants':1,'geographic':1})
+        self.assertEquals(test_ds.hget('lcsh-uri-hash',
+                                       'http://id.loc.gov/authorities/subjects/sh85010004'),
+                          u'B\u00e9la Bart\u00f3k'.encode('utf8'))
+
+    def test_lookup(self):
+        self.assertEquals(self.authority.lookup('Indians of North America -- History.'),
+                          'http://id.loc.gov/authorities/subjects/sh85061212')
+        self.assertEquals(self.authority.lookup('american indians--history'),
+                          'http://id.loc.gov/authorities/subjects/sh85061212')
+        self.assertEquals(self.authority.lookup('Bela Bartok'),
+                          'http://id.loc.gov/authorities/subjects/sh85010004')
+        self.assertEquals(self.authority.lookup('Atlantis'),
+                          None)
+        self.assertEquals(len(self.authority.cache),2)
+
+    def test_lru_cache(self):
+        cache = LRUCache(2)
+        cache.set('a',1)
+        cache.set('b',2)
+        cache.get('a')
+        cache.set('c',3)
+        self.assert_('a' in cache)
+        self.assert_(not 'b' in cache)
+
+    def test_ingester(self):
+        marc_record = pymarc.Record()
+        marc_record.add_field(pymarc.Field(tag='650',
+                                           indicators=[' ','0'],
+                                           subfields=['a','Indians of North America',
+                                                      'z','Colorado.']))
+        marc_record.add_field(pymarc.Field(tag='650',
+                                           indicators=[' ','7'],
+                                           subfields=['a','Bela Bartok']))
+        ingester = LCSHIngester(record=marc_record,redis_server=test_ds)
+        self.assertEquals(ingester.topical,
+                          {'Indians of North America':None})
+        self.assertEquals(ingester.geographic,
+                          {'Colorado.':'http://id.loc.gov/authorities/subjects/sh85039342'})
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+        test_ds.flushdb()
+
+
+class FixureLoaderTest(TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.temp_dir,'cache')
+        self.location = os.path.join(self.temp_dir,'test-help.rst')
+        rst_file = open(self.location,'wb')
+        rst_file.write('Help')
+        rst_file.close()
+        self.rendered = []
+        self.loader = FixureLoader(self.temp_dir,
+                                   '.rst',
+                                   self.get_help)
+
+    def get_help(self,filename,fixures_dir):
+        return get_cached(filename,fixures_dir,self.render,self.cache_dir)
+
+    def render(self,raw_contents):
+        if raw_contents == 'Error':
+            raise ValueError("Can't render")
+        self.rendered.append(raw_contents)
+        return u'<p>{0}</p>'.format(raw_contents)
+
+    def test_cache_miss(self):
+        self.assertEquals(self.loader['test-help'],u'<p>Help</p>')
+        self.assertEquals(self.loader['test-help'],u'<p>Help</p>')
+        self.assertEquals(self.rendered,['Help'])
+        # A new process reads the rendered HTML from the disk cache
+        new_loader = FixureLoader(self.temp_dir,'.rst',self.get_help)
+        self.assertEquals(new_loader['test-help'],u'<p>Help</p>')
+        self.assertEquals(self.rendered,['Help'])
+
+    def test_changed_source(self):
+        self.assertEquals(self.loader['test-help'],u'<p>Help</p>')
+        rst_file = open(self.location,'wb')
+        rst_file.write('Changed')
+        rst_file.close()
+        modified = os.path.getmtime(self.location)+10
+        os.utime(self.location,(modified,modified))
+        self.assertEquals(self.loader['test-help'],u'<p>Changed</p>')
+        self.assertEquals(self.rendered,['Help','Changed'])
+        self.assertEquals(len(os.listdir(self.cache_dir)),1)
+
+    def test_render_error(self):
+        rst_file = open(self.location,'wb')
+        rst_file.write('Error')
+        rst_file.close()
+        self.assertRaises(ValueError,self.loader.__getitem__,'test-help')
+        self.assert_(not self.loader.loaded.has_key('test-help'))
+        self.assertEquals(os.listdir(self.cache_dir),[])
+
+    def test_shared_cache_dir(self):
+        os.makedirs(self.cache_dir)
+        os.chmod(self.cache_dir,0777)
+        self.assertEquals(self.loader['test-help'],u'<p>Help</p>')
+        self.assertEquals(os.listdir(self.cache_dir),[])
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
@@ -10,9 +10,9 @@ from django.core.files.base import ContentFile
 from django.core.servers.basehttp import FileWrapper
 from django.http import Http404,HttpResponse,HttpResponseRedirect
 from aristotle.settings import INSTITUTION
-from app_settings import APP
+from app_settings import APP,LOAD_PROCESSES
 from marc_batch.fixures import help_loader
-from models import Job,JobLog,ILSJobLog,job_types
+from models import Job,JobLog,ILSJobLog,JobLogNotes,job_types
 from forms import *
 import jobs.ils
 import marc_helpers
@@ -88,14 +88,20 @@ def ils_job_manager(request,job):
         original_marc = request.FILES['raw_marc_record']
         job_query = Job.objects.get(pk=job_pk)
         params = {}
-        ils_job_class = getattr(jobs.ils,'%s' % job_query.python_module)
+        ils_job_class = jobs.ils.get_job_class(job_query.python_module)
         ils_job = ils_job_class(original_marc)
-        ils_job.load()
+        ils_job.load(processes=LOAD_PROCESSES)
         ils_log_entry = ILSJobLog(job=job_query,
                                   description=ils_job_form.cleaned_data['notes'],
                                   original_marc=original_marc,
                                   record_type=ils_job_form.cleaned_data['record_type'])
         ils_log_entry.save()
+        # Records that raised an error during the load are skipped and
+        # noted on the job log
+        for number,reason in ils_job.rejects:
+            JobLogNotes(job=ils_log_entry,
+                        label='Rejected record {0}'.format(number),
+                        note_value=reason).save()
         ils_marc_output = ils_job.output()
         ils_log_entry.modified_marc.save('job-%s-%s-modified.mrc' % (job_query.name,
                                                                      ils_log_entry.created_on.strftime("%Y-%m-%d")),
@@ -4,15 +4,15 @@
 __author__ = 'Jeremy Nelson'
 import re,redis,pymarc
 import datetime,sys
-from app_settings import REDIS_HOST,REDIS_PORT,REDIS_PASSWORD
+from aristotle.lib.datastores import get_datastore
+from marc_batch.metrics import IngestMetrics,NULL_METRICS
+from marc_batch.recovery import RecordLoad,FATAL_ERRORS
 
-redis_server = redis.StrictRedis(host=REDIS_HOST,
-                                 port=REDIS_PORT,
-                                 password=REDIS_PASSWORD)
+redis_server = get_datastore('productivity')
 PCARD_RE = re.compile(r"^Inv#\sPCARD\s(?P<number>\d+\w+)\sDated:(?P<date>\d+-\d+-\d+)\sAmt:\$(?P<amount>\d+[,|.]*\d*)\sOn:(?P<paid>\d+-\d+-\d+)\sVoucher#(?P<voucher>\d+)")
 INVOICE_RE = re.compile(r"^Inv#\s(?P<number>\d+\w+)\sDated:(?P<date>\d+-\d+-\d+)\sAmt:\$(?P<amount>\d+[,|.]*\d*)\sOn:(?P<paid>\d+-\d+-\d+)\sVoucher#(?P<voucher>\d+)$")
 
-def get_or_add_voucher(voucher_name):
+def get_or_add_voucher(voucher_name,redis_server=redis_server):
     voucher_key = redis_server.hget('invoice:vouchers',
                                     voucher_name)
     if voucher_key is None:
@@ -25,7 +25,7 @@ def get_or_add_voucher(voucher_name):
                           voucher_name)
     return voucher_key
 
-def add_transaction(regex_result,bib_number,parent_key):
+def add_transaction(regex_result,bib_number,parent_key,redis_server=redis_server):
     """
     Function adds a transaction to the datastore
 
@@ -33,6 +33,7 @@ def add_transaction(regex_result,bib_number,parent_key):
                          expression on the 994 field
     :param bib_number: Bibliographic ID Number
     :param parent_key: Parent Redis key
+    :param redis_server: Redis datastore, default is productivity
     :rtype string: New redis key for the transaction
     """ 
     # Creates a transaction to associate with invoice
@@ -185,11 +186,12 @@ def get_voucher(voucher_key):
     output['transactions'] = transactions
     return output
 
-def ingest_invoice(marc_record):
+def ingest_invoice(marc_record,redis_server=redis_server):
     """
     Function ingests a III Order MARC Record Invoice into Redis datastore.
 
     :param marc_record: MARC record
+    :param redis_server: Redis datastore, default is productivity
     :rtype: dictionary
     """
     if marc_record['035']:
@@ -223,17 +225,20 @@ def ingest_invoice(marc_record):
         # Adds transaction and adds to invoice
         transaction_key = add_transaction(invoice_result,
                                           bib_number,
-                                          invoice_key)
+                                          invoice_key,
+                                          redis_server)
         redis_server.hset(transaction_key,'invoice',invoice_key)
         # Checks exists or adds voucher
-        voucher_key = get_or_add_voucher(invoice_result.get('voucher'))
+        voucher_key = get_or_add_voucher(invoice_result.get('voucher'),
+                                         redis_server)
         redis_server.hset(transaction_key,'voucher',voucher_key)
 
-def ingest_pcard(marc_record):
+def ingest_pcard(marc_record,redis_server=redis_server):
     """
     Function ingests a III Order MARC Record Invoice into Redis datastore.
 
     :param marc_record: MARC record
+    :param redis_server: Redis datastore, default is productivity
     :rtype: dictionary
     """
     if marc_record['035']:
@@ -253,40 +258,77 @@ def ingest_pcard(marc_record):
         # Adds transaction and adds to invoice
         transaction_key = add_transaction(pcard_result,
                                           bib_number,
-                                          pcard_key)
+                                          pcard_key,
+                                          redis_server)
         redis_server.hset(transaction_key,'pcard',pcard_key)
         # Checks exists or adds voucher
-        voucher_key = get_or_add_voucher(pcard_result.get('voucher'))
+        voucher_key = get_or_add_voucher(pcard_result.get('voucher'),
+                                         redis_server)
         redis_server.hset(transaction_key,'voucher',voucher_key)
 
-def load_order_records(pathname):
+def load_order_records(pathname,
+                       metrics=None,
+                       job_log=None,
+                       reject_location=None,
+                       checkpoint_location=None):
     """
     Function takes a path to a MARC file location, creates an iterator,
-    and attempts to ingest invoice or pcard from each record
+    and attempts to ingest invoice or pcard from each record. A record
+    that raises an error is rejected and the load continues.
 
     :param pathname: Path to MARC file
+    :param metrics: Optional :class:`marc_batch.metrics.IngestMetrics`,
+                    created if job_log is given
+    :param job_log: Optional job log with a metrics field, the JSON
+                    summary of the metrics is saved to the job log
+    :param reject_location: Optional path to the reject MARC file
+    :param checkpoint_location: Optional path to the checkpoint file, a
+                                stopped load resumes from the checkpoint
+    :rtype dict: Counts of pcard, invoice, and rejected records
     """
-    marc_reader = pymarc.MARCReader(open(pathname),
-                                    utf8_handling='ignore')
-    for counter,record in enumerate(marc_reader):
-        if counter%1000:
-            sys.stderr.write(".")
+    if metrics is None:
+        if job_log is None:
+            metrics = NULL_METRICS
         else:
-            sys.stderr.write("%s" % counter)
-        if record['995']:
-            field995a = record['995']['a']
-            if PCARD_RE.search(field995a):
-                ingest_pcard(record)
-            elif INVOICE_RE.search(field995a):
-                ingest_invoice(record)
-        
-                          
-            
-            
-        
-        
-
-    
-                             
-    
-    
+            metrics = IngestMetrics()
+    load = RecordLoad(pathname,
+                      stats={'pcard':0,'invoice':0},
+                      reject_location=reject_location,
+                      checkpoint_location=checkpoint_location)
+    # The load's commands go through its own client so the metrics only
+    # count them
+    job_server = metrics.watch(redis_server)
+    try:
+        with load:
+            for raw_record in metrics.iterate(load,'read'):
+                counter = load.records
+                if counter%1000:
+                    sys.stderr.write(".")
+                else:
+                    sys.stderr.write("%s" % counter)
+                try:
+                    with metrics.stage('parse'):
+                        record = pymarc.Record(raw_record,
+                                               utf8_handling='ignore')
+                    if record['995']:
+                        field995a = record['995']['a']
+                        if PCARD_RE.search(field995a):
+                            with metrics.stage('pcard'):
+                                ingest_pcard(record,job_server)
+                            load.stats['pcard'] += 1
+                        elif INVOICE_RE.search(field995a):
+                            with metrics.stage('invoice'):
+                                ingest_invoice(record,job_server)
+                            load.stats['invoice'] += 1
+                except FATAL_ERRORS:
+                    raise
+                except Exception,e:
+                    load.reject(raw_record,e)
+                    continue
+                metrics.record_finished()
+    finally:
+        metrics.unwatch()
+    metrics.finish()
+    if job_log is not None:
+        metrics.save(job_log)
+    return load.stats
@@ -0,0 +1,83 @@
+"""
+ :mod:`app_registry` Registry of the APP settings of the installed apps
+ for the Portfolio App. The settings are loaded once and split into the
+ public and productivity apps, so the portfolio page renders without
+ loading each app's settings on every request.
+"""
+__author__ = 'Jeremy Nelson'
+
+import os
+from django.utils.importlib import import_module
+from aristotle.settings import DEBUG,INSTALLED_APPS
+
+
+class AppRegistry(object):
+    """
+    :class:`AppRegistry` holds the APP settings of the installed apps.
+    With check_mtimes, the default when DEBUG, the registry is loaded
+    again when an app_settings.py file changes.
+    """
+
+    def __init__(self,installed_apps=INSTALLED_APPS,check_mtimes=DEBUG):
+        """
+        Initializes `AppRegistry`
+
+        :param installed_apps: List of installed apps, django and the
+                               portfolio apps are skipped
+        :param check_mtimes: Boolean, check app_settings.py modified times
+                             on every lookup
+        """
+        self.installed_apps = [app for app in installed_apps
+                               if not app.startswith('django') and not app == 'portfolio']
+        self.check_mtimes = check_mtimes
+        self.all_apps = None
+        self.public_apps = None
+        self.modules = dict()
+        self.mtimes = dict()
+
+    def __settings_file__(self,app):
+        return "{0}.py".format(os.path.splitext(self.modules[app].__file__)[0])
+
+    def is_stale(self):
+        """
+        Checks if any app_settings.py changed since the registry loaded
+        """
+        for app,mtime in self.mtimes.iteritems():
+            if os.path.getmtime(self.__settings_file__(app)) != mtime:
+                return True
+        return False
+
+    def load(self):
+        """
+        Loads the APP settings of each installed app, the app_settings
+        modules are imported once and only reloaded when they change
+        """
+        all_apps,public_apps = [],[]
+        for app in self.installed_apps:
+            if self.modules.has_key(app):
+                app_settings = reload(self.modules[app])
+            else:
+                app_settings = import_module("{0}.app_settings".format(app))
+            self.modules[app] = app_settings
+            if self.check_mtimes:
+                self.mtimes[app] = os.path.getmtime(self.__settings_file__(app))
+            app_info = app_settings.APP
+            all_apps.append(app_info)
+            if not app_info.get('productivity',app_info.get('is_productivity',False)):
+                public_apps.append(app_info)
+        self.all_apps,self.public_apps = all_apps,public_apps
+
+    def get_apps(self,is_authenticated):
+        """
+        Returns the list of app information, productivity apps are only
+        included for authenticated users
+
+        :param is_authenticated: Boolean for user access to productivity apps
+        """
+        if self.all_apps is None or (self.check_mtimes and self.is_stale()):
+            self.load()
+        if is_authenticated is True:
+            return self.all_apps
+        return self.public_apps
+
+app_registry = AppRegistry()
@@ -14,3 +14,23 @@ class SimpleTest(TestCase):
         Tests that 1 + 1 always equals 2.
         """
         self.assertEqual(1 + 1, 2)
+
+
+class AppRegistryTest(TestCase):
+
+    def setUp(self):
+        from app_registry import AppRegistry
+        self.registry = AppRegistry(['django.contrib.auth',
+                                     'hours',
+                                     'orders',
+                                     'portfolio'],
+                                    check_mtimes=True)
+
+    def test_get_apps(self):
+        public_apps = self.registry.get_apps(False)
+        self.assertEquals([app['url'] for app in public_apps],
+                          ['hours/'])
+        self.assertEquals([app['url'] for app in self.registry.get_apps(True)],
+                          ['hours/','orders/'])
+        self.assertTrue(self.registry.get_apps(False) is public_apps)
+        self.assertFalse(self.registry.is_stale())
@@ -3,35 +3,23 @@
 """
 __author__ = 'Jeremy Nelson'
 
-import imp,os
+import os
 from django.views.generic.simple import direct_to_template
 import django.utils.simplejson as json
 from aristotle.settings import PROJECT_HOME,PROJECT_ROOT,INSTITUTION,INSTALLED_APPS
 from app_settings import APP
+from app_registry import app_registry
 
 
 
 def get_apps(is_authenticated):
     """
     Helper function returns a list of app information, extracted
-    from all apps in installed apps.
+    from all apps in installed apps by the app registry.
 
     :param is_authenticated: Boolean for user access to productivity apps
     """
-    output = []
-    for row in INSTALLED_APPS:
-        if not row.startswith('django') and not row == 'portfolio':
-            settings_file = os.path.join(PROJECT_HOME,
-                                         row,
-                                         "app_settings.py")
-            app_settings = imp.load_source(row,settings_file)
-            app_info = app_settings.APP
-            if app_info.get('is_productivity'):
-                if is_authenticated is True:
-                    output.append(app_info)
-            else:
-                output.append(app_info)
-    return output
+    return app_registry.get_apps(is_authenticated)
             
         
 
@@ -1,13 +1,10 @@
-import redis
-try:
-    import aristotle.settings as settings
-    REDIS_SERVER = TITLE_REDIS
+from aristotle.lib.datastores import get_datastore,get_read_datastore
 
-except:
-    # Setup for non-Django local development
-    REDIS_SERVER = redis.StrictRedis(host='127.0.0.1',
-                                     port=6384)
-    
+REDIS_SERVER = get_datastore('title')
+# Seconds a replica may lag before typeahead searches go to the title
+# datastore
+MAX_REPLICA_LAG = 300
+READ_REDIS_SERVER = get_read_datastore('title',MAX_REPLICA_LAG)
 
 APP = {'current_view': {'title':'Title Search'},
        'description': 'The Title Search App provides a typeahead Title search and a browe nearby titles',
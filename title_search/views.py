@@ -3,7 +3,7 @@
 """
 __author__ = "Jeremy Nelson"
 
-from app_settings import APP,REDIS_SERVER
+from app_settings import APP,READ_REDIS_SERVER
 from django.views.generic.simple import direct_to_template
 from django.http import HttpResponse
 from django.template import Context,Template,loader
@@ -11,7 +11,7 @@ import aristotle.settings as settings
 import json,sys,logging
 import search_helpers
 
-redis_server = REDIS_SERVER
+redis_server = READ_REDIS_SERVER
 
 def app(request):
     """